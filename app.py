@@ -1,24 +1,73 @@
 import argparse
+import json
 import os
-import signal
 import sys
 import time
+from dataclasses import asdict
+from typing import TYPE_CHECKING
 
-from flatpanel import FlatPanelConfig
-from flightpatch import FlightPatchComposer, Callsign, SelCalCode
-from windowstheme import Theme, WindowsThemeInterface
+from schema import ConfigError
+from tracing import enableTracing, span
+
+if TYPE_CHECKING:
+    from flatpanel import FlatPanelConfig
+    from flightpatch import FlightPatch
+    from themejournal import ThemeJournal
+    from windowstheme import Theme, WindowsThemeInterface
+
+# Everything else is imported by the commands that need it, so e.g. --restore never loads PIL or the
+# config schema and --render-batch never loads winreg/ctypes. benchmarks/startup.py times the commands.
 
 
 class App:
 
     def __init__(self):
         self.ORIGINAL_THEME_PATH = '.tmp/original_theme.json'
-        self.PANEL_BACKGROUND_PATH = '.tmp/panel_background.png'
+        self.PANEL_BACKGROUND_PATH = '.tmp/panel_background'
+        self.THEME_JOURNAL_PATH = '.tmp/theme_journal.log'
+        self.INSTANCE_LOCK_PATH = '.tmp/instance.lock'
 
-        self.themeInterface = WindowsThemeInterface()
+        self.__themeInterface = None
         self.flightPatchComposer = None
+        self.composerBackground = None
+        self.panelFrame = None
+        self.displayRenderer = None
+        self.renderCache = None
+        self.outputFormat = None
+        self.fleetSelCalIndex = None
+        self.targetResolution = None
+        self.liveFields = None
+        self.patchOverrides = {}
+        self.controlPort = None
+        self.instanceLock = None
+        self.__themeJournal = None
+
+    @property
+    def themeInterface(self) -> 'WindowsThemeInterface':
+        if self.__themeInterface is None:
+            from windowstheme import WindowsThemeInterface
+            backend = None
+            if os.environ.get('FLAT_PANEL_DRY_RUN'):
+                # Themes only go to an in-memory registry, e.g. while benchmarks/startup.py runs the commands
+                from windowstheme import InMemoryThemeBackend
+                backend = InMemoryThemeBackend()
+            self.__themeInterface = WindowsThemeInterface(backend=backend)
+        return self.__themeInterface
+
+    @themeInterface.setter
+    def themeInterface(self, themeInterface: 'WindowsThemeInterface'):
+        self.__themeInterface = themeInterface
+
+    @property
+    def themeJournal(self) -> 'ThemeJournal':
+        if self.__themeJournal is None:
+            from themejournal import ThemeJournal
+            self.__themeJournal = ThemeJournal(self.THEME_JOURNAL_PATH)
+        return self.__themeJournal
 
     def parseArgs(self):
+        from encoders import OutputFormat
+
         argparser = argparse.ArgumentParser(
             prog='msfs-flat-panel',
             description='Sets up your monitor for a flat panel flight sim.'
@@ -27,9 +76,22 @@ class App:
         argparser.add_argument(
             '-l',
             '--load',
-            help="Loads a flat panel simulator from a .json config file.",
+            help="Loads a flat panel simulator from a .json config file "
+                 "or by ICAO type designator, aircraft type or manufacturer from the config library.",
             metavar='CONFIG')
 
+        argparser.add_argument(
+            '--list',
+            help="Lists the configs in the config library.",
+            action="store_true"
+        )
+
+        argparser.add_argument(
+            '--configs',
+            help="Directory of the config library.",
+            default='configs',
+            metavar='DIRECTORY')
+
         argparser.add_argument(
             '-r',
             '--restore',
@@ -37,30 +99,312 @@ class App:
             action="store_true"
         )
 
+        argparser.add_argument(
+            '--list-snapshots',
+            help="Lists the Windows themes recorded before a flat panel was loaded.",
+            action="store_true"
+        )
+
+        argparser.add_argument(
+            '--restore-snapshot',
+            help="Restores the Windows theme of an earlier snapshot, see --list-snapshots.",
+            type=int,
+            metavar='ID')
+
+        argparser.add_argument(
+            '--compact-journal',
+            help="Drops all but the newest KEEP theme snapshots (default 10).",
+            type=int,
+            nargs='?',
+            const=10,
+            metavar='KEEP')
+
+        argparser.add_argument(
+            '--render-batch',
+            help="Renders one panel background per row of a .csv or .jsonl file "
+                 "with registration, callsign and selcal columns, without touching the Windows theme.",
+            nargs=2,
+            metavar=('CONFIG', 'ROWS'))
+
+        argparser.add_argument(
+            '--output',
+            help="Output directory for --render-batch.",
+            default='.tmp/batch',
+            metavar='DIRECTORY')
+
+        argparser.add_argument(
+            '--workers',
+            help="Number of worker processes for --render-batch.",
+            type=int,
+            metavar='N')
+
+        argparser.add_argument(
+            '--fleet',
+            help="A .csv or .jsonl file with the registration, callsign and selcal of every aircraft in the fleet. "
+                 "SelCal codes assigned there are flagged and avoided when allocating new ones.",
+            metavar='ROWS')
+
+        argparser.add_argument(
+            '--validate-fleet',
+            help="Validates all callsigns and SelCal codes of a fleet file and reports duplicate SelCal codes.",
+            metavar='ROWS')
+
+        argparser.add_argument(
+            '--allocate-selcal',
+            help="Prints N SelCal codes not assigned in --fleet, preferring letters the fleet uses least.",
+            type=int,
+            metavar='N')
+
+        argparser.add_argument(
+            '--output-format',
+            help="Encoder for the generated panel background, overriding the config. "
+                 "Auto picks a fast PNG for small and an uncompressed BMP for large images.",
+            choices=[outputFormat.name for outputFormat in OutputFormat])
+
+        argparser.add_argument(
+            '--suggest-theme',
+            help="Prints the dominant colors of a config's background and accent colors matching them. Requires NumPy.",
+            metavar='CONFIG')
+
+        argparser.add_argument(
+            '--resolution',
+            help="Resolution of the display, e.g. 2560x1440. Larger backgrounds are scaled down once "
+                 "and the flight patch is mapped onto the scaled size.",
+            metavar='WIDTHxHEIGHT')
+
+        argparser.add_argument(
+            '--control-port',
+            help="Local port of the control API of a loaded panel (default 8737), 0 disables it. "
+                 "Requests need the token the panel writes to .tmp/instance.json.",
+            type=int,
+            default=8737,
+            metavar='PORT')
+
+        argparser.add_argument(
+            '--no-cache',
+            help="Always renders the panel background instead of reusing a cached one.",
+            action="store_true"
+        )
+
+        argparser.add_argument(
+            '--trace',
+            help="Prints wall time, CPU time and how much each stage raised the peak memory on exit. "
+                 "With a PATH, also writes a Chrome trace event file there.",
+            nargs='?',
+            const='',
+            metavar='PATH')
+
         return argparser.parse_args()
 
     def run(self):
         args = self.parseArgs()
 
-        if args.restore:
-            self.restoreOriginalTheme()
+        tracer = None
+        if args.trace is not None:
+            tracer = enableTracing()
+
+        try:
+            self.runCommand(args)
+        finally:
+            if tracer is not None:
+                print('\n'.join(tracer.summary()))
+                if args.trace:
+                    tracer.writeChromeTrace(args.trace)
+                    print(f'Trace written to {args.trace}')
+
+    def runCommand(self, args):
 
-        elif args.load:
-            self.runConfig(args.load)
+        if args.output_format:
+            from encoders import OutputFormat
+            self.outputFormat = OutputFormat[args.output_format]
 
-    def restoreOriginalTheme(self):
-        theme = Theme.fromFile(self.ORIGINAL_THEME_PATH)
-        WindowsThemeInterface().loadTheme(theme)
+        self.controlPort = args.control_port or None
+
+        if args.resolution:
+            from scaling import parseResolution
+            try:
+                self.targetResolution = parseResolution(args.resolution)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                sys.exit(2)
+
+        if args.fleet:
+            self.loadFleet(args.fleet)
+
+        try:
+            if args.restore:
+                if not self.handOffToLoadedPanel('/restore', {}):
+                    self.restoreOriginalTheme()
+
+            elif args.restore_snapshot is not None:
+                self.restoreOriginalTheme(args.restore_snapshot)
+
+            elif args.list_snapshots:
+                self.listSnapshots()
+
+            elif args.compact_journal is not None:
+                dropped = self.themeJournal.compact(args.compact_journal)
+                print(f'Dropped {dropped} theme snapshots')
+
+            elif args.list:
+                self.listConfigs(args.configs)
+
+            elif args.suggest_theme:
+                self.suggestTheme(self.resolveConfig(args.suggest_theme, args.configs))
+
+            elif args.validate_fleet:
+                self.validateFleet(args.validate_fleet)
+
+            elif args.allocate_selcal:
+                self.allocateSelCalCodes(args.allocate_selcal)
+
+            elif args.render_batch:
+                configFile = self.resolveConfig(args.render_batch[0], args.configs)
+                self.renderBatch(configFile, args.render_batch[1], args.output, args.workers)
+
+            elif args.load:
+                configFile = self.resolveConfig(args.load, args.configs)
+                if not self.handOffToLoadedPanel('/load', {'config': os.path.abspath(configFile)}):
+                    if not args.no_cache:
+                        from rendercache import RenderCache
+                        self.renderCache = RenderCache()
+                    self.runConfig(configFile)
+
+        except ConfigError as e:
+            print(f'Invalid config:\n{e}', file=sys.stderr)
+            sys.exit(1)
+        finally:
+            if self.instanceLock is not None:
+                self.instanceLock.release()
+
+    def handOffToLoadedPanel(self, path: str, body: dict) -> bool:
+        # Returns False if no other process has a flat panel loaded, this one holds the instance lock then.
+        # Otherwise that process gets the request and this one is done within milliseconds, the theme it
+        # already changed is never mistaken for the original.
+        from singleinstance import InstanceError, InstanceLock, handOff
+
+        instanceLock = InstanceLock(self.INSTANCE_LOCK_PATH)
+        if instanceLock.acquire():
+            self.instanceLock = instanceLock
+            return False
+
+        try:
+            with span('hand off'):
+                answer = handOff(instanceLock, path, body)
+        except InstanceError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+        if answer is None:
+            # The loaded panel ended while waiting for it
+            self.instanceLock = instanceLock
+            return False
+
+        if 'loading' in answer:
+            print(f'Loading {answer["loading"]} in the flat panel of process {answer["pid"]}')
+        else:
+            print(f'Restoring the original theme in process {answer["pid"]}')
+        return True
+
+    def getFleetSelCalIndex(self):
+        if self.fleetSelCalIndex is None:
+            from selcal import SelCalIndex
+            self.fleetSelCalIndex = SelCalIndex()
+        return self.fleetSelCalIndex
+
+    def loadFleet(self, rowsFile: str):
+        from fleet import validateFleet
+
+        self.fleetSelCalIndex, errors = validateFleet(rowsFile)
+        if errors:
+            print(f'{len(errors)} problems in {rowsFile}, run --validate-fleet for details', file=sys.stderr)
+
+    def validateFleet(self, rowsFile: str):
+        from fleet import validateFleet
+
+        index, errors = validateFleet(rowsFile)
+        for lineNumber, message in errors:
+            print(f'Line {lineNumber}: {message}')
+
+        print(f'{len(index)} SelCal codes assigned, {len(errors)} problems found')
+        if errors:
+            sys.exit(1)
+
+    def allocateSelCalCodes(self, count: int):
+        for _ in range(count):
+            print(self.getFleetSelCalIndex().allocate(avoidSharedLetters=True).getFullCode(' '))
+
+    def listConfigs(self, configsDirectory: str):
+        from library import ConfigLibrary
+
+        library = ConfigLibrary(configsDirectory)
+        library.refresh()
+
+        for entry in library.getEntries():
+            print(f'{entry.typeDesignatorIcao:<6}{entry.manufacturer} {entry.aircraftType:<24}{entry.path}')
+
+    def resolveConfig(self, config: str, configsDirectory: str) -> str:
+        if os.path.isfile(config):
+            return config
+
+        from library import ConfigLibrary
+
+        library = ConfigLibrary(configsDirectory)
+        library.refresh()
+        matches = library.find(config)
+
+        if len(matches) == 1:
+            return matches[0].path
+
+        if not matches:
+            print(f'No config file or library entry matches "{config}"', file=sys.stderr)
+        else:
+            print(f'"{config}" matches several configs:', file=sys.stderr)
+            for entry in matches:
+                print(f'  {entry.typeDesignatorIcao:<6}{entry.manufacturer} {entry.aircraftType:<24}{entry.path}', file=sys.stderr)
+        sys.exit(1)
+
+    def restoreOriginalTheme(self, snapshotId: int = None):
+        if snapshotId is None:
+            snapshot = self.themeJournal.getOriginal()
+        else:
+            snapshot = self.themeJournal.getSnapshot(snapshotId)
+            if snapshot is None:
+                print(f'No theme snapshot {snapshotId}, see --list-snapshots', file=sys.stderr)
+                sys.exit(1)
+
+        if snapshot is not None:
+            theme = snapshot.theme
+        elif not os.path.isfile(self.ORIGINAL_THEME_PATH):
+            print('Nothing to restore, no theme was saved before a flat panel was loaded', file=sys.stderr)
+            sys.exit(1)
+        else:
+            # Written by versions before the journal
+            from windowstheme import Theme
+            theme = Theme.fromFile(self.ORIGINAL_THEME_PATH)
+
+        # Always re-applied, the path Windows reports does not tell whether per monitor wallpapers replaced it
+        self.themeInterface.loadTheme(theme, refreshWallpaper=True)
+        self.themeJournal.markRestored()
         print('Restored original theme')
 
-    def saveCurrentTheme(self, path: str):
-        self.themeInterface.currentTheme().toFile(path)
-        print('Saved current theme')
+    def saveCurrentTheme(self):
+        if self.themeJournal.isActive():
+            # Loaded again without restoring, the current theme is the panel's own
+            print('Kept original theme, a flat panel theme is still active')
+            return
 
-    def addFlightPatchToWallpaper(self):
-        path = self.PANEL_BACKGROUND_PATH
-        self.flightPatchComposer = FlightPatchComposer(self.config.backgroundImage)
+        snapshot = self.themeJournal.recordOriginal(self.themeInterface.currentTheme())
+        print(f'Saved current theme as snapshot {snapshot.id}')
+
+    def listSnapshots(self):
+        original = self.themeJournal.getOriginal()
+        for snapshot in self.themeJournal.getSnapshots():
+            marker = '*' if original is not None and snapshot.id == original.id else ' '
+            recorded = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.time))
+            print(f'{marker}{snapshot.id:>5}  {recorded}  {snapshot.theme.wallpaper}')
 
+    def addFlightPatchToWallpaper(self):
         if self.config.addCallsign and self.config.askForCallsign:
             self.askForCallsign()
 
@@ -70,18 +414,148 @@ class App:
         if self.config.addRegistration and self.config.askForRegistration:
             self.askForRegistration()
 
-        image = self.flightPatchComposer.composePatch(
-            patch=self.config.flightPatch,
-            registration=self.config.addRegistration,
-            selCalCode=self.config.addSelCalCode,
-            callsign=self.config.addCallsign,
-            descriptions=self.config.addDescriptions
-        )
-        image.save(path, 'PNG')
+        return self.renderPanelBackground()
+
+    def scaledBackgroundAndPatch(self, config: 'FlatPanelConfig') -> (str, 'FlightPatch'):
+        # Also the wallpaper of configs without flight patch, Windows then scales a background of the display's size
+        if self.targetResolution is None:
+            return (config.backgroundImage, config.flightPatch)
+
+        from scaling import BackgroundPyramid, scalePatch
+
+        # Scaled once per background and resolution, later renders start from the cached copy
+        with span('scale background'):
+            backgroundImage, factor = BackgroundPyramid().getScaled(config.backgroundImage, self.targetResolution)
+        return (backgroundImage, scalePatch(config.flightPatch, factor))
+
+    def renderPanelBackground(self, useCache=True):
+        with span('render panel background'):
+            if self.config.displays:
+                return self.__renderDisplays()
+            return self.__renderPanelBackground(useCache)
+
+    def __renderDisplays(self) -> str:
+        # Returns the wallpaper for the theme and sets up the span position or the per monitor wallpapers
+        from displays import DisplayRenderer, displayPatch, monitorWallpapers
+        from flatpanel import DisplayMode
+        from layout import layoutPatch, findLayoutProblems
+
+        config = self.config
+        if config.addFlightPatch:
+            for i, display in enumerate(config.displays):
+                patch = displayPatch(display, config.flightPatch)
+                if patch is None:
+                    continue
+                items = layoutPatch(patch, config.addRegistration, config.addSelCalCode, config.addCallsign, config.addDescriptions)
+                for problem in findLayoutProblems(patch, items):
+                    print(f'Layout warning: display {i} {problem.label} {problem.message}')
+
+        if self.displayRenderer is None:
+            self.displayRenderer = DisplayRenderer()
+        with span('render displays'):
+            paths = self.displayRenderer.render(config, self.PANEL_BACKGROUND_PATH, self.outputFormat or config.outputFormat)
+        print(f'Generated panel background for {len(config.displays)} displays')
+
+        if config.displayMode == DisplayMode.PerMonitor:
+            config.theme.wallpaperPosition = 'Fill'
+            config.theme.monitorWallpapers = [os.path.abspath(path) if path is not None else None
+                                              for path in monitorWallpapers(config.displays, paths)]
+        else:
+            config.theme.wallpaperPosition = 'Span'
+            config.theme.monitorWallpapers = None
+        return paths[0]
+
+    def __renderPanelBackground(self, useCache: bool):
+        from composer import FlightPatchComposer
+        from layout import layoutPatch, findLayoutProblems
+        from tiling import TiledPatchCompositor, canComposeTiled
+
+        path = self.PANEL_BACKGROUND_PATH
+        outputFormat = self.outputFormat or self.config.outputFormat
+        backgroundImage, patch = self.scaledBackgroundAndPatch(self.config)
+        if self.liveFields is not None:
+            patch = self.liveFields.apply(patch)
+
+        cacheKey = None
+        if self.renderCache is not None and useCache:
+            cacheKey = self.renderCache.keyFor(
+                backgroundImage,
+                patch,
+                registration=self.config.addRegistration,
+                selCalCode=self.config.addSelCalCode,
+                callsign=self.config.addCallsign,
+                descriptions=self.config.addDescriptions,
+                variant=outputFormat.name
+            )
+            with span('render cache lookup'):
+                cachedPath = self.renderCache.lookup(cacheKey, path)
+            if cachedPath is not None:
+                hits, misses = self.renderCache.getStats()
+                print(f'Reused cached panel background (cache hits: {hits}, misses: {misses})')
+                return cachedPath
+
+        # Laying out touches font metrics only, so problems are reported before anything is drawn
+        with span('check layout'):
+            items = layoutPatch(
+                patch,
+                registration=self.config.addRegistration,
+                selCalCode=self.config.addSelCalCode,
+                callsign=self.config.addCallsign,
+                descriptions=self.config.addDescriptions
+            )
+            problems = findLayoutProblems(patch, items)
+        for problem in problems:
+            print(f'Layout warning: {problem.label} {problem.message}')
+
+        if canComposeTiled(backgroundImage, outputFormat):
+            # Very large backgrounds are streamed strip by strip to keep memory bounded
+            with span('tiled compose'):
+                path = TiledPatchCompositor(backgroundImage).composeToFile(
+                    patch=patch,
+                    path=path,
+                    outputFormat=outputFormat,
+                    registration=self.config.addRegistration,
+                    selCalCode=self.config.addSelCalCode,
+                    callsign=self.config.addCallsign,
+                    descriptions=self.config.addDescriptions
+                )
+        else:
+            # A composer on the same background is kept, later frames start from the last one and only redraw what changed
+            if self.flightPatchComposer is None or self.composerBackground != backgroundImage:
+                self.flightPatchComposer = FlightPatchComposer(backgroundImage)
+                self.composerBackground = backgroundImage
+                self.panelFrame = None
+
+            self.panelFrame = self.flightPatchComposer.compose(
+                patch=patch,
+                registration=self.config.addRegistration,
+                selCalCode=self.config.addSelCalCode,
+                callsign=self.config.addCallsign,
+                descriptions=self.config.addDescriptions,
+                previous=self.panelFrame
+            )
+            path = self.panelFrame.toFile(path, outputFormat)
         print('Generated panel background')
 
+        if cacheKey is not None:
+            with span('render cache store'):
+                self.renderCache.store(cacheKey, path)
+
         return path
 
+    def renderBatch(self, configFile: str, rowsFile: str, outputDirectory: str, workers: int = None):
+        from batch import BatchRenderer
+        from flatpanel import FlatPanelConfig
+
+        config = FlatPanelConfig.fromFile(configFile)
+        if self.outputFormat is not None:
+            config.outputFormat = self.outputFormat
+        config.backgroundImage, config.flightPatch = self.scaledBackgroundAndPatch(config)
+        rendered, failed = BatchRenderer(config, outputDirectory, workers).run(rowsFile)
+        print(f'Rendered {rendered} panel backgrounds to {outputDirectory} ({failed} failed)')
+        if failed:
+            sys.exit(1)
+
     def askForUserInput(self, hint: str, fallbackOnEmpty=False, fallbackValue: str = None) -> str:
 
         if fallbackOnEmpty:
@@ -97,6 +571,8 @@ class App:
             return answer
 
     def askForCallsign(self):
+        from flightpatch import Callsign
+
         success = False
 
         while not success:
@@ -113,16 +589,29 @@ class App:
                 print(f'{e}\n', file=sys.stderr)
 
     def askForSelCalCode(self):
+        from flightpatch import SelCalCode
+
         success = False
 
         while not success:
             selCalCodeString = self.askForUserInput(
-                "SelCal Code?",
+                "SelCal Code? (? for an unused one)",
                 self.config.defaultSelCalCodeOnEmpty,
                 self.config.flightPatch.selCalCode.getFullCode(' ')
             )
             try:
-                self.config.flightPatch.selCalCode = SelCalCode(selCalCodeString)
+                if selCalCodeString.strip() == '?':
+                    selCalCode = self.getFleetSelCalIndex().allocate(avoidSharedLetters=True, reserve=False)
+                else:
+                    selCalCode = SelCalCode(selCalCodeString)
+
+                fleetSelCalIndex = self.getFleetSelCalIndex()
+                if fleetSelCalIndex.contains(selCalCode):
+                    owner = fleetSelCalIndex.getOwner(selCalCode)
+                    assignedTo = '' if owner is None else f' to {owner}'
+                    print(f'SelCal code {selCalCode.getFullCode(" ")} is already assigned{assignedTo}', file=sys.stderr)
+
+                self.config.flightPatch.selCalCode = selCalCode
                 success = True
                 print(f'{self.config.flightPatch.selCalCode.getFullCode(" ")}\n')
             except ValueError as e:
@@ -143,30 +632,169 @@ class App:
               f'({self.config.typeDesignatorIcao})')
 
         # Save current theme
-        self.saveCurrentTheme(self.ORIGINAL_THEME_PATH)
+        with span('save original theme'):
+            self.saveCurrentTheme()
 
         # Generate complete panel background
-        wallpaper = self.config.backgroundImage
+        wallpaper = self.scaledBackgroundAndPatch(self.config)[0]
         if self.config.addFlightPatch:
             wallpaper = self.addFlightPatchToWallpaper()
+        elif self.config.displays:
+            wallpaper = self.renderPanelBackground()
 
         # Activate theme
         self.config.theme.wallpaper = os.path.abspath(wallpaper)
-        self.themeInterface.loadTheme(self.config.theme)
+        with span('apply theme'):
+            self.themeInterface.loadTheme(self.config.theme, refreshWallpaper=self.config.addFlightPatch or bool(self.config.displays))
         print('Activated theme')
 
+    def reloadConfig(self, configFile: str, backgroundChanged=False):
+        from flatpanel import FlatPanelConfig
+
+        try:
+            with span('parse config'):
+                config = FlatPanelConfig.fromFile(configFile)
+            liveFields = self.createLiveFields(config, self.liveFields)
+            self.applyAutoThemeColors(config)
+        except (OSError, ValueError, KeyError) as e:
+            print(f'Could not reload {configFile}: {e}', file=sys.stderr)
+            return
+
+        previous = self.config
+
+        # Answers given at startup stay in place, the prompts are not repeated while resident
+        if config.askForCallsign and previous.askForCallsign:
+            config.flightPatch.callsign = previous.flightPatch.callsign
+        if config.askForSelCalCode and previous.askForSelCalCode:
+            config.flightPatch.selCalCode = previous.flightPatch.selCalCode
+        if config.askForRegistration and previous.askForRegistration:
+            config.flightPatch.aircraftRegistration = previous.flightPatch.aircraftRegistration
+        self.applyPatchOverrides(config.flightPatch)
+
+        def themeColors(theme: 'Theme') -> tuple:
+            return (theme.dwmAccentColor, theme.dwmAccentColorInactive, theme.dwmColorPrevalence, theme.explorerAccentColorMenu)
+
+        def wallpaperInputs(config: 'FlatPanelConfig') -> tuple:
+            return (config.backgroundImage, config.addFlightPatch, config.flightPatch, config.addRegistration,
+                    config.addSelCalCode, config.addCallsign, config.addDescriptions, config.outputFormat,
+                    config.displays, config.displayMode)
+
+        themeChanged = themeColors(previous.theme) != themeColors(config.theme)
+        wallpaperChanged = backgroundChanged or wallpaperInputs(previous) != wallpaperInputs(config)
+
+        if backgroundChanged:
+            self.flightPatchComposer = None
+            self.displayRenderer = None
+
+        self.config = config
+        self.liveFields = liveFields
+        wallpaperPosition = config.theme.wallpaperPosition
+        config.theme.wallpaper = previous.theme.wallpaper
+        config.theme.wallpaperPosition = previous.theme.wallpaperPosition
+        config.theme.monitorWallpapers = previous.theme.monitorWallpapers
+
+        if wallpaperChanged:
+            # A single wallpaper following a span or per monitor one fills the screen again, unless the config says otherwise
+            config.theme.wallpaperPosition = wallpaperPosition or ('Fill' if previous.displays else None)
+            config.theme.monitorWallpapers = None
+
+            wallpaper = self.scaledBackgroundAndPatch(config)[0]
+            if config.addFlightPatch or config.displays:
+                wallpaper = self.renderPanelBackground()
+            config.theme.wallpaper = os.path.abspath(wallpaper)
+
+        if themeChanged or wallpaperChanged:
+            # Only registry values that differ are written
+            with span('apply theme'):
+                self.themeInterface.loadTheme(config.theme, refreshWallpaper=wallpaperChanged)
+            print('Applied config changes')
+        else:
+            print('Config reloaded, nothing to apply')
+
+    def applyAutoThemeColors(self, config: 'FlatPanelConfig'):
+        if not config.autoThemeColors:
+            return
+
+        from coloranalyzer import ColorAnalyzer, suggestThemeColors
+        try:
+            with span('analyze background colors'):
+                colors = suggestThemeColors(ColorAnalyzer().analyze(config.backgroundImage))
+        except RuntimeError as e:
+            print(f'{e} Using the theme colors of the config.', file=sys.stderr)
+            return
+
+        for name, color in colors.items():
+            setattr(config.theme, name, color)
+
+    def suggestTheme(self, configFile: str):
+        from coloranalyzer import ColorAnalyzer, suggestThemeColors
+        from flatpanel import FlatPanelConfig
+
+        config = FlatPanelConfig.fromFile(configFile)
+        try:
+            analysis = ColorAnalyzer().analyze(config.backgroundImage)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+        print(f'Dominant colors of {config.backgroundImage}:')
+        for paletteColor in analysis.palette:
+            color = paletteColor.color
+            print(f'  {color.r:>3} {color.g:>3} {color.b:>3}  #{color.r:02x}{color.g:02x}{color.b:02x}  {paletteColor.share:>6.1%}')
+
+        print('Suggested theme colors:')
+        print(json.dumps({name: asdict(color) for name, color in suggestThemeColors(analysis).items()}, indent=4))
+
+    def createLiveFields(self, config: 'FlatPanelConfig', previous=None):
+        # The descriptions of flightPatch are not shown with several displays, theirs are static
+        if not config.addFlightPatch or not config.addDescriptions or config.displays:
+            return None
+
+        from datasources import LiveFields, hasLiveFields
+        if not hasLiveFields(config.flightPatch):
+            return None
+        return LiveFields(config.flightPatch.descriptions, previous)
+
+    def setPatchOverride(self, field: str, value):
+        # Changes made through the control API, kept when the config file is reloaded
+        self.patchOverrides[field] = value
+        self.applyPatchOverrides(self.config.flightPatch)
+
+    def applyPatchOverrides(self, patch: 'FlightPatch'):
+        for field, value in self.patchOverrides.items():
+            if field == 'descriptions':
+                for index, text in value.items():
+                    if index < len(patch.descriptions):
+                        patch.descriptions[index].text = text
+            else:
+                setattr(patch, field, value)
+
+    def refreshPanel(self, useCache=True):
+        # Re-renders and applies the current patch while resident. The kept composer only redraws the items that changed.
+        with span('refresh panel'):
+            wallpaper = self.renderPanelBackground(useCache)
+            self.config.theme.wallpaper = os.path.abspath(wallpaper)
+            self.themeInterface.loadTheme(self.config.theme, refreshWallpaper=True)
+
     def runConfig(self, configFile):
-        self.config = FlatPanelConfig.fromFile(configFile)
-        self.activate()
+        from flatpanel import FlatPanelConfig
+
+        with span('parse config'):
+            self.config = FlatPanelConfig.fromFile(configFile)
+        self.applyAutoThemeColors(self.config)
+        self.liveFields = self.createLiveFields(self.config)
+        with span('activate'):
+            self.activate()
 
-        def onSigInt(sig, frame):
+        from resident import ResidentMode
+
+        try:
+            # Blocks until Ctrl-C while re-applying edits to the config or background file
+            ResidentMode(self, configFile).run()
             print('Shutdown signal received')
+        finally:
+            # Also when resident mode failed, the panel theme is never left behind
             self.restoreOriginalTheme()
-            sys.exit(0)
-
-        signal.signal(signal.SIGINT, onSigInt)
-        while True:
-            time.sleep(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,204 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+FRAME_MAGIC = b'FPFRAME2'
+FRAME_HEADER = struct.Struct('<8s8sII')
+FRAME_HEADER_SIZE = 64
+
+
+class RawFrame:
+    # A decoded background mapped read-only from disk. Processes mapping the same frame share its pages.
+
+    def __init__(self, path: str):
+        file = open(path, 'rb')
+        try:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            file.close()
+
+        magic, mode, width, height = FRAME_HEADER.unpack_from(self.__map, 0)
+        if magic != FRAME_MAGIC:
+            self.__map.close()
+            raise ValueError(f'{path} is not a background frame.')
+
+        self.path = path
+        self.mode = mode.rstrip(b'\x00').decode()
+        self.size = (width, height)
+
+    def pixels(self) -> memoryview:
+        # Row major, len(self.mode) bytes per pixel for the stored modes RGB and RGBA
+        return memoryview(self.__map)[FRAME_HEADER_SIZE:]
+
+    def view(self) -> 'Image.Image':
+        # Shares the mapped memory for modes PIL can map, RGBA among them, and unpacks a private copy otherwise
+        from PIL import Image
+        return Image.frombuffer(self.mode, self.size, self.pixels(), 'raw', self.mode, 0, 1)
+
+    def crop(self, box: (int, int, int, int)) -> 'Image.Image':
+        # Unpacks only the rows box covers, e.g. the pixels under a patch
+        from PIL import Image
+        stride = self.size[0] * len(self.mode)
+        rows = Image.frombuffer(self.mode, (self.size[0], box[3] - box[1]), self.pixels()[box[1] * stride:box[3] * stride],
+                                'raw', self.mode, 0, 1)
+        return rows.crop((box[0], 0, box[2], box[3] - box[1]))
+
+    def copy(self) -> 'Image.Image':
+        # A writable image, same as Image.copy() on a decoded background
+        image = self.view()
+        return image.copy() if image.readonly else image
+
+
+def convertToFrameMode(image: 'Image.Image') -> 'Image.Image':
+    # Grayscale, palette and other modes cannot take RGB text colors, the same conversion tiled rendering does
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    return image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+
+class BackgroundStore:
+    # Decodes each background once into an uncompressed frame file that later renders and worker processes map.
+    # The source's modification time and size are part of the file name, so a changed source gets a new frame
+    # and stale frames of it are removed as far as no other process still maps them. Beyond maxBytes the least
+    # recently used frames of other backgrounds are removed as well.
+
+    def __init__(self, directory: str = '.tmp/frames', maxBytes: int = 2 ** 30):
+        self.__directory = directory
+        self.__maxBytes = maxBytes
+        self.__frames = {}
+        self.__lock = threading.Lock()
+        # One lock per frame path, so different backgrounds decode concurrently and the same one only once
+        self.__frameLocks = {}
+        self.decodes = 0
+
+    def __sourcePrefix(self, sourcePath: str) -> str:
+        return hashlib.sha1(os.path.abspath(sourcePath).encode()).hexdigest()[:16]
+
+    def framePath(self, sourcePath: str) -> str:
+        stat = os.stat(sourcePath)
+        # The frame format is part of the signature, frames written by an older format are stale as well
+        signature = hashlib.sha1(f'{FRAME_MAGIC.decode()}:{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest()[:12]
+        return os.path.join(self.__directory, f'{self.__sourcePrefix(sourcePath)}_{signature}.frame')
+
+    def hasFrame(self, sourcePath: str) -> bool:
+        # Whether the source was decoded already, by this or another process
+        path = self.framePath(sourcePath)
+        with self.__lock:
+            return path in self.__frames or os.path.isfile(path)
+
+    def getFrame(self, sourcePath: str) -> RawFrame:
+        path = self.framePath(sourcePath)
+
+        with self.__lock:
+            frame = self.__frames.get(path)
+            if frame is not None:
+                return frame
+            frameLock = self.__frameLocks.setdefault(path, threading.Lock())
+
+        with frameLock:
+            with self.__lock:
+                frame = self.__frames.get(path)
+            if frame is not None:
+                # Decoded by another thread meanwhile
+                return frame
+
+            if not os.path.isfile(path):
+                self.__decode(sourcePath, path)
+            else:
+                # The modification time orders frames for eviction
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+
+            try:
+                frame = RawFrame(path)
+            except (OSError, ValueError, struct.error):
+                # A frame left behind incomplete, e.g. by a crash before this format check existed
+                self.__decode(sourcePath, path)
+                frame = RawFrame(path)
+
+            with self.__lock:
+                # Frames of an older version of the same source are not needed by this process anymore
+                prefix = f'{self.__sourcePrefix(sourcePath)}_'
+                for knownPath in [knownPath for knownPath in self.__frames if os.path.basename(knownPath).startswith(prefix)]:
+                    del self.__frames[knownPath]
+                self.__frames[path] = frame
+                del self.__frameLocks[path]
+            return frame
+
+    def __decode(self, sourcePath: str, path: str):
+        from PIL import Image
+
+        image = convertToFrameMode(Image.open(sourcePath))
+        image.load()
+        with self.__lock:
+            self.decodes += 1
+
+        os.makedirs(self.__directory, exist_ok=True)
+        header = FRAME_HEADER.pack(FRAME_MAGIC, image.mode.encode(), image.width, image.height)
+
+        temporaryPath = f'{path}.{os.getpid()}.tmp'
+        file = open(temporaryPath, 'wb')
+        file.write(header.ljust(FRAME_HEADER_SIZE, b'\x00'))
+        file.write(image.tobytes())
+        file.close()
+        os.replace(temporaryPath, path)
+
+        self.__removeStaleFrames(sourcePath, path)
+        self.__evictFrames(path)
+
+    def __removeStaleFrames(self, sourcePath: str, currentPath: str = None):
+        prefix = f'{self.__sourcePrefix(sourcePath)}_'
+        for name in os.listdir(self.__directory):
+            path = os.path.join(self.__directory, name)
+            if name.startswith(prefix) and name.endswith('.frame') and path != currentPath:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Still mapped by another process on Windows, removed by a later decode
+                    pass
+
+    def __evictFrames(self, currentPath: str):
+        frames = []
+        for name in os.listdir(self.__directory):
+            path = os.path.join(self.__directory, name)
+            if name.endswith('.frame'):
+                try:
+                    frames.append((os.stat(path), path))
+                except OSError:
+                    pass
+
+        total = sum(stat.st_size for stat, _ in frames)
+        for stat, path in sorted(frames, key=lambda frame: frame[0].st_mtime_ns):
+            if total <= self.__maxBytes:
+                break
+            if path == currentPath or path in self.__frames:
+                continue
+            try:
+                os.remove(path)
+                total -= stat.st_size
+            except OSError:
+                pass
+
+    def removeFrames(self, sourcePath: str):
+        # For sources that are deleted, e.g. scaled copies of a background that changed
+        with self.__lock:
+            prefix = f'{self.__sourcePrefix(sourcePath)}_'
+            for knownPath in [knownPath for knownPath in self.__frames if os.path.basename(knownPath).startswith(prefix)]:
+                del self.__frames[knownPath]
+            if os.path.isdir(self.__directory):
+                self.__removeStaleFrames(sourcePath)
+
+    def clear(self):
+        with self.__lock:
+            self.__frames.clear()
+
+
+backgroundStore = BackgroundStore()
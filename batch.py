@@ -0,0 +1,117 @@
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import replace
+
+from backgroundstore import backgroundStore
+from composer import FlightPatchComposer
+from flatpanel import FlatPanelConfig
+from fleet import BatchRow, readBatchRows
+
+
+_workerConfig = None
+_workerComposer = None
+_workerFrame = None
+
+
+def _initializeWorker(config: FlatPanelConfig):
+    global _workerConfig, _workerComposer, _workerFrame
+
+    # Every worker maps the frame the parent process decoded into the background store
+    _workerConfig = config
+    _workerComposer = FlightPatchComposer(config.backgroundImage)
+    _workerFrame = None
+
+
+def _renderRow(row: BatchRow, outputPath: str) -> str:
+    global _workerFrame
+
+    config = _workerConfig
+    patch = replace(
+        config.flightPatch,
+        aircraftRegistration=row.registration,
+        callsign=row.callsign,
+        selCalCode=row.selCalCode
+    )
+
+    # Rows of a fleet differ in a few items only, each frame starts from the worker's previous one
+    _workerFrame = _workerComposer.compose(
+        patch=patch,
+        registration=config.addRegistration,
+        selCalCode=config.addSelCalCode,
+        callsign=config.addCallsign,
+        descriptions=config.addDescriptions,
+        previous=_workerFrame
+    )
+    return _workerFrame.toFile(outputPath, config.outputFormat)
+
+
+class BatchRenderer:
+
+    def __init__(self, config: FlatPanelConfig, outputDirectory: str, workers: int = None):
+        self.config = config
+        self.outputDirectory = outputDirectory
+        self.workers = workers or os.cpu_count() or 1
+
+    def outputPathForRow(self, row: BatchRow) -> str:
+        fileName = re.sub(r'[^A-Za-z0-9_-]', '_', row.registration)
+        return os.path.join(self.outputDirectory, fileName)
+
+    def run(self, rowsPath: str) -> (int, int):
+        os.makedirs(self.outputDirectory, exist_ok=True)
+
+        backgroundStore.getFrame(self.config.backgroundImage)
+
+        rendered = 0
+        failed = 0
+        pending = {}
+        # Line numbers by output path. Case is ignored like Windows file systems do.
+        outputLines = {}
+
+        def collect(futures):
+            nonlocal rendered, failed
+            for future in futures:
+                row = pending.pop(future)
+                try:
+                    print(f'Line {row.lineNumber}: {future.result()}')
+                    rendered += 1
+                except Exception as e:
+                    print(f'Line {row.lineNumber}: rendering failed: {e}', file=sys.stderr)
+                    failed += 1
+
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_initializeWorker,
+            initargs=(self.config,)
+        )
+
+        with executor:
+            for lineNumber, jsonObject in readBatchRows(rowsPath):
+                try:
+                    if 'error' in jsonObject:
+                        raise ValueError(jsonObject['error'])
+                    row = BatchRow.fromJsonObject(jsonObject, lineNumber)
+
+                    # Duplicate registrations, or ones only differing in characters replaced in file names
+                    outputPath = self.outputPathForRow(row)
+                    firstLine = outputLines.setdefault(os.path.normcase(outputPath).lower(), lineNumber)
+                    if firstLine != lineNumber:
+                        raise ValueError(f'{row.registration} would overwrite {os.path.basename(outputPath)} of line {firstLine}')
+                except ValueError as e:
+                    print(f'Line {lineNumber}: {e}', file=sys.stderr)
+                    failed += 1
+                    continue
+
+                # Keep only a few rows in flight so results are written as soon as they finish
+                while len(pending) >= self.workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+                pending[executor.submit(_renderRow, row, outputPath)] = row
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        return (rendered, failed)
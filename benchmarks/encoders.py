@@ -0,0 +1,49 @@
+import argparse
+import io
+import time
+
+from PIL import Image
+
+from encoders import OutputFormat, resolveOutputFormat, saveOptions
+
+
+def benchmarkEncoders(backgroundImagePath: str, repeats: int = 3) -> [dict]:
+    image = Image.open(backgroundImagePath)
+    image.load()
+
+    results = []
+    for outputFormat in OutputFormat:
+        resolvedFormat = resolveOutputFormat(image, outputFormat)
+        formatName, options = saveOptions(resolvedFormat)
+
+        bestTime = None
+        size = 0
+        for _ in range(repeats):
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            image.save(buffer, formatName, **options)
+            elapsed = time.perf_counter() - start
+
+            bestTime = elapsed if bestTime is None else min(bestTime, elapsed)
+            size = buffer.tell()
+
+        results.append({
+            'format': outputFormat.name,
+            'resolvedFormat': resolvedFormat.name,
+            'seconds': bestTime,
+            'bytes': size
+        })
+
+    return results
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Measures encode time versus file size for each output format.')
+    argparser.add_argument('--background', default='backgrounds/a20n.png')
+    argparser.add_argument('--repeats', type=int, default=3)
+    args = argparser.parse_args()
+
+    print(f'{"Format":<14}{"Encoder":<14}{"Time [ms]":>12}{"Size [KiB]":>14}')
+    for result in benchmarkEncoders(args.background, args.repeats):
+        print(f'{result["format"]:<14}{result["resolvedFormat"]:<14}'
+              f'{result["seconds"] * 1000:>12.1f}{result["bytes"] / 1024:>14.1f}')
@@ -0,0 +1,222 @@
+import argparse
+import dataclasses
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from composer import FlightPatchComposer
+from encoders import OutputFormat, encodeImage
+from flatpanel import FlatPanelConfig
+from flightpatch import FlightPatch, Description, Outline, Plate, RgbColor, Shadow
+from windowstheme import InMemoryThemeBackend, Theme, ThemeColor, WindowsThemeInterface
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'pipeline_baseline.json')
+
+# Every patch item is drawn with this font, so results do not depend on the fonts a machine has installed
+BENCHMARK_FONT_PATH = os.path.join(os.path.dirname(__file__), 'fonts', 'Lato-Regular.ttf')
+
+
+def patchStyles(patch: FlightPatch) -> list:
+    return [patch.aircraftRegistrationStyle, patch.selCalCodeStyle, patch.callsignStyle] + \
+           [description.style for description in patch.descriptions]
+
+
+def preparePatch(patch: FlightPatch, fontPath: str, descriptionCount: int) -> FlightPatch:
+    # Copies the patch with descriptionCount labels, all drawn with fontPath if one is given
+    templates = patch.descriptions or [Description('LABEL', patch.callsignStyle)]
+    descriptions = [
+        Description(f'{templates[i % len(templates)].text} {i}', dataclasses.replace(templates[i % len(templates)].style))
+        for i in range(descriptionCount)
+    ]
+    patch = dataclasses.replace(
+        patch,
+        aircraftRegistrationStyle=dataclasses.replace(patch.aircraftRegistrationStyle),
+        selCalCodeStyle=dataclasses.replace(patch.selCalCodeStyle),
+        callsignStyle=dataclasses.replace(patch.callsignStyle),
+        descriptions=descriptions
+    )
+
+    if fontPath:
+        for style in patchStyles(patch):
+            style.fontName = fontPath
+    return patch
+
+
+def withEffects(patch: FlightPatch) -> FlightPatch:
+    # Outline, blurred shadow and plate on everything, their cost should depend on the patch and not the background
+    for style in patchStyles(patch):
+        style.outline = Outline(RgbColor(0, 0, 0), 2)
+        style.shadow = Shadow(RgbColor(0, 0, 0), 3, 3, 2, 0.6)
+    return dataclasses.replace(patch, plate=Plate(RgbColor(20, 30, 40), 0.5, 12, 8))
+
+
+def syntheticBackground(width: int, height: int) -> Image.Image:
+    return Image.linear_gradient('L').resize((width, height)).convert('RGB')
+
+
+def measure(function, repeats: int) -> dict:
+    # One warm up call, so font loading and other first use costs do not end up in the samples
+    function()
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+
+    return {'median': statistics.median(samples), 'min': min(samples), 'repeats': repeats}
+
+
+def benchmarkParse(configPath: str, repeats: int) -> dict:
+    return {
+        'parse': measure(lambda: FlatPanelConfig.fromFile(configPath), repeats)
+    }
+
+
+def benchmarkCompose(patch: FlightPatch, fontPath: str, sizes: [(int, int)], descriptionCounts: [int],
+                     repeats: int, directory: str) -> dict:
+    results = {}
+    for width, height in sizes:
+        background = syntheticBackground(width, height)
+        composer = FlightPatchComposer(None, background)
+
+        for descriptionCount in descriptionCounts:
+            casePatch = preparePatch(patch, fontPath, descriptionCount)
+            results[f'compose/{width}x{height}/{descriptionCount}'] = measure(lambda: composer.renderImage(casePatch), repeats)
+
+        effectsPatch = withEffects(preparePatch(patch, fontPath, len(patch.descriptions)))
+        results[f'compose/{width}x{height}/effects'] = measure(lambda: composer.renderImage(effectsPatch), repeats)
+
+        image = composer.renderImage(preparePatch(patch, fontPath, len(patch.descriptions)))
+        for outputFormat in [OutputFormat.Png, OutputFormat.FastPng]:
+            path = os.path.join(directory, f'encode_{width}x{height}')
+            results[f'encode/{outputFormat.name}/{width}x{height}'] = measure(lambda: encodeImage(image, path, outputFormat), repeats)
+
+    return results
+
+
+def benchmarkLoadTheme(theme: Theme, repeats: int) -> dict:
+    backend = InMemoryThemeBackend()
+    interface = WindowsThemeInterface(backend=backend)
+
+    # Another theme is written value by value first, so every other loadTheme has a full diff to apply
+    otherTheme = dataclasses.replace(
+        theme,
+        dwmAccentColor=ThemeColor(1, 2, 3),
+        dwmAccentColorInactive=ThemeColor(4, 5, 6),
+        dwmColorPrevalence=not theme.dwmColorPrevalence,
+        explorerAccentColorMenu=ThemeColor(7, 8, 9),
+        wallpaper=theme.wallpaper + '.previous'
+    )
+    interface.setDwmAccentColor(otherTheme.dwmAccentColor)
+    interface.setDwmAccentColorInactive(otherTheme.dwmAccentColorInactive)
+    interface.setDwmColorPrevalence(otherTheme.dwmColorPrevalence)
+    interface.setExplorerAccentColor(otherTheme.explorerAccentColorMenu)
+    interface.setWallpaper(otherTheme.wallpaper)
+
+    themes = [theme, otherTheme]
+
+    def switchTheme():
+        interface.loadTheme(themes[0])
+        themes.reverse()
+
+    return {
+        'loadTheme/changed': measure(switchTheme, repeats),
+        'loadTheme/unchanged': measure(lambda: interface.loadTheme(otherTheme), repeats)
+    }
+
+
+def runBenchmarks(configPath: str, fontPath: str, sizes: [(int, int)], descriptionCounts: [int], repeats: int) -> dict:
+    config = FlatPanelConfig.fromFile(configPath)
+
+    results = {}
+    results.update(benchmarkParse(configPath, repeats))
+    with tempfile.TemporaryDirectory() as directory:
+        results.update(benchmarkCompose(config.flightPatch, fontPath, sizes, descriptionCounts, repeats, directory))
+    results.update(benchmarkLoadTheme(config.theme, repeats))
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'font': os.path.basename(fontPath),
+        'results': results
+    }
+
+
+def compareResults(results: dict, baseline: dict, threshold: float, noiseFloor: float) -> [str]:
+    # A case regresses when its fastest run is more than threshold slower than the baseline's and the
+    # difference is above the noise floor. Minimums hardly move with other load on the machine, medians do.
+    # Cases missing on either side are skipped.
+    regressions = []
+    for name, result in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+
+        difference = result['min'] - previous['min']
+        if difference > noiseFloor and result['min'] > previous['min'] * (1 + threshold):
+            regressions.append(f'{name}: {previous["min"] * 1000:.2f} ms -> {result["min"] * 1000:.2f} ms')
+
+    return regressions
+
+
+def parseSize(text: str) -> (int, int):
+    width, height = text.lower().split('x')
+    return (int(width), int(height))
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Times config parsing, composing, encoding and theme loading.')
+    argparser.add_argument('--config', default='configs/a20n.json')
+    argparser.add_argument('--font', default=BENCHMARK_FONT_PATH,
+                           help='Font file used for every patch item, the bundled Lato by default.')
+    argparser.add_argument('--sizes', nargs='+', default=['1920x1080', '3840x2160', '5760x1080'])
+    argparser.add_argument('--descriptions', nargs='+', type=int, default=[0, 3, 12])
+    argparser.add_argument('--repeats', type=int, default=5)
+    argparser.add_argument('--output', help='Writes the results as JSON.')
+    argparser.add_argument('--compare', nargs='?', const=BASELINE_PATH, metavar='BASELINE',
+                           help='Fails if a case got slower than in the baseline.')
+    argparser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown, 0.2 is 20%%.')
+    argparser.add_argument('--noise-floor', type=float, default=0.0002, help='Differences below this many seconds are ignored.')
+    argparser.add_argument('--update-baseline', nargs='?', const=BASELINE_PATH, metavar='BASELINE')
+    args = argparser.parse_args()
+
+    results = runBenchmarks(args.config, args.font, [parseSize(size) for size in args.sizes], args.descriptions, args.repeats)
+
+    print(f'{"Case":<36}{"Median [ms]":>12}{"Min [ms]":>10}')
+    for name, result in results['results'].items():
+        print(f'{name:<36}{result["median"] * 1000:>12.2f}{result["min"] * 1000:>10.2f}')
+
+    if args.output:
+        file = open(args.output, 'w')
+        json.dump(results, file, indent=4)
+        file.close()
+
+    if args.update_baseline:
+        file = open(args.update_baseline, 'w')
+        json.dump(results, file, indent=4)
+        file.close()
+
+    if args.compare:
+        file = open(args.compare)
+        baseline = json.load(file)
+        file.close()
+
+        if baseline.get('font') != results['font']:
+            print(f'The baseline was measured with {baseline.get("font")}, not {results["font"]}', file=sys.stderr)
+            sys.exit(2)
+        if baseline.get('platform') != results['platform'] or baseline.get('python') != results['python']:
+            # The committed baseline is a reference point, machines running the check keep their own
+            print(f'The baseline was measured with Python {baseline.get("python")} on {baseline.get("platform")}, '
+                  f'store one for this machine with --update-baseline', file=sys.stderr)
+
+        regressions = compareResults(results, baseline, args.threshold, args.noise_floor)
+        for regression in regressions:
+            print(f'Regression {regression}', file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPOSITORY, 'app.py')
+BUDGET_PATH = os.path.join(os.path.dirname(__file__), 'startup_budget.json')
+FONT_PATH = os.path.join(os.path.dirname(__file__), 'fonts', 'Lato-Regular.ttf')
+
+# Modules a command must never pull in
+FORBIDDEN_IMPORTS = {
+    'load': [],
+    'hand-off': ['PIL', 'flatpanel'],
+    'restore': ['PIL', 'flatpanel'],
+    'render-batch': ['winreg', 'ctypes']
+}
+
+
+def prepareDirectory(directory: str) -> (str, str):
+    # The bundled config without prompts, drawn with the bundled font. Returns the config and batch rows paths.
+    file = open(os.path.join(REPOSITORY, 'configs', 'a20n.json'))
+    config = json.load(file)
+    file.close()
+
+    config['askForRegistration'] = config['askForSelCalCode'] = config['askForCallsign'] = False
+    config['backgroundImage'] = os.path.join(REPOSITORY, config['backgroundImage'])
+    patch = config['flightPatch']
+    for style in [patch['aircraftRegistrationStyle'], patch['selCalCodeStyle'], patch['callsignStyle']] + \
+                 [description['style'] for description in patch['descriptions']]:
+        style['fontName'] = FONT_PATH
+
+    configPath = os.path.join(directory, 'benchmark.json')
+    file = open(configPath, 'w')
+    json.dump(config, file)
+    file.close()
+
+    rowsPath = os.path.join(directory, 'rows.jsonl')
+    file = open(rowsPath, 'w')
+    file.write('{"registration": "D-AINA", "callsign": "DLH1", "selcal": "ABCD"}\n')
+    file.close()
+
+    return (configPath, rowsPath)
+
+
+def freePort() -> int:
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def importedModules(stderr: str) -> [str]:
+    return [line.split('|')[2].strip() for line in stderr.splitlines()
+            if line.startswith('import time:') and 'cumulative' not in line]
+
+
+class CommandRunner:
+    # Runs app.py as users do, in its own working directory. FLAT_PANEL_DRY_RUN keeps themes in memory,
+    # so nothing on the desktop changes.
+
+    def __init__(self, directory: str, traceImports: bool):
+        self.directory = directory
+        self.environment = dict(os.environ, FLAT_PANEL_DRY_RUN='1', PYTHONUNBUFFERED='1')
+        self.prefix = [sys.executable] + (['-X', 'importtime'] if traceImports else []) + [APP_PATH]
+        self.imports = {}
+
+    def run(self, command: str, arguments: [str]) -> float:
+        # Returns the wall time until the process ended, in milliseconds
+        start = time.perf_counter()
+        process = subprocess.run(self.prefix + arguments, cwd=self.directory, env=self.environment,
+                                 capture_output=True, text=True)
+        milliseconds = (time.perf_counter() - start) * 1000
+        if process.returncode != 0:
+            raise RuntimeError(f'{command} failed:\n{process.stdout}{process.stderr}')
+
+        self.imports[command] = importedModules(process.stderr)
+        return milliseconds
+
+    def load(self, arguments: [str]) -> (subprocess.Popen, float):
+        # Returns the resident process and the wall time until its theme was activated, in milliseconds
+        start = time.perf_counter()
+        process = subprocess.Popen(self.prefix + arguments, cwd=self.directory, env=self.environment,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for line in process.stdout:
+            if line.startswith('Activated theme'):
+                return (process, (time.perf_counter() - start) * 1000)
+
+        process.wait()
+        raise RuntimeError(f'load failed:\n{process.stderr.read()}')
+
+    def waitUntilListening(self, process: subprocess.Popen):
+        # The instance file is published once the control API accepts hand-offs
+        infoPath = os.path.join(self.directory, '.tmp', 'instance.json')
+        while not os.path.isfile(infoPath):
+            if process.poll() is not None:
+                raise RuntimeError(f'load ended early:\n{process.stderr.read()}')
+            time.sleep(0.01)
+
+    def finish(self, process: subprocess.Popen):
+        process.stdout.read()
+        self.imports['load'] = importedModules(process.stderr.read())
+        process.wait()
+
+
+def runCycle(runner: CommandRunner, configPath: str, rowsPath: str) -> dict:
+    # load, hand a second load and the restore over to it, then restore and render a batch without a loaded panel
+    measured = {}
+    process, measured['load'] = runner.load(['--load', configPath, '--control-port', str(freePort())])
+    try:
+        runner.waitUntilListening(process)
+        measured['hand-off'] = runner.run('hand-off', ['--load', configPath])
+        runner.run('hand-off', ['--restore'])
+        runner.finish(process)
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+    measured['restore'] = runner.run('restore', ['--restore'])
+    measured['render-batch'] = runner.run('render-batch', ['--render-batch', configPath, rowsPath,
+                                                           '--output', os.path.join(runner.directory, 'batch')])
+    return measured
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Times app.py commands as users run them against a budget.')
+    argparser.add_argument('--repeats', type=int, default=5)
+    argparser.add_argument('--budget', default=BUDGET_PATH)
+    argparser.add_argument('--update-budget', action='store_true', help='Stores 1.5x the measured medians as the new budget.')
+    args = argparser.parse_args()
+
+    file = open(args.budget)
+    budget = json.load(file)
+    file.close()
+
+    directory = tempfile.mkdtemp()
+    try:
+        configPath, rowsPath = prepareDirectory(directory)
+
+        # The first cycle decodes the background and fills the caches, like the first run after an install.
+        # It records the imported modules, -X importtime would distort the timed cycles.
+        tracingRunner = CommandRunner(directory, traceImports=True)
+        runCycle(tracingRunner, configPath, rowsPath)
+
+        runner = CommandRunner(directory, traceImports=False)
+        samples = {command: [] for command in FORBIDDEN_IMPORTS}
+        for _ in range(args.repeats):
+            for command, milliseconds in runCycle(runner, configPath, rowsPath).items():
+                samples[command].append(milliseconds)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    failures = []
+    measured = {}
+    print(f'{"Command":<14}{"Median [ms]":>12}{"Budget [ms]":>13}')
+
+    for command, commandSamples in samples.items():
+        median = statistics.median(commandSamples)
+        measured[command] = median
+        print(f'{command:<14}{median:>12.1f}{budget.get(command, 0):>13.1f}')
+
+        if command in budget and median > budget[command]:
+            failures.append(f'{command} takes {median:.1f} ms, budget is {budget[command]:.1f} ms')
+
+        for module in FORBIDDEN_IMPORTS[command]:
+            if any(name == module or name.startswith(f'{module}.') for name in tracingRunner.imports[command]):
+                failures.append(f'{command} imports {module}')
+
+    if args.update_budget:
+        file = open(args.budget, 'w')
+        json.dump({command: round(median * 1.5, 1) for command, median in measured.items()}, file, indent=4)
+        file.close()
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from encoders import OutputFormat
+from flightpatch import FlightPatch
+from memoryusage import peakResidentBytes
+from tiling import StreamingPngWriter
+
+# The font benchmarks/pipeline.py draws with as well
+BENCHMARK_FONT_PATH = os.path.join(os.path.dirname(__file__), 'fonts', 'Lato-Regular.ttf')
+
+
+def writeSyntheticBackground(path: str, width: int, height: int, stripHeight: int = 64):
+    # Written strip by strip so generating a huge background does not distort the measurement
+    writer = StreamingPngWriter(path, width, height, 'RGB', compressLevel=1)
+    for y in range(0, height, stripHeight):
+        rows = min(stripHeight, height - y)
+        strip = Image.linear_gradient('L').resize((width, rows)).convert('RGB')
+        writer.writeStrip(strip)
+    writer.close()
+
+
+def loadPatch(configPath: str, fontPath: str) -> FlightPatch:
+    file = open(configPath)
+    patch = FlightPatch.fromJsonObject(json.load(file)['flightPatch'])
+    file.close()
+
+    if fontPath:
+        for style in [patch.aircraftRegistrationStyle, patch.selCalCodeStyle, patch.callsignStyle] + \
+                     [description.style for description in patch.descriptions]:
+            style.fontName = fontPath
+    return patch
+
+
+def runChild(mode: str, backgroundPath: str, configPath: str, fontPath: str):
+    patch = loadPatch(configPath, fontPath)
+    outputPath = os.path.join(os.path.dirname(backgroundPath), f'output_{mode}')
+    start = time.perf_counter()
+
+    if mode == 'tiled':
+        from tiling import TiledPatchCompositor
+        TiledPatchCompositor(backgroundPath).composeToFile(patch, outputPath, OutputFormat.Bmp)
+    elif mode == 'full':
+        from encoders import encodeImage
+        from composer import FlightPatchComposer
+        image = FlightPatchComposer(backgroundPath).renderImage(patch)
+        encodeImage(image, outputPath, OutputFormat.Bmp)
+
+    print(json.dumps({'seconds': time.perf_counter() - start, 'peakBytes': peakResidentBytes()}))
+
+
+def measure(mode: str, backgroundPath: str, configPath: str, fontPath: str) -> dict:
+    command = [sys.executable, '-m', 'benchmarks.tiled_memory', '--child', mode, backgroundPath,
+               '--config', configPath]
+    if fontPath:
+        command += ['--font', fontPath]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Compares peak RSS of full and tiled compositing.')
+    argparser.add_argument('--sizes', nargs='+', default=['1920x1080', '5760x1080', '11520x2160', '15360x4320'])
+    argparser.add_argument('--config', default='configs/a20n.json')
+    argparser.add_argument('--font', default=BENCHMARK_FONT_PATH,
+                           help='Font file used for every patch item, the bundled Lato by default.')
+    argparser.add_argument('--child', nargs=2, metavar=('MODE', 'BACKGROUND'), help=argparse.SUPPRESS)
+    args = argparser.parse_args()
+
+    if args.child:
+        runChild(args.child[0], args.child[1], args.config, args.font)
+        sys.exit(0)
+
+    print(f'{"Size":<14}{"Mode":<8}{"Time [s]":>10}{"Peak RSS [MiB]":>16}')
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = measure('none', os.path.join(directory, 'none.png'), args.config, args.font)
+        print(f'{"-":<14}{"imports":<8}{baseline["seconds"]:>10.2f}{baseline["peakBytes"] / 2 ** 20:>16.1f}')
+
+        for size in args.sizes:
+            width, height = (int(value) for value in size.split('x'))
+            backgroundPath = os.path.join(directory, f'background_{size}.png')
+            writeSyntheticBackground(backgroundPath, width, height)
+
+            for mode in ['full', 'tiled']:
+                result = measure(mode, backgroundPath, args.config, args.font)
+                print(f'{size:<14}{mode:<8}{result["seconds"]:>10.2f}{result["peakBytes"] / 2 ** 20:>16.1f}')
@@ -0,0 +1,190 @@
+import colorsys
+import hashlib
+import json
+import math
+import os
+from dataclasses import dataclass
+
+from backgroundstore import backgroundStore, convertToFrameMode
+from windowstheme import ThemeColor
+
+# Version of the analysis stored in the cache, bump when the sampling or clustering changes
+COLOR_ANALYSIS_VERSION = 2
+
+
+@dataclass()
+class PaletteColor:
+    color: ThemeColor
+    share: float
+
+
+@dataclass()
+class ColorAnalysis:
+    palette: [PaletteColor]
+    accentColor: ThemeColor
+
+
+def _importNumpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError('Analyzing background colors requires NumPy, install it with "pip install numpy".')
+    return numpy
+
+
+def _reductionFactor(size: (int, int), maxSamples: int) -> int:
+    return max(1, math.ceil(math.sqrt(size[0] * size[1] / maxSamples)))
+
+
+def samplePixels(backgroundImagePath: str, maxSamples: int = 128 * 128):
+    # Block averages of the background, reduced in C. A background that was not rendered yet is not decoded into
+    # the store for this, JPEGs are even decoded at a fraction of their size right away.
+    np = _importNumpy()
+    from PIL import Image
+
+    if backgroundStore.hasFrame(backgroundImagePath):
+        image = backgroundStore.getFrame(backgroundImagePath).view()
+    else:
+        image = Image.open(backgroundImagePath)
+        factor = _reductionFactor(image.size, maxSamples)
+        image.draft(image.mode, (image.width // factor, image.height // factor))
+        image = convertToFrameMode(image)
+
+    factor = _reductionFactor(image.size, maxSamples)
+    reduced = image.reduce(factor) if factor > 1 else image
+    channels = len(reduced.mode)
+    samples = np.asarray(reduced).reshape(-1, channels)
+
+    if channels == 4:
+        # Transparent areas never show on the desktop, unless there is nothing else
+        opaque = samples[samples[:, 3] >= 128]
+        if len(opaque):
+            samples = opaque
+    if channels == 1:
+        samples = np.repeat(samples, 3, axis=1)
+    return samples[:, :3].astype(np.float32)
+
+
+def kMeans(samples, k: int = 6, iterations: int = 16, seed: int = 0):
+    # Returns the cluster centers and how many samples each of them got, k-means++ seeded so results are stable
+    np = _importNumpy()
+    rng = np.random.default_rng(seed)
+    k = min(k, len(samples))
+
+    centers = samples[[rng.integers(len(samples))]]
+    for _ in range(1, k):
+        distances = ((samples[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        total = distances.sum()
+        if total == 0:
+            break
+        centers = np.vstack([centers, samples[rng.choice(len(samples), p=distances / total)]])
+
+    labels = None
+    for _ in range(iterations):
+        newLabels = ((samples[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        if labels is not None and np.array_equal(labels, newLabels):
+            break
+        labels = newLabels
+
+        counts = np.bincount(labels, minlength=len(centers))
+        for channel in range(3):
+            sums = np.bincount(labels, weights=samples[:, channel], minlength=len(centers))
+            centers[:, channel] = np.where(counts > 0, sums / np.maximum(counts, 1), centers[:, channel])
+
+    return centers, np.bincount(labels, minlength=len(centers))
+
+
+def chooseAccentColor(palette: [PaletteColor]) -> ThemeColor:
+    # Prefers frequent, saturated mid tones. Near black and near white clusters only win if nothing else is there.
+    def score(paletteColor: PaletteColor) -> float:
+        color = paletteColor.color
+        _, saturation, value = colorsys.rgb_to_hsv(color.r / 255, color.g / 255, color.b / 255)
+        weight = paletteColor.share * (0.35 + saturation)
+        if value < 0.2 or value > 0.92:
+            weight *= 0.2
+        return weight
+
+    accent = max(palette, key=score).color
+
+    # Light accents would wash out the white title bar text Windows draws on them
+    hue, saturation, value = colorsys.rgb_to_hsv(accent.r / 255, accent.g / 255, accent.b / 255)
+    if value > 0.75:
+        r, g, b = colorsys.hsv_to_rgb(hue, saturation, 0.75)
+        accent = ThemeColor(round(r * 255), round(g * 255), round(b * 255))
+    return accent
+
+
+def suggestThemeColors(analysis: ColorAnalysis) -> dict:
+    # Same accent everywhere, like the hand made configs
+    return {
+        'dwmAccentColor': analysis.accentColor,
+        'dwmAccentColorInactive': analysis.accentColor,
+        'explorerAccentColorMenu': analysis.accentColor
+    }
+
+
+class ColorAnalyzer:
+    # Results are cached by the SHA-256 of the background file, which itself is remembered by (mtime, size)
+
+    def __init__(self, cachePath: str = '.tmp/color_cache.json', clusters: int = 6):
+        self.__cachePath = cachePath
+        self.__clusters = clusters
+        self.__cache = self.__loadCache()
+
+    def __loadCache(self) -> dict:
+        try:
+            file = open(self.__cachePath)
+            cache = json.load(file)
+            file.close()
+        except (OSError, ValueError):
+            return {'version': COLOR_ANALYSIS_VERSION, 'files': {}, 'analyses': {}}
+
+        if cache.get('version') != COLOR_ANALYSIS_VERSION:
+            return {'version': COLOR_ANALYSIS_VERSION, 'files': {}, 'analyses': {}}
+        return cache
+
+    def __saveCache(self):
+        os.makedirs(os.path.dirname(self.__cachePath) or '.', exist_ok=True)
+        temporaryPath = f'{self.__cachePath}.{os.getpid()}.tmp'
+        file = open(temporaryPath, 'w')
+        json.dump(self.__cache, file)
+        file.close()
+        os.replace(temporaryPath, self.__cachePath)
+
+    def __fileDigest(self, path: str) -> (str, bool):
+        # Returns the digest and whether it had to be computed
+        stat = os.stat(path)
+        absolutePath = os.path.abspath(path)
+        known = self.__cache['files'].get(absolutePath)
+        if known is not None and known['mtime'] == stat.st_mtime_ns and known['size'] == stat.st_size:
+            return (known['sha256'], False)
+
+        digest = hashlib.sha256()
+        file = open(path, 'rb')
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+        file.close()
+
+        self.__cache['files'][absolutePath] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest.hexdigest()}
+        return (digest.hexdigest(), True)
+
+    def analyze(self, backgroundImagePath: str) -> ColorAnalysis:
+        digest, digestComputed = self.__fileDigest(backgroundImagePath)
+        key = f'{digest}:{self.__clusters}'
+        cached = self.__cache['analyses'].get(key)
+
+        if cached is None:
+            samples = samplePixels(backgroundImagePath)
+            centers, counts = kMeans(samples, self.__clusters)
+            cached = [
+                {'r': int(round(float(center[0]))), 'g': int(round(float(center[1]))), 'b': int(round(float(center[2]))),
+                 'share': float(count) / len(samples)}
+                for center, count in sorted(zip(centers, counts), key=lambda pair: -pair[1]) if count > 0
+            ]
+            self.__cache['analyses'][key] = cached
+            self.__saveCache()
+        elif digestComputed:
+            self.__saveCache()
+
+        palette = [PaletteColor(ThemeColor(entry['r'], entry['g'], entry['b']), entry['share']) for entry in cached]
+        return ColorAnalysis(palette=palette, accentColor=chooseAccentColor(palette))
@@ -0,0 +1,299 @@
+import threading
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from backgroundstore import backgroundStore, convertToFrameMode
+from encoders import OutputFormat, encodeImage, encodeImageToBytes
+from flightpatch import FlightPatch, Plate
+from fonts import fontRegistry
+from layout import PatchItem, layoutPatch
+from tracing import span
+
+
+def _unionBox(first: (int, int, int, int), second: (int, int, int, int)) -> (int, int, int, int):
+    if first is None:
+        return second
+    return (min(first[0], second[0]), min(first[1], second[1]), max(first[2], second[2]), max(first[3], second[3]))
+
+
+def _boxesIntersect(first: (int, int, int, int), second: (int, int, int, int)) -> bool:
+    return first[0] < second[2] and second[0] < first[2] and first[1] < second[3] and second[1] < first[3]
+
+
+def _containsBox(outer: (int, int, int, int), inner: (int, int, int, int)) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def _intersectBoxes(first: (int, int, int, int), second: (int, int, int, int)) -> (int, int, int, int):
+    return (max(first[0], second[0]), max(first[1], second[1]), min(first[2], second[2]), min(first[3], second[3]))
+
+
+def _outlineWidth(item: PatchItem) -> int:
+    return item.style.outline.width if item.style.outline is not None else 0
+
+
+def _outlineBox(item: PatchItem) -> (int, int, int, int):
+    width = _outlineWidth(item)
+    return (item.box[0] - width, item.box[1] - width, item.box[2] + width, item.box[3] + width)
+
+
+def _shadowBox(item: PatchItem) -> (int, int, int, int):
+    # Where the blurred shadow of an item can leave any ink, the Gaussian tails are cut off at three times the radius
+    shadow = item.style.shadow
+    spread = _outlineWidth(item) + 3 * shadow.blur
+    left, top, right, bottom = item.box
+    return (left + shadow.offsetX - spread, top + shadow.offsetY - spread, right + shadow.offsetX + spread, bottom + shadow.offsetY + spread)
+
+
+def effectBox(item: PatchItem) -> (int, int, int, int):
+    # The extent of an item including its outline and shadow
+    box = _outlineBox(item)
+    if item.style.shadow is not None:
+        box = _unionBox(box, _shadowBox(item))
+    return box
+
+
+def plateBox(patch: FlightPatch) -> (int, int, int, int):
+    rectangle = patch.rectangle
+    padding = patch.plate.padding
+    return (rectangle.x - padding, rectangle.y - padding, rectangle.x + rectangle.width + padding, rectangle.y + rectangle.height + padding)
+
+
+def patchExtent(patch: FlightPatch, items: [PatchItem]) -> (int, int, int, int):
+    # Everything drawing the patch can touch: the rectangle, its plate and all items with their effects
+    rectangle = patch.rectangle
+    extent = (rectangle.x, rectangle.y, rectangle.x + rectangle.width, rectangle.y + rectangle.height)
+    if patch.plate is not None:
+        extent = _unionBox(extent, plateBox(patch))
+    for item in items:
+        extent = _unionBox(extent, effectBox(item))
+    return extent
+
+
+def _opacityToAlpha(opacity: float) -> int:
+    return max(0, min(255, round(opacity * 255)))
+
+
+def _textMask(item: PatchItem, font, box: (int, int, int, int), offset: (int, int) = (0, 0), strokeWidth: int = 0) -> Image.Image:
+    # Coverage of the item's text within box, which is given in background coordinates
+    mask = Image.new('L', (box[2] - box[0], box[3] - box[1]), 0)
+    position = (item.x + offset[0] - box[0], item.y + offset[1] - box[1])
+    ImageDraw.Draw(mask).text(position, item.text, 255, font=font, stroke_width=strokeWidth)
+    return mask
+
+
+def _compositeLayer(overlay: Image.Image, overlayBox: (int, int, int, int), mask: Image.Image, maskBox: (int, int, int, int),
+                    color: (int, int, int), opacity: float = 1.0):
+    # Masks are always drawn for the whole layer and cropped afterwards, so a layer clipped by a strip or
+    # dirty region gets exactly the pixels it has in a full render, blurred edges included
+    box = _intersectBoxes(maskBox, overlayBox)
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return
+
+    mask = mask.crop((box[0] - maskBox[0], box[1] - maskBox[1], box[2] - maskBox[0], box[3] - maskBox[1]))
+    if opacity < 1.0:
+        alpha = _opacityToAlpha(opacity)
+        mask = mask.point(lambda value: (value * alpha + 127) // 255)
+
+    layer = Image.new('RGBA', mask.size, color + (255,))
+    layer.putalpha(mask)
+    overlay.alpha_composite(layer, (box[0] - overlayBox[0], box[1] - overlayBox[1]))
+
+
+def _compositeOverlay(image: Image.Image, overlay: Image.Image, position: (int, int)):
+    if image.mode == 'RGBA':
+        image.alpha_composite(overlay, position)
+        return
+
+    # Only the covered region is converted, so the cost stays with the patch and not the background
+    box = (position[0], position[1], position[0] + overlay.width, position[1] + overlay.height)
+    region = image.crop(box).convert('RGBA')
+    region.alpha_composite(overlay)
+    image.paste(region.convert(image.mode), box)
+
+
+class ComposedFrame:
+    # The result of one compose call: the composer's shared base plus this frame's own copy of the pixels under
+    # the patch. The base is never written to, a full image is only copied when one is asked for.
+
+    def __init__(self, base, box: (int, int, int, int), region: Image.Image, items: [PatchItem], plate: Plate):
+        self.base = base
+        self.box = box
+        self.region = region
+        self.items = items
+        self.plate = plate
+        self.__image = None
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self) -> (int, int):
+        return self.base.size
+
+    def toImage(self) -> Image.Image:
+        # Made once per frame and shared by later calls, copy it before drawing onto it
+        with self.__lock:
+            if self.__image is None:
+                with span('copy frame'):
+                    image = self.base.copy()
+                    if self.region is not None:
+                        image.paste(self.region, self.box)
+                self.__image = image
+            return self.__image
+
+    def toBytes(self, outputFormat: OutputFormat = OutputFormat.Auto) -> bytes:
+        return encodeImageToBytes(self.toImage(), outputFormat)
+
+    def toFile(self, path: str, outputFormat: OutputFormat = OutputFormat.Auto) -> str:
+        # Returns the path actually written, with its extension matching the chosen format
+        return encodeImage(self.toImage(), path, outputFormat)
+
+
+class FlightPatchComposer:
+    # Holds the decoded background as an immutable base that any number of compose calls, also from several
+    # threads at once, render on. Each call gets a frame of its own. Passing the previous frame of a sequence
+    # as previous only redraws the items that changed since.
+
+    def __init__(self, backgroundImagePath: str, backgroundImage: Image.Image = None):
+        self.__backgroundImagePath = backgroundImagePath
+        # Without an image the background is mapped from the shared store on the first render, so a composer
+        # only used for layout never decodes it. A given image becomes the base and must not be changed anymore.
+        self.__base = convertToFrameMode(backgroundImage) if backgroundImage is not None else None
+        self.__lock = threading.Lock()
+
+    def compose(self, patch: FlightPatch, registration=True, selCalCode=True, callsign=True, descriptions=True,
+                previous: ComposedFrame = None) -> ComposedFrame:
+        with span('layout'):
+            items = self.layoutItems(patch, registration, selCalCode, callsign, descriptions)
+
+        base = self.getBase()
+        width, height = base.size
+
+        if previous is not None and previous.base is base and previous.region is not None and patch.plate == previous.plate:
+            dirtyBox = _intersectBoxes(self._findDirtyBox(previous.items, items), (0, 0, width, height))
+            if _containsBox(previous.box, dirtyBox):
+                return self._renderRegion(previous, dirtyBox, items, patch)
+
+        return self._renderFull(base, items, patch)
+
+    def renderImage(self, patch: FlightPatch, registration=True, selCalCode=True, callsign=True, descriptions=True) -> Image.Image:
+        return self.compose(patch, registration, selCalCode, callsign, descriptions).toImage()
+
+    def renderBytes(self, patch: FlightPatch, outputFormat: OutputFormat = OutputFormat.Auto,
+                    registration=True, selCalCode=True, callsign=True, descriptions=True) -> bytes:
+        return self.compose(patch, registration, selCalCode, callsign, descriptions).toBytes(outputFormat)
+
+    def renderFile(self, patch: FlightPatch, path: str, outputFormat: OutputFormat = OutputFormat.Auto,
+                   registration=True, selCalCode=True, callsign=True, descriptions=True) -> str:
+        return self.compose(patch, registration, selCalCode, callsign, descriptions).toFile(path, outputFormat)
+
+    def layoutItems(self, patch: FlightPatch, registration=True, selCalCode=True, callsign=True, descriptions=True) -> [PatchItem]:
+        return layoutPatch(patch, registration, selCalCode, callsign, descriptions)
+
+    def _findDirtyBox(self, previousItems: [PatchItem], items: [PatchItem]) -> (int, int, int, int):
+        dirtyBox = None
+
+        for i in range(max(len(previousItems), len(items))):
+            previous = previousItems[i] if i < len(previousItems) else None
+            current = items[i] if i < len(items) else None
+            if previous == current:
+                continue
+
+            # Both the old and the new extent of a changed item have to be redrawn
+            for item in [previous, current]:
+                if item is not None:
+                    dirtyBox = _unionBox(dirtyBox, effectBox(item))
+
+        return dirtyBox or (0, 0, 0, 0)
+
+    def _renderFull(self, base, items: [PatchItem], patch: FlightPatch) -> ComposedFrame:
+        width, height = base.size
+        box = _intersectBoxes(patchExtent(patch, items), (0, 0, width, height))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            # The patch lies completely outside of the background
+            return ComposedFrame(base, box, None, items, patch.plate)
+
+        region = base.crop(box)
+        self.drawItems(region, items, (box[0], box[1]), patch)
+        return ComposedFrame(base, box, region, items, patch.plate)
+
+    def _renderRegion(self, previous: ComposedFrame, box: (int, int, int, int), items: [PatchItem], patch: FlightPatch) -> ComposedFrame:
+        # Starts from the previous frame's pixels, restores the dirty box from the base and redraws everything
+        # overlapping it in original order
+        region = previous.region.copy()
+        if box[0] < box[2] and box[1] < box[3]:
+            dirty = previous.base.crop(box)
+            self.drawItems(dirty, items, (box[0], box[1]), patch)
+            region.paste(dirty, (box[0] - previous.box[0], box[1] - previous.box[1]))
+        return ComposedFrame(previous.base, previous.box, region, items, patch.plate)
+
+    def drawItems(self, image: Image.Image, items: [PatchItem], origin: (int, int) = (0, 0), patch: FlightPatch = None):
+        # Draws the items, and the plate of patch behind them if it has one, onto an image whose top left corner
+        # sits at origin in background coordinates. Everything goes into one RGBA overlay covering only what the
+        # patch touches of the image, which is then blended in with a single alpha composite.
+        width, height = image.size
+        visibleBox = (origin[0], origin[1], origin[0] + width, origin[1] + height)
+
+        plate = patch.plate if patch is not None else None
+        overlayBox = plateBox(patch) if plate is not None else None
+        visibleItems = [item for item in items if _boxesIntersect(effectBox(item), visibleBox)]
+        for item in visibleItems:
+            overlayBox = _unionBox(overlayBox, effectBox(item))
+
+        if overlayBox is None or not _boxesIntersect(overlayBox, visibleBox):
+            return
+        overlayBox = _intersectBoxes(overlayBox, visibleBox)
+
+        with span('draw text'):
+            overlay = Image.new('RGBA', (overlayBox[2] - overlayBox[0], overlayBox[3] - overlayBox[1]), (0, 0, 0, 0))
+            if plate is not None:
+                self._drawPlate(overlay, overlayBox, plateBox(patch), plate)
+            for item in visibleItems:
+                self._drawItem(overlay, overlayBox, item)
+
+        with span('composite overlay'):
+            _compositeOverlay(image, overlay, (overlayBox[0] - origin[0], overlayBox[1] - origin[1]))
+
+    def _drawPlate(self, overlay: Image.Image, overlayBox: (int, int, int, int), box: (int, int, int, int), plate: Plate):
+        # The plate is the first thing on the empty overlay, so it is drawn as is instead of being blended
+        shape = (box[0] - overlayBox[0], box[1] - overlayBox[1], box[2] - overlayBox[0] - 1, box[3] - overlayBox[1] - 1)
+        fill = plate.color.asTuple() + (_opacityToAlpha(plate.opacity),)
+        ImageDraw.Draw(overlay).rounded_rectangle(shape, radius=plate.cornerRadius, fill=fill)
+
+    def _drawItem(self, overlay: Image.Image, overlayBox: (int, int, int, int), item: PatchItem):
+        style = item.style
+        font = fontRegistry.getFont(style.fontName, item.fontSize)
+        strokeWidth = _outlineWidth(item)
+
+        if style.shadow is not None:
+            shadow = style.shadow
+            box = _shadowBox(item)
+            mask = _textMask(item, font, box, (shadow.offsetX, shadow.offsetY), strokeWidth)
+            if shadow.blur > 0:
+                mask = mask.filter(ImageFilter.GaussianBlur(shadow.blur))
+            _compositeLayer(overlay, overlayBox, mask, box, shadow.color.asTuple(), shadow.opacity)
+
+        if style.outline is not None:
+            box = _outlineBox(item)
+            _compositeLayer(overlay, overlayBox, _textMask(item, font, box, strokeWidth=strokeWidth), box, style.outline.color.asTuple())
+
+        _compositeLayer(overlay, overlayBox, _textMask(item, font, item.box), item.box, style.textColor.asTuple())
+
+    def getBase(self):
+        # The given Image or the background's RawFrame, mapped read-only from the shared store. Both hand out
+        # crops and writable copies, the frame unpacks only the rows a crop covers.
+        with self.__lock:
+            if self.__base is None:
+                with span('decode background'):
+                    self.__base = backgroundStore.getFrame(self.__backgroundImagePath)
+            return self.__base
+
+
+if __name__ == '__main__':
+    backgroundImagePath = 'C:\\Users\\thors\\Desktop\\msfs_2020_flat_panel_background_airbus_a320.png'
+
+    patch = FlightPatch.fromFile('themes/a320/patch.json')
+
+    composer = FlightPatchComposer(backgroundImagePath)
+    image = composer.renderImage(patch)
+    image.show()
+    #image.save('test.png', 'PNG')
@@ -0,0 +1,259 @@
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import sys
+from collections import deque
+
+from flightpatch import Callsign, SelCalCode
+
+DEFAULT_CONTROL_PORT = 8737
+MAX_BODY_BYTES = 64 * 1024
+TOKEN_HEADER = 'x-flat-panel-token'
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 415: 'Unsupported Media Type', 500: 'Internal Server Error'}
+
+
+class ControlRequestError(Exception):
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ControlServer:
+    # A small HTTP/1.1 JSON API on localhost for the resident process:
+    #   GET  /status
+    #   POST /callsign       {"value": "DLH123"}
+    #   POST /selcal         {"value": "DK-BR"}
+    #   POST /registration   {"value": "D-AIJE"}
+    #   POST /descriptions   {"descriptions": {"0": "text", ...}}
+    #   POST /load           {"config": "C:/path/to/config.json"}
+    #   POST /restore
+    # Updates arriving within debounceSeconds of each other are applied with a single render. Every update
+    # request is answered once that render finished and reports its own latency.
+    # Every request needs the token published in .tmp/instance.json as X-Flat-Panel-Token header and Host
+    # 127.0.0.1:<port>, POSTs also Content-Type application/json. Web pages can neither read the token nor send
+    # such requests without a CORS preflight, which is never answered.
+
+    def __init__(self, app, residentMode, port: int = DEFAULT_CONTROL_PORT, debounceSeconds: float = 0.1):
+        self.__app = app
+        self.__residentMode = residentMode
+        self.__port = port
+        self.__debounceSeconds = debounceSeconds
+
+        self.__loop = None
+        self.__server = None
+        self.__pendingApply = None
+        self.__applyHandle = None
+        self.__latencies = deque(maxlen=50)
+        self.applies = 0
+        self.token = secrets.token_urlsafe(32)
+
+        self.__routes = {
+            '/status': ('GET', self.__status),
+            '/callsign': ('POST', self.__setCallsign),
+            '/selcal': ('POST', self.__setSelCalCode),
+            '/registration': ('POST', self.__setRegistration),
+            '/descriptions': ('POST', self.__setDescriptions),
+            '/load': ('POST', self.__load),
+            '/restore': ('POST', self.__restore)
+        }
+
+    async def start(self) -> bool:
+        # Only reachable from this machine. Returns False if the port is taken, the panel then runs without API.
+        self.__loop = asyncio.get_running_loop()
+        try:
+            self.__server = await asyncio.start_server(self.__handle, '127.0.0.1', self.__port)
+        except OSError as e:
+            print(f'Control API not available on port {self.__port}: {e}', file=sys.stderr)
+            return False
+
+        print(f'Control API listening on http://127.0.0.1:{self.__port}')
+        return True
+
+    async def stop(self):
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+        if self.__applyHandle is not None:
+            self.__applyHandle.cancel()
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, headers, body = await self.__readRequest(reader)
+                self.__authorize(method, headers)
+                route = self.__routes.get(path)
+                if route is None:
+                    raise ControlRequestError(404, f'Unknown path {path}')
+                if route[0] != method:
+                    raise ControlRequestError(405, f'{path} expects {route[0]}')
+
+                status, payload = 200, await route[1](body)
+            except ControlRequestError as e:
+                status, payload = e.status, {'error': str(e)}
+            except Exception as e:
+                status, payload = 500, {'error': str(e)}
+
+            self.__writeResponse(writer, status, payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def __authorize(self, method: str, headers: dict):
+        if headers.get('host') != f'127.0.0.1:{self.__port}':
+            raise ControlRequestError(403, f'Expected Host 127.0.0.1:{self.__port}')
+        if not hmac.compare_digest(headers.get(TOKEN_HEADER, '').encode(), self.token.encode()):
+            raise ControlRequestError(403, 'Missing or wrong X-Flat-Panel-Token, see .tmp/instance.json')
+        if method != 'GET' and headers.get('content-type', '').split(';', 1)[0].strip().lower() != 'application/json':
+            raise ControlRequestError(415, 'Expected Content-Type application/json')
+
+    async def __readRequest(self, reader: asyncio.StreamReader) -> (str, str, dict, dict):
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                raise ControlRequestError(413, f'Request bodies are limited to {MAX_BODY_BYTES} bytes')
+
+            body = json.loads(await reader.readexactly(length)) if length else {}
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            raise ControlRequestError(400, f'Malformed request: {e}')
+
+        if not isinstance(body, dict):
+            raise ControlRequestError(400, 'Expected a JSON object')
+        return (method.upper(), target.split('?', 1)[0], headers, body)
+
+    def __writeResponse(self, writer: asyncio.StreamWriter, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n'.encode('latin-1') + body
+        )
+
+    def __valueOf(self, body: dict) -> str:
+        value = body.get('value')
+        if not isinstance(value, str):
+            raise ControlRequestError(400, 'Expected {"value": "..."}')
+        return value
+
+    async def __update(self, field: str, value) -> dict:
+        received = self.__loop.time()
+        self.__app.setPatchOverride(field, value)
+        await self.__scheduleApply()
+
+        latency = self.__loop.time() - received
+        self.__latencies.append(latency)
+        return {'applied': True, 'latencyMs': round(latency * 1000, 1)}
+
+    async def __scheduleApply(self):
+        # Every further update restarts the quiet period, all of them wait for the same render
+        if self.__pendingApply is None:
+            self.__pendingApply = self.__loop.create_future()
+        if self.__applyHandle is not None:
+            self.__applyHandle.cancel()
+        self.__applyHandle = self.__loop.call_later(self.__debounceSeconds, self.__apply)
+
+        await asyncio.shield(self.__pendingApply)
+
+    def __apply(self):
+        future = self.__pendingApply
+        self.__pendingApply = None
+        self.__applyHandle = None
+
+        try:
+            self.__app.refreshPanel()
+            self.applies += 1
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+
+    async def __setCallsign(self, body: dict) -> dict:
+        try:
+            callsign = Callsign(self.__valueOf(body))
+        except ValueError as e:
+            raise ControlRequestError(400, str(e))
+        return await self.__update('callsign', callsign)
+
+    async def __setSelCalCode(self, body: dict) -> dict:
+        try:
+            selCalCode = SelCalCode(self.__valueOf(body).replace('-', ''))
+        except ValueError as e:
+            raise ControlRequestError(400, str(e))
+        return await self.__update('selCalCode', selCalCode)
+
+    async def __setRegistration(self, body: dict) -> dict:
+        return await self.__update('aircraftRegistration', self.__valueOf(body).strip())
+
+    async def __setDescriptions(self, body: dict) -> dict:
+        descriptions = body.get('descriptions')
+        count = len(self.__app.config.flightPatch.descriptions)
+        if not isinstance(descriptions, dict):
+            raise ControlRequestError(400, 'Expected {"descriptions": {"<index>": "text", ...}}')
+
+        texts = dict(self.__app.patchOverrides.get('descriptions', {}))
+        for index, text in descriptions.items():
+            if not str(index).isdigit() or int(index) >= count or not isinstance(text, str):
+                raise ControlRequestError(400, f'Invalid description {index!r}, the config has {count}')
+            texts[int(index)] = text
+
+        return await self.__update('descriptions', texts)
+
+    async def __status(self, body: dict) -> dict:
+        config = self.__app.config
+        patch = config.flightPatch
+        latencies = sorted(self.__latencies)
+
+        return {
+            'aircraft': f'{config.manufacturer} {config.aircraftType} ({config.typeDesignatorIcao})',
+            'callsign': patch.callsign.getFullValue(''),
+            'selCalCode': patch.selCalCode.getFullCode(),
+            'registration': patch.aircraftRegistration,
+            'descriptions': [description.text for description in patch.descriptions],
+            'wallpaper': config.theme.wallpaper,
+            'updatePending': self.__pendingApply is not None,
+            'applies': self.applies,
+            'latencyMs': {
+                'last': round(self.__latencies[-1] * 1000, 1) if latencies else None,
+                'median': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                'max': round(latencies[-1] * 1000, 1) if latencies else None
+            }
+        }
+
+    async def __load(self, body: dict) -> dict:
+        # Sent by a later --load, which returns right away while this process applies the config
+        from flatpanel import FlatPanelConfig
+
+        configFile = body.get('config')
+        if not isinstance(configFile, str):
+            raise ControlRequestError(400, 'Expected {"config": "<path>"}')
+        try:
+            config = FlatPanelConfig.fromFile(configFile)
+        except (OSError, ValueError, KeyError) as e:
+            raise ControlRequestError(400, f'Could not load {configFile}: {e}')
+
+        self.__loop.call_soon(self.__residentMode.loadConfig, configFile)
+        return {
+            'loading': f'{config.manufacturer} {config.aircraftType} ({config.typeDesignatorIcao})',
+            'pid': os.getpid()
+        }
+
+    async def __restore(self, body: dict) -> dict:
+        # Ends resident mode like Ctrl-C does, the original theme is restored on the way out
+        self.__residentMode.stop()
+        return {'restoring': True, 'pid': os.getpid()}
@@ -0,0 +1,107 @@
+import time
+from dataclasses import replace
+
+from flightpatch import Description, FlightPatch
+from schema import ConfigError
+
+
+class DataSource:
+    # Supplies the text of a description bound to it with "source". read() runs on the resident event loop
+    # and has to return quickly, interval is how often it is polled in seconds.
+
+    def __init__(self, interval: float):
+        self.interval = interval
+
+    def read(self) -> str:
+        raise NotImplementedError()
+
+
+class UtcTimeSource(DataSource):
+
+    def __init__(self, timeFormat: str = '%H:%MZ', interval: float = 1.0):
+        super().__init__(interval)
+        self.timeFormat = timeFormat
+
+    def read(self) -> str:
+        return time.strftime(self.timeFormat, time.gmtime())
+
+
+class ElapsedTimeSource(DataSource):
+    # Hours and minutes since the source was created, i.e. since the panel was loaded
+
+    def __init__(self, interval: float = 1.0):
+        super().__init__(interval)
+        self.start = time.monotonic()
+
+    def read(self) -> str:
+        minutes = int(time.monotonic() - self.start) // 60
+        return f'{minutes // 60}:{minutes % 60:02d}'
+
+
+DATA_SOURCES = {
+    'utcTime': UtcTimeSource,
+    'blockTime': ElapsedTimeSource
+}
+
+
+def registerDataSource(name: str, factory):
+    # factory() returns a new DataSource, e.g. one reading the flight phase from the simulator
+    DATA_SOURCES[name] = factory
+
+
+def renderDescriptionText(template: str, value: str) -> str:
+    # "UTC {value}" keeps the label around the value, a text without placeholder is replaced completely
+    if '{value}' in template:
+        return template.replace('{value}', value)
+    return value
+
+
+class LiveFields:
+    # The current values of all descriptions bound to a data source, by description index
+
+    def __init__(self, descriptions: [Description], previous: 'LiveFields' = None):
+        # Sources of previous that are still bound to the same description are kept, e.g. a block time
+        # does not start over when the config is reloaded
+        self.names = {}
+        self.sources = {}
+        errors = []
+        for i, description in enumerate(descriptions):
+            if description.source is None:
+                continue
+
+            factory = DATA_SOURCES.get(description.source)
+            if factory is None:
+                names = ', '.join(DATA_SOURCES)
+                errors.append((f'$.flightPatch.descriptions[{i}].source', f'expected one of {names}, got {description.source!r}'))
+            elif previous is not None and previous.names.get(i) == description.source:
+                self.sources[i] = previous.sources[i]
+            else:
+                self.sources[i] = factory()
+            self.names[i] = description.source
+
+        if errors:
+            raise ConfigError(errors)
+
+        self.values = {i: source.read() for i, source in self.sources.items()}
+
+    def poll(self, index: int) -> bool:
+        # Reads one source again, returns whether its value changed
+        value = self.sources[index].read()
+        if value == self.values[index]:
+            return False
+        self.values[index] = value
+        return True
+
+    def apply(self, patch: FlightPatch) -> FlightPatch:
+        if not self.values:
+            return patch
+
+        descriptions = list(patch.descriptions)
+        for i, value in self.values.items():
+            if i < len(descriptions):
+                descriptions[i] = replace(descriptions[i], text=renderDescriptionText(descriptions[i].text, value))
+        return replace(patch, descriptions=descriptions)
+
+
+def hasLiveFields(patch: FlightPatch) -> bool:
+    return any(description.source is not None for description in patch.descriptions)
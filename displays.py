@@ -0,0 +1,152 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from PIL import Image
+
+from backgroundstore import backgroundStore
+from composer import FlightPatchComposer
+from encoders import OutputFormat, encodeImage
+from flatpanel import Display, DisplayMode, FlatPanelConfig
+from flightpatch import FlightPatch
+from scaling import BackgroundPyramid, scalePatch
+from tracing import span
+
+
+def spanSize(displays: [Display]) -> (int, int):
+    return (max(display.x + display.width for display in displays), max(display.y + display.height for display in displays))
+
+
+def displayPatch(display: Display, flightPatch: FlightPatch) -> FlightPatch:
+    # Registration, SelCal code and callsign are asked for once and are the same on every display
+    if display.flightPatch is None:
+        return None
+    return replace(
+        display.flightPatch,
+        aircraftRegistration=flightPatch.aircraftRegistration,
+        selCalCode=flightPatch.selCalCode,
+        callsign=flightPatch.callsign
+    )
+
+
+def monitorWallpapers(displays: [Display], paths: [str]) -> [str]:
+    # Wallpapers by monitor number, monitors no display is assigned to are None
+    monitors = [i if display.monitor is None else display.monitor for i, display in enumerate(displays)]
+    wallpapers = [None] * (max(monitors) + 1)
+    for monitor, path in zip(monitors, paths):
+        wallpapers[monitor] = path
+    return wallpapers
+
+
+def fitGeometry(imageSize: (int, int), size: (int, int)) -> (float, (int, int), (int, int)):
+    # Backgrounds are scaled to cover the display, the overhang is cut off evenly like Windows' Fill position does.
+    # Returns the factor the image is enlarged by, only backgrounds smaller than their display are, the enlarged
+    # size and the top left corner of the part the display shows.
+    factor = max(1.0, size[0] / imageSize[0], size[1] / imageSize[1])
+    scaled = (max(size[0], round(imageSize[0] * factor)), max(size[1], round(imageSize[1] * factor)))
+    return (factor, scaled, ((scaled[0] - size[0]) // 2, (scaled[1] - size[1]) // 2))
+
+
+def fitToDisplay(image: Image.Image, size: (int, int)) -> Image.Image:
+    if image.size == size:
+        return image
+
+    factor, scaled, (left, top) = fitGeometry(image.size, size)
+    if factor > 1.0:
+        image = image.resize(scaled, Image.LANCZOS)
+    return image.crop((left, top, left + size[0], top + size[1]))
+
+
+def offsetPatch(patch: FlightPatch, offset: (int, int)) -> FlightPatch:
+    # Everything is laid out relative to the rectangle, moving it moves the whole patch
+    if offset == (0, 0):
+        return patch
+    rectangle = patch.rectangle
+    return replace(patch, rectangle=replace(rectangle, x=rectangle.x - offset[0], y=rectangle.y - offset[1]))
+
+
+class DisplayRenderer:
+    # Renders the displays of a config on a thread pool. PIL releases the GIL while scaling, compositing and
+    # encoding, so the displays render in parallel and a render takes about as long as the slowest display.
+    # Displays showing the same background at the same size share its composer, and every display's next frame
+    # starts from its last one, so later renders only redraw the items that changed.
+
+    def __init__(self):
+        self.__pyramid = BackgroundPyramid()
+        self.__composers = {}
+        self.__composerLocks = {}
+        self.__frames = {}
+        self.__lock = threading.Lock()
+
+    def __composer(self, backgroundImage: str, size: (int, int)) -> (FlightPatchComposer, float, (int, int)):
+        # The composer drawing on the background already fitted to size, with the factor and offset that map
+        # patch coordinates onto it. Only the display's own pixels are composed and copied per frame.
+        # Displays of other backgrounds or sizes decode and fit theirs at the same time.
+        key = (backgroundImage, size)
+        with self.__lock:
+            if key in self.__composers:
+                return self.__composers[key]
+            keyLock = self.__composerLocks.setdefault(key, threading.Lock())
+
+        with keyLock:
+            with self.__lock:
+                if key in self.__composers:
+                    return self.__composers[key]
+
+            frame = backgroundStore.getFrame(backgroundImage)
+            if frame.size == size:
+                composer = (FlightPatchComposer(backgroundImage), 1.0, (0, 0))
+            else:
+                factor, _, offset = fitGeometry(frame.size, size)
+                with span('fit background'):
+                    fitted = fitToDisplay(frame.view(), size)
+                composer = (FlightPatchComposer(backgroundImage, fitted), factor, offset)
+
+            with self.__lock:
+                self.__composers[key] = composer
+                del self.__composerLocks[key]
+            return composer
+
+    def renderDisplay(self, index: int, display: Display, config: FlatPanelConfig) -> Image.Image:
+        with span(f'render display {index}'):
+            size = (display.width, display.height)
+            backgroundImage, factor = self.__pyramid.getScaled(display.backgroundImage, size)
+            composer, fitFactor, offset = self.__composer(backgroundImage, size)
+
+            patch = displayPatch(display, config.flightPatch) if config.addFlightPatch else None
+            if patch is None:
+                base = composer.getBase()
+                return base if isinstance(base, Image.Image) else base.view()
+
+            frame = composer.compose(
+                patch=offsetPatch(scalePatch(patch, factor * fitFactor), offset),
+                registration=config.addRegistration,
+                selCalCode=config.addSelCalCode,
+                callsign=config.addCallsign,
+                descriptions=config.addDescriptions,
+                previous=self.__frames.get(index)
+            )
+            self.__frames[index] = frame
+            return frame.toImage()
+
+    def render(self, config: FlatPanelConfig, path: str, outputFormat: OutputFormat = OutputFormat.Auto) -> [str]:
+        # Returns the span wallpaper for DisplayMode.Span and one wallpaper per display for DisplayMode.PerMonitor
+        displays = config.displays
+
+        def renderAndEncode(index: int, display: Display) -> str:
+            image = self.renderDisplay(index, display, config)
+            return encodeImage(image, f'{path}_{index}', outputFormat)
+
+        with ThreadPoolExecutor(max_workers=len(displays)) as executor:
+            if config.displayMode == DisplayMode.PerMonitor:
+                futures = [executor.submit(renderAndEncode, i, display) for i, display in enumerate(displays)]
+                return [future.result() for future in futures]
+
+            futures = [executor.submit(self.renderDisplay, i, display, config) for i, display in enumerate(displays)]
+            images = [future.result() for future in futures]
+
+        with span('assemble span'):
+            wallpaper = Image.new('RGB', spanSize(displays))
+            for display, image in zip(displays, images):
+                wallpaper.paste(image, (display.x, display.y))
+        return [encodeImage(wallpaper, path, outputFormat)]
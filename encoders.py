@@ -0,0 +1,84 @@
+import io
+import os
+from enum import Enum
+from typing import TYPE_CHECKING
+
+from tracing import span
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+class OutputFormat(Enum):
+    Auto = 'Auto'
+    Png = 'Png'
+    FastPng = 'FastPng'
+    Bmp = 'Bmp'
+    WebpLossless = 'WebpLossless'
+
+
+# Above this pixel count zlib dominates the apply time, so an uncompressed bitmap is written instead
+AUTO_BMP_PIXEL_THRESHOLD = 3840 * 2160
+
+
+def chooseOutputFormat(image: 'Image.Image') -> OutputFormat:
+    return chooseOutputFormatForSize(*image.size)
+
+
+def chooseOutputFormatForSize(width: int, height: int) -> OutputFormat:
+    if width * height >= AUTO_BMP_PIXEL_THRESHOLD:
+        return OutputFormat.Bmp
+    return OutputFormat.FastPng
+
+
+def resolveOutputFormat(image: 'Image.Image', outputFormat: OutputFormat) -> OutputFormat:
+    if outputFormat == OutputFormat.Auto:
+        return chooseOutputFormat(image)
+    return outputFormat
+
+
+def fileExtension(outputFormat: OutputFormat) -> str:
+    if outputFormat == OutputFormat.Bmp:
+        return '.bmp'
+    if outputFormat == OutputFormat.WebpLossless:
+        return '.webp'
+    return '.png'
+
+
+def saveOptions(outputFormat: OutputFormat) -> (str, dict):
+    if outputFormat == OutputFormat.Png:
+        return ('PNG', {})
+    if outputFormat == OutputFormat.FastPng:
+        return ('PNG', {'compress_level': 1})
+    if outputFormat == OutputFormat.Bmp:
+        return ('BMP', {})
+    if outputFormat == OutputFormat.WebpLossless:
+        return ('WEBP', {'lossless': True, 'quality': 0, 'method': 0})
+    raise ValueError(f'Output format "{outputFormat.name}" has to be resolved before encoding.')
+
+
+def encodeImage(image: 'Image.Image', path: str, outputFormat: OutputFormat = OutputFormat.Auto) -> str:
+    # Returns the path actually written, with its extension matching the chosen format
+    outputFormat = resolveOutputFormat(image, outputFormat)
+    path = os.path.splitext(path)[0] + fileExtension(outputFormat)
+
+    formatName, options = saveOptions(outputFormat)
+    if formatName == 'BMP' and image.mode not in ('1', 'L', 'P', 'RGB'):
+        image = image.convert('RGB')
+
+    with span('encode'):
+        image.save(path, formatName, **options)
+    return path
+
+
+def encodeImageToBytes(image: 'Image.Image', outputFormat: OutputFormat = OutputFormat.Auto) -> bytes:
+    outputFormat = resolveOutputFormat(image, outputFormat)
+
+    formatName, options = saveOptions(outputFormat)
+    if formatName == 'BMP' and image.mode not in ('1', 'L', 'P', 'RGB'):
+        image = image.convert('RGB')
+
+    buffer = io.BytesIO()
+    with span('encode'):
+        image.save(buffer, formatName, **options)
+    return buffer.getvalue()
@@ -0,0 +1,191 @@
+import ctypes
+import os
+import select
+import sys
+import threading
+
+
+def _fileSignature(path: str) -> (int, int):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+class FileWatcher:
+    # Blocks in the operating system's change notification on the parent directories of the watched files
+    # and reports the files whose modification time or size actually changed.
+
+    def __init__(self, paths: [str], onChange):
+        self.__onChange = onChange
+        self.__thread = None
+        self.__lock = threading.Lock()
+        self.setPaths(paths)
+
+    def setPaths(self, paths: [str]):
+        with self.__lock:
+            self.__signatures = {os.path.abspath(path): _fileSignature(path) for path in paths}
+
+    def getDirectories(self) -> [str]:
+        with self.__lock:
+            return sorted({os.path.dirname(path) for path in self.__signatures})
+
+    def start(self):
+        self.__thread = threading.Thread(target=self._watch, name='FileWatcher', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self._wake()
+        if self.__thread is not None:
+            self.__thread.join(timeout=1)
+            if self.__thread.is_alive():
+                # Still inside onChange, its handles are left to the process exit rather than closed under it
+                return
+        self._close()
+
+    def _checkForChanges(self):
+        changed = []
+        with self.__lock:
+            for path, signature in self.__signatures.items():
+                current = _fileSignature(path)
+                if current != signature:
+                    self.__signatures[path] = current
+                    changed.append(path)
+
+        if changed:
+            self.__onChange(changed)
+
+    def _watch(self):
+        raise NotImplementedError()
+
+    def _wake(self):
+        raise NotImplementedError()
+
+    def _close(self):
+        # Releases what the watcher allocated up front, watchers are replaced whenever the watched files change
+        pass
+
+
+class WindowsFileWatcher(FileWatcher):
+
+    def __init__(self, paths: [str], onChange):
+        super().__init__(paths, onChange)
+        self.__kernel32 = ctypes.windll.kernel32
+        self.__kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+        self.__kernel32.CreateEventW.restype = ctypes.c_void_p
+        self.__stopEvent = self.__kernel32.CreateEventW(None, True, False, None)
+        self.__stopping = False
+
+    def _watch(self):
+        FILE_NOTIFY_CHANGE_FILE_NAME = 0x01
+        FILE_NOTIFY_CHANGE_SIZE = 0x08
+        FILE_NOTIFY_CHANGE_LAST_WRITE = 0x10
+        INFINITE = 0xffffffff
+        INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+        kernel32 = self.__kernel32
+        handles = [self.__stopEvent]
+        for directory in self.getDirectories():
+            handle = kernel32.FindFirstChangeNotificationW(
+                directory,
+                False,
+                FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_SIZE | FILE_NOTIFY_CHANGE_LAST_WRITE
+            )
+            if handle != INVALID_HANDLE_VALUE:
+                handles.append(handle)
+
+        handleArray = (ctypes.c_void_p * len(handles))(*handles)
+        try:
+            while not self.__stopping:
+                index = kernel32.WaitForMultipleObjects(len(handles), handleArray, False, INFINITE)
+                if index <= 0 or index >= len(handles):
+                    break
+
+                kernel32.FindNextChangeNotification(ctypes.c_void_p(handles[index]))
+                self._checkForChanges()
+        finally:
+            for handle in handles[1:]:
+                kernel32.FindCloseChangeNotification(ctypes.c_void_p(handle))
+
+    def _wake(self):
+        self.__stopping = True
+        if self.__stopEvent is not None:
+            self.__kernel32.SetEvent(ctypes.c_void_p(self.__stopEvent))
+
+    def _close(self):
+        if self.__stopEvent is not None:
+            self.__kernel32.CloseHandle(ctypes.c_void_p(self.__stopEvent))
+            self.__stopEvent = None
+
+
+class InotifyFileWatcher(FileWatcher):
+
+    def __init__(self, paths: [str], onChange):
+        super().__init__(paths, onChange)
+        self.__libc = ctypes.CDLL(None, use_errno=True)
+        self.__wakeReader, self.__wakeWriter = os.pipe()
+        self.__stopping = False
+
+    def _watch(self):
+        IN_MODIFY = 0x002
+        IN_ATTRIB = 0x004
+        IN_CLOSE_WRITE = 0x008
+        IN_MOVED_TO = 0x080
+        IN_CREATE = 0x100
+        IN_CLOEXEC = 0o2000000
+
+        libc = self.__libc
+        inotifyFd = libc.inotify_init1(IN_CLOEXEC)
+        if inotifyFd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        for directory in self.getDirectories():
+            libc.inotify_add_watch(inotifyFd, directory.encode(sys.getfilesystemencoding()),
+                                   IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+
+        try:
+            while not self.__stopping:
+                readable, _, _ = select.select([inotifyFd, self.__wakeReader], [], [])
+                if self.__wakeReader in readable:
+                    break
+
+                os.read(inotifyFd, 64 * 1024)
+                self._checkForChanges()
+        finally:
+            os.close(inotifyFd)
+
+    def _wake(self):
+        self.__stopping = True
+        if self.__wakeWriter is not None:
+            os.write(self.__wakeWriter, b'\x00')
+
+    def _close(self):
+        if self.__wakeWriter is not None:
+            os.close(self.__wakeReader)
+            os.close(self.__wakeWriter)
+            self.__wakeReader = self.__wakeWriter = None
+
+
+class PollingFileWatcher(FileWatcher):
+    # For platforms without a change notification used here, e.g. macOS. Compares the signatures every interval seconds.
+
+    def __init__(self, paths: [str], onChange, interval: float = 0.5):
+        super().__init__(paths, onChange)
+        self.__interval = interval
+        self.__stopping = threading.Event()
+
+    def _watch(self):
+        while not self.__stopping.wait(self.__interval):
+            self._checkForChanges()
+
+    def _wake(self):
+        self.__stopping.set()
+
+
+def createFileWatcher(paths: [str], onChange) -> FileWatcher:
+    if sys.platform == 'win32':
+        return WindowsFileWatcher(paths, onChange)
+    if sys.platform.startswith('linux'):
+        return InotifyFileWatcher(paths, onChange)
+    return PollingFileWatcher(paths, onChange)
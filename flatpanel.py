@@ -2,8 +2,42 @@ import json
 from dataclasses import dataclass, asdict
 from enum import Enum
 
-from flightpatch import FlightPatch
-from windowstheme import Theme, WindowsThemeInterface
+from encoders import OutputFormat
+from flightpatch import FlightPatch, FLIGHT_PATCH_SCHEMA
+from schema import Record, Value, EnumValue, ListOf, Nullable
+from windowstheme import Theme, WindowsThemeInterface, THEME_SCHEMA
+
+
+class DisplayMode(Enum):
+    # Span: one wallpaper stretched across all monitors, PerMonitor: a wallpaper for each monitor
+    Span = 'Span'
+    PerMonitor = 'PerMonitor'
+
+
+@dataclass()
+class Display:
+    # One monitor of a multi display setup. x, y, width and height place it on the span wallpaper and give
+    # the size its background is scaled and cropped to.
+    backgroundImage: str
+    x: int
+    y: int
+    width: int
+    height: int
+
+    # Without a patch the display shows its background only
+    flightPatch: FlightPatch = None
+
+    # Windows' number of the monitor for the PerMonitor mode, by default the display's place in the list
+    monitor: int = None
+
+    def __post_init__(self):
+        if self.width <= 0 or self.height <= 0:
+            raise ValueError(f'Display size {self.width}x{self.height} has to be positive.')
+        if self.x < 0 or self.y < 0:
+            raise ValueError(f'Display position {self.x},{self.y} must not be negative.')
+
+    def fromJsonObject(jsonObject: dict):
+        return DISPLAY_SCHEMA.loadRoot(jsonObject)
 
 
 @dataclass()
@@ -30,6 +64,18 @@ class FlatPanelConfig:
     theme: Theme
     flightPatch: FlightPatch
     backgroundImage: str
+    outputFormat: OutputFormat = OutputFormat.Auto
+
+    # Minimum seconds between two wallpaper switches caused by live description sources
+    liveRefreshSeconds: float = 60
+
+    # Replaces the theme's accent colors with ones derived from the background, see coloranalyzer.py
+    autoThemeColors: bool = False
+
+    # Several monitors, each with its own background and patch, replacing backgroundImage. Registration,
+    # SelCal code and callsign of flightPatch are shown on all of them, see displays.py.
+    displays: [Display] = None
+    displayMode: DisplayMode = DisplayMode.Span
 
     def toJson(self, indent=4) -> str:
 
@@ -44,25 +90,7 @@ class FlatPanelConfig:
         return json.dumps(asdict(self, dict_factory=custom_asdict_factory), indent=indent)
 
     def fromJsonObject(jsonObject: dict):
-        return FlatPanelConfig(
-            manufacturer=jsonObject['manufacturer'],
-            aircraftType=jsonObject['aircraftType'],
-            typeDesignatorIcao=jsonObject['typeDesignatorIcao'],
-            addFlightPatch=jsonObject['addFlightPatch'],
-            addRegistration=jsonObject['addRegistration'],
-            askForRegistration=jsonObject['askForRegistration'],
-            defaultRegistrationOnEmpty=jsonObject['defaultRegistrationOnEmpty'],
-            addSelCalCode=jsonObject['addSelCalCode'],
-            askForSelCalCode=jsonObject['askForSelCalCode'],
-            defaultSelCalCodeOnEmpty=jsonObject['defaultSelCalCodeOnEmpty'],
-            addCallsign=jsonObject['addCallsign'],
-            askForCallsign=jsonObject['askForCallsign'],
-            defaultCallsignOnEmpty=jsonObject['defaultCallsignOnEmpty'],
-            addDescriptions=jsonObject['addDescriptions'],
-            theme=Theme.fromJsonObject(jsonObject['theme']),
-            flightPatch=FlightPatch.fromJsonObject(jsonObject['flightPatch']),
-            backgroundImage=jsonObject['backgroundImage']
-        )
+        return FLAT_PANEL_CONFIG_SCHEMA.loadRoot(jsonObject)
 
     def fromFile(path: str):
         file = open(path)
@@ -74,4 +102,50 @@ class FlatPanelConfig:
     def toFile(self, path: str, indent=4):
         file = open(path, 'w')
         file.write(self.toJson(indent=indent))
-        file.close()
\ No newline at end of file
+        file.close()
+
+
+DISPLAY_SCHEMA = Record(
+    Display,
+    {
+        'backgroundImage': Value(str),
+        'x': Value(int),
+        'y': Value(int),
+        'width': Value(int),
+        'height': Value(int)
+    },
+    optional={
+        'flightPatch': (Nullable(FLIGHT_PATCH_SCHEMA), None),
+        'monitor': (Value(int, type(None)), None)
+    }
+)
+
+FLAT_PANEL_CONFIG_SCHEMA = Record(
+    FlatPanelConfig,
+    {
+        'manufacturer': Value(str),
+        'aircraftType': Value(str),
+        'typeDesignatorIcao': Value(str),
+        'addFlightPatch': Value(bool),
+        'addRegistration': Value(bool),
+        'askForRegistration': Value(bool),
+        'defaultRegistrationOnEmpty': Value(bool),
+        'addSelCalCode': Value(bool),
+        'askForSelCalCode': Value(bool),
+        'defaultSelCalCodeOnEmpty': Value(bool),
+        'addCallsign': Value(bool),
+        'askForCallsign': Value(bool),
+        'defaultCallsignOnEmpty': Value(bool),
+        'addDescriptions': Value(bool),
+        'theme': THEME_SCHEMA,
+        'flightPatch': FLIGHT_PATCH_SCHEMA,
+        'backgroundImage': Value(str)
+    },
+    optional={
+        'outputFormat': (EnumValue(OutputFormat), OutputFormat.Auto),
+        'liveRefreshSeconds': (Value(int, float), 60),
+        'autoThemeColors': (Value(bool), False),
+        'displays': (Nullable(ListOf(DISPLAY_SCHEMA)), None),
+        'displayMode': (EnumValue(DisplayMode), DisplayMode.Span)
+    }
+)
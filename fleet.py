@@ -0,0 +1,87 @@
+import csv
+import json
+import os
+from dataclasses import dataclass
+
+from flightpatch import Callsign, SelCalCode
+from selcal import SelCalIndex, validateSelCalCodes, validateCallsigns
+
+
+@dataclass()
+class BatchRow:
+    lineNumber: int
+    registration: str
+    callsign: Callsign
+    selCalCode: SelCalCode
+
+    def fromJsonObject(jsonObject: dict, lineNumber: int = 0):
+        def field(*names: str) -> str:
+            for name in names:
+                value = jsonObject.get(name)
+                if value is not None and str(value).strip() != '':
+                    return str(value).strip()
+            raise ValueError(f'Missing value for "{names[0]}".')
+
+        return BatchRow(
+            lineNumber=lineNumber,
+            registration=field('registration', 'aircraftRegistration'),
+            callsign=Callsign(field('callsign')),
+            selCalCode=SelCalCode(field('selcal', 'selCalCode'))
+        )
+
+
+def readBatchRows(path: str):
+    # Yields (lineNumber, jsonObject) from a .csv file with a header row or a .jsonl file
+    file = open(path, newline='')
+
+    if os.path.splitext(path)[1].lower() == '.csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield (reader.line_num, row)
+    else:
+        for lineNumber, line in enumerate(file, start=1):
+            if line.strip() == '':
+                continue
+            try:
+                jsonObject = json.loads(line)
+            except ValueError as e:
+                yield (lineNumber, {'error': f'Invalid JSON: {e}'})
+                continue
+
+            if not isinstance(jsonObject, dict):
+                yield (lineNumber, {'error': f'Expected a JSON object, got {type(jsonObject).__name__}'})
+                continue
+            yield (lineNumber, jsonObject)
+
+    file.close()
+
+
+def validateFleet(path: str) -> (SelCalIndex, [(int, str)]):
+    # Validates all callsigns and SelCal codes of a fleet file at once, returns the index of
+    # assigned SelCal codes (owned by registration) and (lineNumber, message) for every problem
+    lineNumbers = []
+    registrations = []
+    callsigns = []
+    selCalCodes = []
+    errors = []
+
+    for lineNumber, jsonObject in readBatchRows(path):
+        if 'error' in jsonObject:
+            errors.append((lineNumber, jsonObject['error']))
+            continue
+
+        lineNumbers.append(lineNumber)
+        registrations.append(str(jsonObject.get('registration') or jsonObject.get('aircraftRegistration') or f'line {lineNumber}'))
+        callsigns.append(str(jsonObject.get('callsign') or ''))
+        selCalCodes.append(str(jsonObject.get('selcal') or jsonObject.get('selCalCode') or ''))
+
+    index = SelCalIndex()
+    selCalResults = validateSelCalCodes(selCalCodes, index, registrations)
+    callsignResults = validateCallsigns(callsigns)
+
+    for lineNumber, selCalResult, callsignResult in zip(lineNumbers, selCalResults, callsignResults):
+        for result in [callsignResult, selCalResult]:
+            if not result.isValid():
+                errors.append((lineNumber, result.error))
+
+    return (index, sorted(errors))
@@ -4,17 +4,25 @@ import sys
 from dataclasses import dataclass, asdict
 from enum import Enum
 
-from PIL import Image, ImageDraw, ImageFont
+from schema import Record, Value, EnumValue, ListOf, Nullable
+
+SELCAL_LETTERS = 'ABCDEFGHJKLMPQRS'
+SELCAL_LETTER_SET = frozenset(SELCAL_LETTERS)
+
+ICAO_AIRLINE_CODE_PATTERN = re.compile(r"^[A-Z]{3}$")
+FLIGHT_NUMBER_PATTERN = re.compile(r"^[1-9]+[0-9]*[A-Z]*$")
 
 
 class VerticalReference(Enum):
     Top = 'Top',
     Bottom = 'Bottom'
+    Center = 'Center'
 
 
 class HorizontalReference(Enum):
     Left = 'Left',
     Right = 'Right'
+    Center = 'Center'
 
 
 @dataclass()
@@ -26,12 +34,7 @@ class Position:
     horizontalOffset: int
 
     def fromJsonObject(jsonObject: dict):
-        return Position(
-            verticalReference=VerticalReference[jsonObject['verticalReference']],
-            verticalOffset=jsonObject['verticalOffset'],
-            horizontalReference=HorizontalReference[jsonObject['horizontalReference']],
-            horizontalOffset=jsonObject['horizontalOffset']
-        )
+        return POSITION_SCHEMA.loadRoot(jsonObject)
 
 
 @dataclass()
@@ -42,12 +45,7 @@ class Rectangle:
     height: int
 
     def fromJsonObject(jsonObject: dict):
-        return Rectangle(
-            x=jsonObject['x'],
-            y=jsonObject['y'],
-            width=jsonObject['width'],
-            height=jsonObject['height']
-        )
+        return RECTANGLE_SCHEMA.loadRoot(jsonObject)
 
 
 @dataclass(init=False)
@@ -58,7 +56,6 @@ class SelCalCode:
     digit4: str
 
     def __init__(self, text: str):
-        ALLOWED_CHARACTERS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'J', 'K', 'L', 'M', 'P', 'Q', 'R', 'S']
         transformedText = text.upper().strip().replace(' ', '')
 
         # Check sufficient length
@@ -66,19 +63,19 @@ class SelCalCode:
             raise ValueError(f'SelCal squence "{transformedText}" is expected to be exactly 4 digits long.')
 
         # Iterate the first 4 characters
-        occurrenceesList = []
+        occurrences = set()
         for i in range(4):
             digit = transformedText[i]
 
             # Check character is valid
-            if digit not in ALLOWED_CHARACTERS:
+            if digit not in SELCAL_LETTER_SET:
                 raise ValueError(f'Character "{digit}" is not valid as a SelCal digit.')
 
             # Check character has not been used already
-            if digit in occurrenceesList:
+            if digit in occurrences:
                 raise ValueError(f'Character "{digit}" already occurred in your SelCal code. Digits must be unique.')
 
-            occurrenceesList.append(digit)
+            occurrences.add(digit)
 
         def assertOrderInPart(firstDigit: str, secondDigit: str):
             if firstDigit > secondDigit:
@@ -103,9 +100,7 @@ class SelCalCode:
         return f'{self.getFirstPart()}{delimiter}{self.getSecondPart()}'
 
     def fromJsonObject(jsonObject: dict):
-        return SelCalCode(
-            text=f"{jsonObject['digit1']}{jsonObject['digit2']}{jsonObject['digit3']}{jsonObject['digit4']}"
-        )
+        return SELCAL_CODE_SCHEMA.loadRoot(jsonObject)
 
 
 @dataclass(init=False)
@@ -127,14 +122,12 @@ class Callsign:
 
         # Check airline code
         airlineIcaoCode = transformedText[0:3]
-        ICAO_AIRLINE_CODE_REGEX = r"^[A-Z]{3}$"
-        if not re.match(ICAO_AIRLINE_CODE_REGEX, airlineIcaoCode):
+        if not ICAO_AIRLINE_CODE_PATTERN.match(airlineIcaoCode):
             raise ValueError(f'Sequence "{airlineIcaoCode}" is not a valid ICAO airline code.')
 
         # Check flight number
         flightNumber = transformedText[3:]
-        FLIGHT_NUMBER_REGEX = r"^[1-9]+[0-9]*[A-Z]*$"
-        if not re.match(FLIGHT_NUMBER_REGEX, flightNumber):
+        if not FLIGHT_NUMBER_PATTERN.match(flightNumber):
             raise ValueError(f'Sequence "{flightNumber}" is not a valid flight number.')
 
         self.airlineIcaoCode = airlineIcaoCode
@@ -144,9 +137,7 @@ class Callsign:
         return f'{self.airlineIcaoCode}{delimiter}{self.flightNumber}'
 
     def fromJsonObject(jsonObject: dict):
-        return Callsign(
-            text=f"{jsonObject['airlineIcaoCode']}{jsonObject['flightNumber']}"
-        )
+        return CALLSIGN_SCHEMA.loadRoot(jsonObject)
 
 
 @dataclass()
@@ -159,11 +150,40 @@ class RgbColor:
         return (self.r, self.g, self.b)
 
     def fromJsonObject(jsonObject: dict):
-        return RgbColor(
-            r=jsonObject['r'],
-            g=jsonObject['g'],
-            b=jsonObject['b']
-        )
+        return RGB_COLOR_SCHEMA.loadRoot(jsonObject)
+
+
+@dataclass()
+class Outline:
+    color: RgbColor
+    width: int = 2
+
+    def fromJsonObject(jsonObject: dict):
+        return OUTLINE_SCHEMA.loadRoot(jsonObject)
+
+
+@dataclass()
+class Shadow:
+    color: RgbColor
+    offsetX: int = 2
+    offsetY: int = 2
+    blur: int = 0
+    opacity: float = 0.6
+
+    def fromJsonObject(jsonObject: dict):
+        return SHADOW_SCHEMA.loadRoot(jsonObject)
+
+
+@dataclass()
+class Plate:
+    # A translucent box behind the whole patch, padding extends it beyond the patch rectangle
+    color: RgbColor
+    opacity: float = 0.5
+    cornerRadius: int = 0
+    padding: int = 0
+
+    def fromJsonObject(jsonObject: dict):
+        return PLATE_SCHEMA.loadRoot(jsonObject)
 
 
 @dataclass()
@@ -173,13 +193,19 @@ class TextStyle:
     textColor: RgbColor
     position: Position
 
+    # Auto-fit: the font shrinks down to minFontSize (half of fontSize by default) until the text fits into
+    # maxWidth, or into the patch if no maxWidth is given. With wrap, words are broken onto further lines first.
+    maxWidth: int = None
+    minFontSize: int = None
+    wrap: bool = False
+    lineSpacing: int = 0
+
+    # Effects are drawn into the patch overlay beneath the text, see composer.py
+    outline: Outline = None
+    shadow: Shadow = None
+
     def fromJsonObject(jsonObject: dict):
-        return TextStyle(
-            fontName=jsonObject['fontName'],
-            fontSize=jsonObject['fontSize'],
-            textColor=RgbColor.fromJsonObject(jsonObject['textColor']),
-            position=Position.fromJsonObject(jsonObject['position'])
-        )
+        return TEXT_STYLE_SCHEMA.loadRoot(jsonObject)
 
 
 @dataclass()
@@ -187,11 +213,11 @@ class Description:
     text: str
     style: TextStyle
 
+    # Name of a data source that keeps the text up to date while resident, see datasources.py
+    source: str = None
+
     def fromJsonObject(jsonObject: dict):
-        return Description(
-            text=jsonObject['text'],
-            style=TextStyle.fromJsonObject(jsonObject['style'])
-        )
+        return DESCRIPTION_SCHEMA.loadRoot(jsonObject)
 
 @dataclass()
 class FlightPatch:
@@ -208,6 +234,8 @@ class FlightPatch:
 
     descriptions: [Description]
 
+    plate: Plate = None
+
     def toJson(self, indent=4) -> str:
 
         def custom_asdict_factory(data):
@@ -221,18 +249,7 @@ class FlightPatch:
         return json.dumps(asdict(self, dict_factory=custom_asdict_factory), indent=indent)
 
     def fromJsonObject(jsonObject: dict):
-        descriptions = [Description.fromJsonObject(element) for element in jsonObject['descriptions']]
-
-        return FlightPatch(
-            rectangle=Rectangle.fromJsonObject(jsonObject['rectangle']),
-            aircraftRegistration=jsonObject['aircraftRegistration'],
-            aircraftRegistrationStyle=TextStyle.fromJsonObject(jsonObject['aircraftRegistrationStyle']),
-            selCalCode=SelCalCode.fromJsonObject(jsonObject['selCalCode']),
-            selCalCodeStyle=TextStyle.fromJsonObject(jsonObject['selCalCodeStyle']),
-            callsign=Callsign.fromJsonObject(jsonObject['callsign']),
-            callsignStyle=TextStyle.fromJsonObject(jsonObject['callsignStyle']),
-            descriptions=descriptions
-        )
+        return FLIGHT_PATCH_SCHEMA.loadRoot(jsonObject)
 
     def fromFile(path: str):
         file = open(path)
@@ -247,81 +264,98 @@ class FlightPatch:
         file.close()
 
 
-class FlightPatchComposer:
-
-    def __init__(self, backgroundImagePath: str):
-        self.__backgroundImagePath = backgroundImagePath
-        self.__image = Image.open(backgroundImagePath)
-
-    def composePatch(self, patch: FlightPatch, registration=True, selCalCode=True, callsign=True, descriptions=True) -> Image:
-
-        if registration:
-            # Draw Aircraft Registration
-            self._drawText(patch.aircraftRegistration, patch.aircraftRegistrationStyle, patch.rectangle)
-
-        if selCalCode:
-            # Draw SelCal Code
-            self._drawText(patch.selCalCode.getFullCode(), patch.selCalCodeStyle, patch.rectangle)
-
-        if callsign:
-            # Draw Callsign
-            self._drawText(patch.callsign.getFullValue(), patch.callsignStyle, patch.rectangle)
-
-        if descriptions:
-            # Draw Description Labels
-            for description in patch.descriptions:
-                self._drawText(description.text, description.style, patch.rectangle)
-
-        return self.__image
-
-    def _calculateAbsolutePositionForItem(self, rectange: Rectangle, position: Position, width: int, height: int) -> (int, int):
-        x = -1
-        y = -1
-
-        # Y
-        if position.verticalReference == VerticalReference.Top:
-            # Top
-            y = rectange.y + position.verticalOffset
-        elif position.verticalReference == VerticalReference.Bottom:
-            # Bottom
-            y = rectange.y + rectange.height - height + position.verticalOffset
-        else:
-            y = -1
-
-        # X
-        if position.horizontalReference == HorizontalReference.Left:
-            # Left
-            x = rectange.x + position.horizontalOffset
-        elif position.horizontalReference == HorizontalReference.Right:
-            # Right
-            x = rectange.x + rectange.width - width + position.horizontalOffset
-        else:
-            x = -1
-
-        return (x, y)
-
-    def _drawText(self, text: str, style: TextStyle, rectange: Rectangle):
-        draw = ImageDraw.Draw(self.__image)
-        font = ImageFont.truetype(style.fontName, style.fontSize)
-        w, h = draw.textsize(text=text, font=font)
-        x, y = self._calculateAbsolutePositionForItem(
-            rectange=rectange,
-            position=style.position,
-            width=w,
-            height=h
-        )
-        draw.text((x, y), text, style.textColor.asTuple(), font=font)
-
-    def getImage(self) -> Image:
-        return self.__image
-
-
-if __name__ == '__main__':
-    backgroundImagePath = 'C:\\Users\\thors\\Desktop\\msfs_2020_flat_panel_background_airbus_a320.png'
-
-    patch = FlightPatch.fromFile('themes/a320/patch.json')
-
-    composer = FlightPatchComposer(backgroundImagePath)
-    image = composer.composePatch(patch)
-    image.show()
-    #image.save('test.png', 'PNG')
+# Schemas validate a whole JSON tree in one pass and report every problem with its JSON path
+POSITION_SCHEMA = Record(Position, {
+    'verticalReference': EnumValue(VerticalReference),
+    'verticalOffset': Value(int),
+    'horizontalReference': EnumValue(HorizontalReference),
+    'horizontalOffset': Value(int)
+})
+
+RECTANGLE_SCHEMA = Record(Rectangle, {
+    'x': Value(int),
+    'y': Value(int),
+    'width': Value(int),
+    'height': Value(int)
+})
+
+SELCAL_CODE_SCHEMA = Record(
+    lambda digit1, digit2, digit3, digit4: SelCalCode(text=f'{digit1}{digit2}{digit3}{digit4}'),
+    {
+        'digit1': Value(str),
+        'digit2': Value(str),
+        'digit3': Value(str),
+        'digit4': Value(str)
+    }
+)
+
+CALLSIGN_SCHEMA = Record(
+    lambda airlineIcaoCode, flightNumber: Callsign(text=f'{airlineIcaoCode}{flightNumber}'),
+    {
+        'airlineIcaoCode': Value(str),
+        'flightNumber': Value(str)
+    }
+)
+
+RGB_COLOR_SCHEMA = Record(RgbColor, {
+    'r': Value(int),
+    'g': Value(int),
+    'b': Value(int)
+})
+
+OUTLINE_SCHEMA = Record(Outline, {
+    'color': RGB_COLOR_SCHEMA
+}, optional={
+    'width': (Value(int), 2)
+})
+
+SHADOW_SCHEMA = Record(Shadow, {
+    'color': RGB_COLOR_SCHEMA
+}, optional={
+    'offsetX': (Value(int), 2),
+    'offsetY': (Value(int), 2),
+    'blur': (Value(int), 0),
+    'opacity': (Value(int, float), 0.6)
+})
+
+PLATE_SCHEMA = Record(Plate, {
+    'color': RGB_COLOR_SCHEMA
+}, optional={
+    'opacity': (Value(int, float), 0.5),
+    'cornerRadius': (Value(int), 0),
+    'padding': (Value(int), 0)
+})
+
+TEXT_STYLE_SCHEMA = Record(TextStyle, {
+    'fontName': Value(str),
+    'fontSize': Value(int),
+    'textColor': RGB_COLOR_SCHEMA,
+    'position': POSITION_SCHEMA
+}, optional={
+    'maxWidth': (Value(int, type(None)), None),
+    'minFontSize': (Value(int, type(None)), None),
+    'wrap': (Value(bool), False),
+    'lineSpacing': (Value(int), 0),
+    'outline': (Nullable(OUTLINE_SCHEMA), None),
+    'shadow': (Nullable(SHADOW_SCHEMA), None)
+})
+
+DESCRIPTION_SCHEMA = Record(Description, {
+    'text': Value(str),
+    'style': TEXT_STYLE_SCHEMA
+}, optional={
+    'source': (Value(str, type(None)), None)
+})
+
+FLIGHT_PATCH_SCHEMA = Record(FlightPatch, {
+    'rectangle': RECTANGLE_SCHEMA,
+    'aircraftRegistration': Value(str),
+    'aircraftRegistrationStyle': TEXT_STYLE_SCHEMA,
+    'selCalCode': SELCAL_CODE_SCHEMA,
+    'selCalCodeStyle': TEXT_STYLE_SCHEMA,
+    'callsign': CALLSIGN_SCHEMA,
+    'callsignStyle': TEXT_STYLE_SCHEMA,
+    'descriptions': ListOf(DESCRIPTION_SCHEMA)
+}, optional={
+    'plate': (Nullable(PLATE_SCHEMA), None)
+})
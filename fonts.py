@@ -0,0 +1,140 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import ImageFont
+
+
+def resolveFontPath(fontName: str) -> str:
+    # Mirrors the lookup PIL does for ImageFont.truetype on Windows
+    if os.path.isfile(fontName):
+        return os.path.abspath(fontName)
+
+    windowsDir = os.environ.get('WINDIR')
+    if windowsDir:
+        for directory in [os.path.join(windowsDir, 'fonts'),
+                          os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft', 'Windows', 'Fonts')]:
+            path = os.path.join(directory, fontName)
+            if os.path.isfile(path):
+                return path
+
+    return None
+
+
+class FontRegistry:
+
+    def __init__(self, maxFonts: int = 32, maxMeasurements: int = 4096):
+        self.__maxFonts = maxFonts
+        self.__maxMeasurements = maxMeasurements
+        self.__fonts = OrderedDict()
+        self.__measurements = OrderedDict()
+        self.__lineHeights = OrderedDict()
+        self.__fontData = {}
+        self.__resolvedPaths = {}
+        self.__lock = threading.Lock()
+        self.loads = 0
+
+    def __fontKey(self, fontName: str, fontSize: int) -> (str, int):
+        path = self.__resolvedPaths.get(fontName)
+        if path is None:
+            path = resolveFontPath(fontName) or fontName
+            self.__resolvedPaths[fontName] = path
+        return (path, fontSize)
+
+    def getFont(self, fontName: str, fontSize: int) -> 'ImageFont.FreeTypeFont':
+        key = self.__fontKey(fontName, fontSize)
+
+        with self.__lock:
+            font = self.__fonts.get(key)
+            if font is not None:
+                self.__fonts.move_to_end(key)
+                return font
+
+        from PIL import ImageFont
+        data = self.__readFontData(key[0])
+        font = ImageFont.truetype(io.BytesIO(data) if data is not None else key[0], key[1])
+
+        with self.__lock:
+            self.loads += 1
+            self.__fonts[key] = font
+            while len(self.__fonts) > self.__maxFonts:
+                self.__fonts.popitem(last=False)
+
+            # A file is kept as long as one of its sizes is, so the data is bounded by the loaded fonts
+            loadedPaths = {path for path, _ in self.__fonts}
+            for path in [path for path in self.__fontData if path not in loadedPaths]:
+                del self.__fontData[path]
+
+        return font
+
+    def __readFontData(self, path: str) -> bytes:
+        # Fitting a text tries several sizes of the same font, the file itself is only read once
+        with self.__lock:
+            data = self.__fontData.get(path)
+        if data is None:
+            if not os.path.isfile(path):
+                # Left to PIL's own lookup
+                return None
+            file = open(path, 'rb')
+            data = file.read()
+            file.close()
+            with self.__lock:
+                self.__fontData[path] = data
+        return data
+
+    def getTextBox(self, fontName: str, fontSize: int, text: str) -> (int, int, int, int):
+        key = (self.__fontKey(fontName, fontSize), text)
+
+        with self.__lock:
+            box = self.__measurements.get(key)
+            if box is not None:
+                self.__measurements.move_to_end(key)
+                return box
+
+        # Same result as ImageDraw.textbbox at the origin, without creating a drawing context
+        box = self.getFont(fontName, fontSize).getbbox(text)
+
+        with self.__lock:
+            self.__measurements[key] = box
+            while len(self.__measurements) > self.__maxMeasurements:
+                self.__measurements.popitem(last=False)
+
+        return box
+
+    def measureText(self, fontName: str, fontSize: int, text: str) -> (int, int):
+        # Width and height including the bearing offsets, as the removed ImageDraw.textsize reported them
+        _, _, right, bottom = self.getTextBox(fontName, fontSize, text)
+        return (right, bottom)
+
+    def getLineHeight(self, fontName: str, fontSize: int) -> int:
+        key = self.__fontKey(fontName, fontSize)
+
+        with self.__lock:
+            lineHeight = self.__lineHeights.get(key)
+            if lineHeight is not None:
+                self.__lineHeights.move_to_end(key)
+                return lineHeight
+
+        ascent, descent = self.getFont(fontName, fontSize).getmetrics()
+        lineHeight = ascent + descent
+
+        with self.__lock:
+            self.__lineHeights[key] = lineHeight
+            while len(self.__lineHeights) > self.__maxMeasurements:
+                self.__lineHeights.popitem(last=False)
+
+        return lineHeight
+
+    def clear(self):
+        with self.__lock:
+            self.__fonts.clear()
+            self.__measurements.clear()
+            self.__lineHeights.clear()
+            self.__fontData.clear()
+            self.__resolvedPaths.clear()
+
+
+fontRegistry = FontRegistry()
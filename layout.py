@@ -0,0 +1,204 @@
+from dataclasses import dataclass
+
+from flightpatch import FlightPatch, TextStyle, Rectangle, Position, VerticalReference, HorizontalReference
+from fonts import fontRegistry
+
+
+@dataclass()
+class PatchItem:
+    # One line of text, positioned in background coordinates with the font size it was fitted to
+    text: str
+    style: TextStyle
+    fontSize: int
+    x: int
+    y: int
+    box: (int, int, int, int)
+    label: str
+
+
+@dataclass()
+class LayoutProblem:
+    label: str
+    message: str
+
+
+@dataclass()
+class _Block:
+    lines: [str]
+    lineWidths: [int]
+    width: int
+    height: int
+
+
+def calculateAbsolutePosition(rectangle: Rectangle, position: Position, width: int, height: int) -> (int, int):
+    x = -1
+    y = -1
+
+    # Y
+    if position.verticalReference == VerticalReference.Top:
+        y = rectangle.y + position.verticalOffset
+    elif position.verticalReference == VerticalReference.Bottom:
+        y = rectangle.y + rectangle.height - height + position.verticalOffset
+    elif position.verticalReference == VerticalReference.Center:
+        y = rectangle.y + (rectangle.height - height) // 2 + position.verticalOffset
+
+    # X
+    if position.horizontalReference == HorizontalReference.Left:
+        x = rectangle.x + position.horizontalOffset
+    elif position.horizontalReference == HorizontalReference.Right:
+        x = rectangle.x + rectangle.width - width + position.horizontalOffset
+    elif position.horizontalReference == HorizontalReference.Center:
+        x = rectangle.x + (rectangle.width - width) // 2 + position.horizontalOffset
+
+    return (x, y)
+
+
+def availableSize(rectangle: Rectangle, style: TextStyle) -> (int, int):
+    # The space between the anchor and the opposite edge of the patch, centered items keep the margin on both sides
+    position = style.position
+    horizontalMargins = 2 if position.horizontalReference == HorizontalReference.Center else 1
+    verticalMargins = 2 if position.verticalReference == VerticalReference.Center else 1
+
+    width = rectangle.width - horizontalMargins * abs(position.horizontalOffset)
+    height = rectangle.height - verticalMargins * abs(position.verticalOffset)
+    if style.maxWidth is not None:
+        width = style.maxWidth
+
+    return (width, height)
+
+
+def wrapLines(text: str, fontName: str, fontSize: int, maxWidth: int) -> [str]:
+    # Greedy word wrap, a single word wider than maxWidth keeps a line of its own
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for word in paragraph.split():
+            candidate = f'{line} {word}' if line else word
+            if line and fontRegistry.getTextBox(fontName, fontSize, candidate)[2] > maxWidth:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _measureBlock(text: str, style: TextStyle, fontSize: int, maxWidth: int) -> _Block:
+    if style.wrap:
+        lines = wrapLines(text, style.fontName, fontSize, maxWidth)
+    else:
+        lines = text.split('\n')
+
+    boxes = [fontRegistry.getTextBox(style.fontName, fontSize, line) for line in lines]
+    lineWidths = [box[2] for box in boxes]
+
+    # A single line keeps the extent ImageDraw.textsize used to report, so existing patches do not move
+    height = boxes[-1][3]
+    if len(lines) > 1:
+        height += (len(lines) - 1) * (fontRegistry.getLineHeight(style.fontName, fontSize) + style.lineSpacing)
+
+    return _Block(lines=lines, lineWidths=lineWidths, width=max(lineWidths), height=height)
+
+
+def fitFontSize(text: str, style: TextStyle, width: int, height: int) -> (int, _Block):
+    # Text extents grow with the font size, so the largest size that fits is found by a binary search
+    # over cached metrics. Below minFontSize the text is left overflowing and reported instead.
+    def fits(block: _Block) -> bool:
+        return block.width <= width and block.height <= height
+
+    block = _measureBlock(text, style, style.fontSize, width)
+    if fits(block):
+        return (style.fontSize, block)
+
+    minFontSize = style.minFontSize if style.minFontSize is not None else max(1, style.fontSize // 2)
+    low = min(minFontSize, style.fontSize)
+    high = style.fontSize - 1
+
+    bestSize = low
+    bestBlock = _measureBlock(text, style, low, width)
+    low += 1
+
+    while low <= high:
+        size = (low + high) // 2
+        candidate = _measureBlock(text, style, size, width)
+        if fits(candidate):
+            bestSize, bestBlock = size, candidate
+            low = size + 1
+        else:
+            high = size - 1
+
+    return (bestSize, bestBlock)
+
+
+def layoutText(text: str, style: TextStyle, rectangle: Rectangle, label: str) -> [PatchItem]:
+    width, height = availableSize(rectangle, style)
+    fontSize, block = fitFontSize(text, style, width, height)
+    blockX, blockY = calculateAbsolutePosition(rectangle, style.position, block.width, block.height)
+
+    items = []
+    lineHeight = fontRegistry.getLineHeight(style.fontName, fontSize) + style.lineSpacing if len(block.lines) > 1 else 0
+    for i, line in enumerate(block.lines):
+        # Lines are aligned within the block the same way the block is aligned within the patch
+        x = blockX
+        if style.position.horizontalReference == HorizontalReference.Right:
+            x = blockX + block.width - block.lineWidths[i]
+        elif style.position.horizontalReference == HorizontalReference.Center:
+            x = blockX + (block.width - block.lineWidths[i]) // 2
+        y = blockY + i * lineHeight
+
+        left, top, right, bottom = fontRegistry.getTextBox(style.fontName, fontSize, line)
+        items.append(PatchItem(text=line, style=style, fontSize=fontSize, x=x, y=y,
+                               box=(x + left, y + top, x + right, y + bottom), label=label))
+
+    return items
+
+
+def layoutPatch(patch: FlightPatch, registration=True, selCalCode=True, callsign=True, descriptions=True) -> [PatchItem]:
+    items = []
+
+    if registration:
+        # Aircraft Registration
+        items += layoutText(patch.aircraftRegistration, patch.aircraftRegistrationStyle, patch.rectangle, 'aircraftRegistration')
+
+    if selCalCode:
+        # SelCal Code
+        items += layoutText(patch.selCalCode.getFullCode(), patch.selCalCodeStyle, patch.rectangle, 'selCalCode')
+
+    if callsign:
+        # Callsign
+        items += layoutText(patch.callsign.getFullValue(), patch.callsignStyle, patch.rectangle, 'callsign')
+
+    if descriptions:
+        # Description Labels
+        for i, description in enumerate(patch.descriptions):
+            items += layoutText(description.text, description.style, patch.rectangle, f'descriptions[{i}]')
+
+    return items
+
+
+def findLayoutProblems(patch: FlightPatch, items: [PatchItem]) -> [LayoutProblem]:
+    # Works on the laid out boxes only, nothing has to be rasterized
+    problems = []
+    rectangle = patch.rectangle
+    right = rectangle.x + rectangle.width
+    bottom = rectangle.y + rectangle.height
+
+    overflowing = set()
+    for item in items:
+        box = item.box
+        if item.label not in overflowing and (box[0] < rectangle.x or box[1] < rectangle.y or box[2] > right or box[3] > bottom):
+            overflowing.add(item.label)
+            problems.append(LayoutProblem(item.label, f'does not fit into the patch at font size {item.fontSize}'))
+
+    overlapping = set()
+    for i, first in enumerate(items):
+        for second in items[i + 1:]:
+            pair = (first.label, second.label)
+            if first.label == second.label or pair in overlapping:
+                continue
+
+            if first.box[0] < second.box[2] and second.box[0] < first.box[2] and first.box[1] < second.box[3] and second.box[1] < first.box[3]:
+                overlapping.add(pair)
+                problems.append(LayoutProblem(first.label, f'overlaps {second.label}'))
+
+    return problems
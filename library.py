@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+from dataclasses import dataclass, asdict
+
+
+@dataclass()
+class LibraryEntry:
+    path: str
+    mtime: int
+    size: int
+    manufacturer: str
+    aircraftType: str
+    typeDesignatorIcao: str
+
+    def fromJsonObject(jsonObject: dict):
+        return LibraryEntry(**jsonObject)
+
+
+@dataclass()
+class LibraryFailure:
+    # A file that could not be read as a config, it is only tried again once its mtime or size changes
+    path: str
+    mtime: int
+    size: int
+    error: str
+
+    def fromJsonObject(jsonObject: dict):
+        return LibraryFailure(**jsonObject)
+
+
+class ConfigLibrary:
+
+    def __init__(self, directory: str = 'configs', indexPath: str = '.tmp/config_index.json'):
+        self.__directory = directory
+        self.__indexPath = indexPath
+        self.__entries, self.__failures = self.__loadIndex()
+        self.__buildLookups()
+
+    def __loadIndex(self) -> (dict, dict):
+        try:
+            file = open(self.__indexPath)
+            index = json.load(file)
+            file.close()
+        except (OSError, ValueError):
+            return ({}, {})
+
+        if index.get('directory') != os.path.abspath(self.__directory):
+            return ({}, {})
+
+        try:
+            entries = {path: LibraryEntry.fromJsonObject(entry) for path, entry in index['entries'].items()}
+            failures = {path: LibraryFailure.fromJsonObject(failure) for path, failure in index.get('failures', {}).items()}
+        except (KeyError, TypeError):
+            return ({}, {})
+        return (entries, failures)
+
+    def __saveIndex(self):
+        os.makedirs(os.path.dirname(self.__indexPath) or '.', exist_ok=True)
+        temporaryPath = f'{self.__indexPath}.tmp'
+        file = open(temporaryPath, 'w')
+        json.dump({
+            'directory': os.path.abspath(self.__directory),
+            'entries': {path: asdict(entry) for path, entry in self.__entries.items()},
+            'failures': {path: asdict(failure) for path, failure in self.__failures.items()}
+        }, file, indent=4)
+        file.close()
+        os.replace(temporaryPath, self.__indexPath)
+
+    def __buildLookups(self):
+        self.__byIcao = {}
+        self.__byAircraftType = {}
+        self.__byManufacturer = {}
+
+        for entry in sorted(self.__entries.values(), key=lambda entry: entry.path):
+            self.__byIcao.setdefault(entry.typeDesignatorIcao.upper(), []).append(entry)
+            self.__byAircraftType.setdefault(entry.aircraftType.upper(), []).append(entry)
+            self.__byManufacturer.setdefault(entry.manufacturer.upper(), []).append(entry)
+
+    def __readEntry(self, path: str, stat: os.stat_result) -> LibraryEntry:
+        file = open(path)
+        jsonObject = json.load(file)
+        file.close()
+
+        if not isinstance(jsonObject, dict):
+            raise ValueError(f'expected a JSON object, got {type(jsonObject).__name__}')
+
+        return LibraryEntry(
+            path=path,
+            mtime=stat.st_mtime_ns,
+            size=stat.st_size,
+            manufacturer=str(jsonObject['manufacturer']),
+            aircraftType=str(jsonObject['aircraftType']),
+            typeDesignatorIcao=str(jsonObject['typeDesignatorIcao'])
+        )
+
+    def refresh(self) -> int:
+        # Only files whose mtime or size changed are opened again, returns the number of updated entries.
+        # Files that failed are reported once and skipped silently until they change.
+        entries = {}
+        failures = {}
+        updated = 0
+
+        for dirEntry in os.scandir(self.__directory):
+            if not dirEntry.is_file() or not dirEntry.name.lower().endswith('.json'):
+                continue
+
+            path = os.path.join(self.__directory, dirEntry.name)
+            stat = dirEntry.stat()
+            known = self.__entries.get(path)
+
+            if known is not None and known.mtime == stat.st_mtime_ns and known.size == stat.st_size:
+                entries[path] = known
+                continue
+
+            failure = self.__failures.get(path)
+            if failure is not None and failure.mtime == stat.st_mtime_ns and failure.size == stat.st_size:
+                failures[path] = failure
+                continue
+
+            try:
+                entries[path] = self.__readEntry(path, stat)
+                updated += 1
+            except (OSError, ValueError, KeyError) as e:
+                print(f'Skipping {path}: {e}', file=sys.stderr)
+                failures[path] = LibraryFailure(path=path, mtime=stat.st_mtime_ns, size=stat.st_size, error=str(e))
+
+        removed = len(set(self.__entries) - set(entries))
+        if updated or removed or failures != self.__failures or not os.path.isfile(self.__indexPath):
+            self.__entries = entries
+            self.__failures = failures
+            self.__buildLookups()
+            self.__saveIndex()
+
+        return updated + removed
+
+    def getEntries(self) -> [LibraryEntry]:
+        return sorted(self.__entries.values(), key=lambda entry: (entry.manufacturer, entry.aircraftType, entry.path))
+
+    def find(self, query: str) -> [LibraryEntry]:
+        # ICAO type designator first, then aircraft type, then manufacturer
+        key = query.strip().upper()
+        for lookup in [self.__byIcao, self.__byAircraftType, self.__byManufacturer]:
+            if key in lookup:
+                return list(lookup[key])
+        return []
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from flightpatch import FlightPatch
+from fonts import resolveFontPath
+
+
+class RenderCache:
+
+    def __init__(self, directory: str = '.tmp/render_cache', maxBytes: int = 512 * 1024 * 1024, maxAge: float = 30 * 24 * 3600):
+        self.__directory = directory
+        self.__indexPath = os.path.join(directory, 'index.json')
+        self.__maxBytes = maxBytes
+        self.__maxAge = maxAge
+        self.__index = self.__loadIndex()
+
+    def __loadIndex(self) -> dict:
+        try:
+            file = open(self.__indexPath)
+            index = json.load(file)
+            file.close()
+        except (OSError, ValueError):
+            index = {}
+
+        index.setdefault('entries', {})
+        index.setdefault('files', {})
+        index.setdefault('hits', 0)
+        index.setdefault('misses', 0)
+        return index
+
+    def __saveIndex(self):
+        os.makedirs(self.__directory, exist_ok=True)
+        temporaryPath = f'{self.__indexPath}.tmp'
+        file = open(temporaryPath, 'w')
+        json.dump(self.__index, file)
+        file.close()
+        os.replace(temporaryPath, self.__indexPath)
+
+    def __fileDigest(self, path: str) -> str:
+        # Hashes are remembered by (mtime, size) so unchanged files are not read again
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.__index['files'].get(path)
+        if known and known['mtime'] == stat.st_mtime_ns and known['size'] == stat.st_size:
+            return known['sha256']
+
+        digest = hashlib.sha256()
+        file = open(path, 'rb')
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+        file.close()
+
+        self.__index['files'][path] = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': digest.hexdigest()
+        }
+        return digest.hexdigest()
+
+    def keyFor(self, backgroundImagePath: str, patch: FlightPatch, registration=True, selCalCode=True, callsign=True, descriptions=True, variant: str = '') -> str:
+        digest = hashlib.sha256()
+        digest.update(self.__fileDigest(backgroundImagePath).encode())
+        digest.update(patch.toJson(indent=None).encode())
+        digest.update(f'{registration}|{selCalCode}|{callsign}|{descriptions}|{variant}'.encode())
+
+        fontNames = sorted({
+            patch.aircraftRegistrationStyle.fontName,
+            patch.selCalCodeStyle.fontName,
+            patch.callsignStyle.fontName
+        } | {description.style.fontName for description in patch.descriptions})
+
+        for fontName in fontNames:
+            fontPath = resolveFontPath(fontName)
+            if fontPath is None:
+                digest.update(f'{fontName}:missing'.encode())
+            else:
+                digest.update(f'{fontName}:{self.__fileDigest(fontPath)}'.encode())
+
+        return digest.hexdigest()
+
+    def lookup(self, key: str, destination: str) -> str:
+        # Returns the destination path (with the cached file's extension) on a hit, None on a miss
+        entry = self.__index['entries'].get(key)
+        path = os.path.join(self.__directory, entry['file']) if entry else None
+
+        if entry is None or not os.path.isfile(path) or time.time() - entry['created'] > self.__maxAge:
+            self.__index['misses'] += 1
+            self.__saveIndex()
+            return None
+
+        destination = os.path.splitext(destination)[0] + os.path.splitext(entry['file'])[1]
+        shutil.copyfile(path, destination)
+        entry['lastUsed'] = time.time()
+        self.__index['hits'] += 1
+        self.__saveIndex()
+        return destination
+
+    def store(self, key: str, source: str):
+        os.makedirs(self.__directory, exist_ok=True)
+        fileName = f'{key}{os.path.splitext(source)[1]}'
+        shutil.copyfile(source, os.path.join(self.__directory, fileName))
+
+        now = time.time()
+        self.__index['entries'][key] = {
+            'file': fileName,
+            'size': os.path.getsize(source),
+            'created': now,
+            'lastUsed': now
+        }
+        self.evict()
+
+    def evict(self):
+        entries = self.__index['entries']
+        now = time.time()
+
+        # Drop expired entries first, then least recently used ones until the size limit holds
+        expired = [key for key, entry in entries.items() if now - entry['created'] > self.__maxAge]
+        byLastUse = sorted((key for key in entries if key not in expired), key=lambda key: entries[key]['lastUsed'])
+
+        totalSize = sum(entries[key]['size'] for key in byLastUse)
+        while byLastUse and totalSize > self.__maxBytes:
+            key = byLastUse.pop(0)
+            totalSize -= entries[key]['size']
+            expired.append(key)
+
+        for key in expired:
+            entry = entries.pop(key)
+            try:
+                os.remove(os.path.join(self.__directory, entry['file']))
+            except OSError:
+                pass
+
+        self.__saveIndex()
+
+    def clear(self):
+        for entry in self.__index['entries'].values():
+            try:
+                os.remove(os.path.join(self.__directory, entry['file']))
+            except OSError:
+                pass
+
+        self.__index['entries'] = {}
+        self.__saveIndex()
+
+    def getStats(self) -> (int, int):
+        return (self.__index['hits'], self.__index['misses'])
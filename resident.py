@@ -0,0 +1,192 @@
+import asyncio
+import os
+import signal
+import sys
+
+from filewatch import createFileWatcher
+
+
+class ResidentMode:
+
+    def __init__(self, app, configFile: str, debounceSeconds: float = 0.15):
+        self.__app = app
+        self.__configFile = os.path.abspath(configFile)
+        self.__debounceSeconds = debounceSeconds
+
+        self.__loop = None
+        self.__stopped = None
+        self.__watcher = None
+        self.__pendingChanges = set()
+        self.__reloadHandle = None
+        self.__scheduler = None
+
+    def run(self):
+        # Returns once a shutdown was requested (SIGINT/Ctrl-C)
+        try:
+            asyncio.run(self.__main())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.__watcher is not None:
+                self.__watcher.stop()
+
+    def stop(self):
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__stopped.set)
+
+    async def __main(self):
+        self.__loop = asyncio.get_running_loop()
+        self.__stopped = asyncio.Event()
+
+        try:
+            self.__loop.add_signal_handler(signal.SIGINT, self.__stopped.set)
+        except NotImplementedError:
+            # Windows: Ctrl-C surfaces as KeyboardInterrupt from asyncio.run instead
+            pass
+
+        self.__restartWatcher()
+        self.__restartScheduler()
+
+        controlServer = None
+        controlPort = None
+        if self.__app.controlPort:
+            from controlapi import ControlServer
+            controlServer = ControlServer(self.__app, self, self.__app.controlPort)
+            if await controlServer.start():
+                controlPort = self.__app.controlPort
+
+        instanceLock = self.__app.instanceLock
+        if instanceLock is not None:
+            # Later invocations of --load and --restore hand over to this process from now on
+            instanceLock.publish(controlPort, controlServer.token if controlPort else None)
+
+        try:
+            await self.__stopped.wait()
+        finally:
+            if instanceLock is not None:
+                instanceLock.withdraw()
+            if self.__scheduler is not None:
+                self.__scheduler.stop()
+            if controlServer is not None:
+                await controlServer.stop()
+
+    def loadConfig(self, configFile: str):
+        # Handed over by a later --load. Fonts, backgrounds and renders this process has cached are reused.
+        configFile = os.path.abspath(configFile)
+        if configFile != self.__configFile:
+            # Set for the previous aircraft
+            self.__app.patchOverrides = {}
+        self.__configFile = configFile
+
+        if self.__reloadHandle is not None:
+            self.__reloadHandle.cancel()
+            self.__reloadHandle = None
+        self.__pendingChanges = set()
+
+        self.__app.reloadConfig(configFile)
+        self.__restartWatcher()
+        self.__restartScheduler()
+
+    def __watchedPaths(self) -> [str]:
+        # The config file first, then every background it uses
+        config = self.__app.config
+        backgrounds = [config.backgroundImage] + [display.backgroundImage for display in config.displays or []]
+        return [self.__configFile] + [os.path.abspath(background) for background in dict.fromkeys(backgrounds)]
+
+    def __restartWatcher(self):
+        if self.__watcher is not None:
+            self.__watcher.stop()
+
+        self.__watcher = createFileWatcher(self.__watchedPaths(), self.__onFilesChangedThreadsafe)
+        self.__watcher.start()
+
+    def __restartScheduler(self):
+        if self.__scheduler is not None:
+            self.__scheduler.stop()
+            self.__scheduler = None
+
+        liveFields = self.__app.liveFields
+        if liveFields is not None and liveFields.sources:
+            self.__scheduler = RefreshScheduler(self.__loop, liveFields, lambda: self.__app.refreshPanel(useCache=False),
+                                                self.__app.config.liveRefreshSeconds)
+            self.__scheduler.start()
+
+    def __onFilesChangedThreadsafe(self, paths: [str]):
+        self.__loop.call_soon_threadsafe(self.__onFilesChanged, paths)
+
+    def __onFilesChanged(self, paths: [str]):
+        # Editors tend to write a file several times in a row, so changes are coalesced briefly
+        self.__pendingChanges.update(paths)
+        if self.__reloadHandle is not None:
+            self.__reloadHandle.cancel()
+        self.__reloadHandle = self.__loop.call_later(self.__debounceSeconds, self.__reload)
+
+    def __reload(self):
+        changes = self.__pendingChanges
+        self.__pendingChanges = set()
+        self.__reloadHandle = None
+
+        watchedBefore = self.__watchedPaths()
+        backgroundChanged = any(path in changes for path in watchedBefore[1:])
+
+        self.__app.reloadConfig(self.__configFile, backgroundChanged=backgroundChanged)
+
+        if self.__watchedPaths() != watchedBefore:
+            self.__restartWatcher()
+
+        # The reload may have bound descriptions to other sources or changed the refresh budget
+        self.__restartScheduler()
+
+
+class RefreshScheduler:
+    # Polls the live description sources and refreshes the panel at most once per minInterval seconds.
+    # Values changing in between are coalesced into the next refresh.
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, liveFields, refresh, minInterval: float):
+        self.__loop = loop
+        self.__liveFields = liveFields
+        self.__refresh = refresh
+        self.__minInterval = minInterval
+
+        self.__pollHandles = {}
+        self.__refreshHandle = None
+        self.__lastRefresh = None
+        self.refreshes = 0
+
+    def start(self):
+        # The panel was just rendered with the current values
+        self.__lastRefresh = self.__loop.time()
+        for index, source in self.__liveFields.sources.items():
+            self.__pollHandles[index] = self.__loop.call_later(source.interval, self.__poll, index)
+
+    def stop(self):
+        for handle in self.__pollHandles.values():
+            handle.cancel()
+        self.__pollHandles.clear()
+
+        if self.__refreshHandle is not None:
+            self.__refreshHandle.cancel()
+            self.__refreshHandle = None
+
+    def __poll(self, index: int):
+        source = self.__liveFields.sources[index]
+        try:
+            if self.__liveFields.poll(index):
+                self.__scheduleRefresh()
+        except Exception as e:
+            print(f'Data source {self.__liveFields.names[index]} failed: {e}', file=sys.stderr)
+
+        self.__pollHandles[index] = self.__loop.call_later(source.interval, self.__poll, index)
+
+    def __scheduleRefresh(self):
+        if self.__refreshHandle is not None:
+            return
+
+        delay = max(0.0, self.__lastRefresh + self.__minInterval - self.__loop.time())
+        self.__refreshHandle = self.__loop.call_later(delay, self.__runRefresh)
+
+    def __runRefresh(self):
+        self.__refreshHandle = None
+        self.__lastRefresh = self.__loop.time()
+        self.refreshes += 1
+        self.__refresh()
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+from dataclasses import replace
+
+from backgroundstore import backgroundStore
+from flightpatch import FlightPatch, TextStyle, Position, Rectangle
+
+
+def parseResolution(text: str) -> (int, int):
+    try:
+        width, height = text.lower().split('x')
+        resolution = (int(width), int(height))
+    except ValueError:
+        raise ValueError(f'Resolution "{text}" is expected as WIDTHxHEIGHT, e.g. 2560x1440.')
+
+    if resolution[0] <= 0 or resolution[1] <= 0:
+        raise ValueError(f'Resolution "{text}" has to be positive.')
+    return resolution
+
+
+def scaleFactorFor(sourceSize: (int, int), targetResolution: (int, int)) -> float:
+    # Windows fills the screen with the wallpaper, so it has to cover the target in both directions.
+    # Backgrounds are never enlarged, that would only add pixels to draw and encode.
+    factor = max(targetResolution[0] / sourceSize[0], targetResolution[1] / sourceSize[1])
+    return min(factor, 1.0)
+
+
+def scaledSize(sourceSize: (int, int), factor: float) -> (int, int):
+    return (max(1, round(sourceSize[0] * factor)), max(1, round(sourceSize[1] * factor)))
+
+
+def _scale(value: int, factor: float) -> int:
+    return round(value * factor)
+
+
+def _scaleWidth(value: int, factor: float) -> int:
+    # Outlines and the like stay visible however small the background gets
+    return max(1, _scale(value, factor)) if value > 0 else value
+
+
+def scaleTextStyle(style: TextStyle, factor: float) -> TextStyle:
+    position = style.position
+    outline = style.outline
+    shadow = style.shadow
+    return replace(
+        style,
+        fontSize=max(1, _scale(style.fontSize, factor)),
+        maxWidth=None if style.maxWidth is None else _scale(style.maxWidth, factor),
+        minFontSize=None if style.minFontSize is None else max(1, _scale(style.minFontSize, factor)),
+        lineSpacing=_scale(style.lineSpacing, factor),
+        outline=None if outline is None else replace(outline, width=_scaleWidth(outline.width, factor)),
+        shadow=None if shadow is None else replace(
+            shadow,
+            offsetX=_scale(shadow.offsetX, factor),
+            offsetY=_scale(shadow.offsetY, factor),
+            blur=_scale(shadow.blur, factor)
+        ),
+        position=Position(
+            verticalReference=position.verticalReference,
+            verticalOffset=_scale(position.verticalOffset, factor),
+            horizontalReference=position.horizontalReference,
+            horizontalOffset=_scale(position.horizontalOffset, factor)
+        )
+    )
+
+
+def scalePatch(patch: FlightPatch, factor: float) -> FlightPatch:
+    # Maps a patch designed for the native background size onto the scaled background
+    if factor == 1.0:
+        return patch
+
+    rectangle = patch.rectangle
+    plate = patch.plate
+    return replace(
+        patch,
+        rectangle=Rectangle(
+            x=_scale(rectangle.x, factor),
+            y=_scale(rectangle.y, factor),
+            width=_scale(rectangle.width, factor),
+            height=_scale(rectangle.height, factor)
+        ),
+        aircraftRegistrationStyle=scaleTextStyle(patch.aircraftRegistrationStyle, factor),
+        selCalCodeStyle=scaleTextStyle(patch.selCalCodeStyle, factor),
+        callsignStyle=scaleTextStyle(patch.callsignStyle, factor),
+        descriptions=[replace(description, style=scaleTextStyle(description.style, factor)) for description in patch.descriptions],
+        plate=None if plate is None else replace(
+            plate,
+            cornerRadius=_scale(plate.cornerRadius, factor),
+            padding=_scale(plate.padding, factor)
+        )
+    )
+
+
+class BackgroundPyramid:
+    # Scaled copies of backgrounds, one file per source and target size. The source's modification
+    # time and size are part of the file name, so an edited background gets new copies and the old
+    # ones of the same source are deleted.
+
+    def __init__(self, directory: str = '.tmp/pyramid'):
+        self.__directory = directory
+
+    def __sourcePrefix(self, sourcePath: str) -> str:
+        return hashlib.sha1(os.path.abspath(sourcePath).encode()).hexdigest()[:16]
+
+    def __variantPath(self, sourcePath: str, size: (int, int)) -> str:
+        stat = os.stat(sourcePath)
+        signature = hashlib.sha1(f'{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest()[:12]
+        return os.path.join(self.__directory, f'{self.__sourcePrefix(sourcePath)}_{signature}_{size[0]}x{size[1]}.png')
+
+    def __removeStaleVariants(self, sourcePath: str, signaturePrefix: str):
+        prefix = f'{self.__sourcePrefix(sourcePath)}_'
+        for name in os.listdir(self.__directory):
+            if name.startswith(prefix) and not name.startswith(signaturePrefix):
+                path = os.path.join(self.__directory, name)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                # The decoded frame of the variant would never be used again
+                backgroundStore.removeFrames(path)
+
+    def getScaled(self, sourcePath: str, targetResolution: (int, int)) -> (str, float):
+        # Returns the background to render onto and the factor patch coordinates have to be scaled by
+        from PIL import Image
+
+        source = Image.open(sourcePath)
+        factor = scaleFactorFor(source.size, targetResolution)
+        if factor == 1.0:
+            return (sourcePath, 1.0)
+
+        size = scaledSize(source.size, factor)
+        path = self.__variantPath(sourcePath, size)
+        if os.path.isfile(path):
+            return (path, factor)
+
+        # The reducing gap shrinks by an integer factor on the fly before the Lanczos pass,
+        # nearly as sharp as a plain Lanczos resize and much faster on large reductions
+        scaled = source.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+        os.makedirs(self.__directory, exist_ok=True)
+        self.__removeStaleVariants(sourcePath, os.path.basename(path).rsplit('_', 1)[0])
+
+        # Displays sharing a background may scale it on several threads at once
+        temporaryPath = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        scaled.save(temporaryPath, 'PNG', compress_level=1)
+        os.replace(temporaryPath, path)
+        return (path, factor)
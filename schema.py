@@ -0,0 +1,124 @@
+import sys
+
+
+class ConfigError(ValueError):
+
+    def __init__(self, errors: [(str, str)]):
+        self.errors = errors
+        super().__init__('\n'.join(f'{path}: {message}' for path, message in errors))
+
+
+_MISSING = object()
+
+
+class Schema:
+    # load() validates and builds in the same pass. Problems are appended to errors as
+    # (json path, message) and None is returned for the failing node, so siblings are still checked.
+    # Things that are ignored, like keys of older versions, are appended to warnings the same way.
+
+    def load(self, value, path: str, errors: list, warnings: list):
+        raise NotImplementedError()
+
+    def loadRoot(self, value):
+        errors = []
+        warnings = []
+        result = self.load(value, '$', errors, warnings)
+        for path, message in warnings:
+            print(f'Config warning, {path}: {message}', file=sys.stderr)
+        if errors:
+            raise ConfigError(errors)
+        return result
+
+
+class Value(Schema):
+
+    def __init__(self, *types: type):
+        self.types = types
+
+    def load(self, value, path: str, errors: list, warnings: list):
+        # bool is a subclass of int, but true/false is never a valid number in a config
+        if isinstance(value, bool) and bool not in self.types or not isinstance(value, self.types):
+            names = ' or '.join(valueType.__name__ for valueType in self.types)
+            errors.append((path, f'expected {names}, got {type(value).__name__}'))
+            return None
+        return value
+
+
+class EnumValue(Schema):
+
+    def __init__(self, enumType: type):
+        self.enumType = enumType
+
+    def load(self, value, path: str, errors: list, warnings: list):
+        if isinstance(value, str) and value in self.enumType.__members__:
+            return self.enumType[value]
+
+        names = ', '.join(self.enumType.__members__)
+        errors.append((path, f'expected one of {names}, got {value!r}'))
+        return None
+
+
+class Nullable(Schema):
+    # null or whatever schema accepts, e.g. an optional record as written back by toJson
+
+    def __init__(self, schema: Schema):
+        self.schema = schema
+
+    def load(self, value, path: str, errors: list, warnings: list):
+        if value is None:
+            return None
+        return self.schema.load(value, path, errors, warnings)
+
+
+class ListOf(Schema):
+
+    def __init__(self, itemSchema: Schema):
+        self.itemSchema = itemSchema
+
+    def load(self, value, path: str, errors: list, warnings: list):
+        if not isinstance(value, list):
+            errors.append((path, f'expected list, got {type(value).__name__}'))
+            return None
+        return [self.itemSchema.load(item, f'{path}[{i}]', errors, warnings) for i, item in enumerate(value)]
+
+
+class Record(Schema):
+
+    def __init__(self, build, fields: dict, optional: dict = None):
+        # fields: {name: Schema}, optional: {name: (Schema, default)}
+        self.build = build
+        self.fields = fields
+        self.optional = optional or {}
+
+    def load(self, value, path: str, errors: list, warnings: list):
+        if not isinstance(value, dict):
+            errors.append((path, f'expected object, got {type(value).__name__}'))
+            return None
+
+        errorCount = len(errors)
+        arguments = {}
+
+        for name, schema in self.fields.items():
+            fieldValue = value.get(name, _MISSING)
+            if fieldValue is _MISSING:
+                errors.append((f'{path}.{name}', 'missing required value'))
+            else:
+                arguments[name] = schema.load(fieldValue, f'{path}.{name}', errors, warnings)
+
+        for name, (schema, default) in self.optional.items():
+            fieldValue = value.get(name, _MISSING)
+            arguments[name] = default if fieldValue is _MISSING else schema.load(fieldValue, f'{path}.{name}', errors, warnings)
+
+        # Configs written for other versions keep loading, a typo still gets pointed out
+        for name in value:
+            if name not in self.fields and name not in self.optional:
+                warnings.append((f'{path}.{name}', 'unknown key, ignored'))
+
+        if len(errors) > errorCount:
+            return None
+
+        try:
+            return self.build(**arguments)
+        except ValueError as e:
+            errors.append((path, str(e)))
+            return None
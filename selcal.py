@@ -0,0 +1,182 @@
+import heapq
+from dataclasses import dataclass
+from itertools import combinations
+
+from flightpatch import SELCAL_LETTERS, SelCalCode, Callsign
+
+
+# Every SELCAL code is a pair of disjoint, alphabetically ordered letter pairs. Codes are identified by
+# firstPairIndex * PAIR_COUNT + secondPairIndex, which keeps the whole code space in one small bytearray.
+LETTER_COUNT = len(SELCAL_LETTERS)
+LETTER_INDEX = {letter: i for i, letter in enumerate(SELCAL_LETTERS)}
+
+PAIRS = list(combinations(range(LETTER_COUNT), 2))
+PAIR_COUNT = len(PAIRS)
+PAIR_INDEX = {pair: i for i, pair in enumerate(PAIRS)}
+
+CODE_SPACE = PAIR_COUNT * PAIR_COUNT
+VALID_CODE_IDS = [
+    first * PAIR_COUNT + second
+    for first in range(PAIR_COUNT)
+    for second in range(PAIR_COUNT)
+    if not set(PAIRS[first]) & set(PAIRS[second])
+]
+
+# Code ids per set of four letters (as sorted letter index tuple): 3 ways to split times 2 pair orders
+CODE_IDS_BY_LETTERS = {}
+for _codeId in VALID_CODE_IDS:
+    _first, _second = PAIRS[_codeId // PAIR_COUNT], PAIRS[_codeId % PAIR_COUNT]
+    CODE_IDS_BY_LETTERS.setdefault(tuple(sorted(_first + _second)), []).append(_codeId)
+
+
+def codeIdOf(code: SelCalCode) -> int:
+    first = PAIR_INDEX[(LETTER_INDEX[code.digit1], LETTER_INDEX[code.digit2])]
+    second = PAIR_INDEX[(LETTER_INDEX[code.digit3], LETTER_INDEX[code.digit4])]
+    return first * PAIR_COUNT + second
+
+
+def codeOfId(codeId: int) -> SelCalCode:
+    first, second = PAIRS[codeId // PAIR_COUNT], PAIRS[codeId % PAIR_COUNT]
+    return SelCalCode(''.join(SELCAL_LETTERS[i] for i in first + second))
+
+
+class SelCalIndex:
+
+    def __init__(self):
+        self.__assigned = bytearray(CODE_SPACE)
+        self.__owners = {}
+        self.__letterUsage = [0] * LETTER_COUNT
+        self.__cursor = 0
+
+    def __len__(self) -> int:
+        return len(self.__owners)
+
+    def contains(self, code: SelCalCode) -> bool:
+        return self.__assigned[codeIdOf(code)] == 1
+
+    def getOwner(self, code: SelCalCode):
+        return self.__owners.get(codeIdOf(code))
+
+    def add(self, code: SelCalCode, owner=None) -> bool:
+        # Returns False if the code was already assigned, its owner stays the one of getOwner()
+        codeId = codeIdOf(code)
+        if self.__assigned[codeId]:
+            return False
+
+        self.__assigned[codeId] = 1
+        self.__owners[codeId] = owner
+        for letter in code.getFirstPart() + code.getSecondPart():
+            self.__letterUsage[LETTER_INDEX[letter]] += 1
+        return True
+
+    def remove(self, code: SelCalCode):
+        codeId = codeIdOf(code)
+        if not self.__assigned[codeId]:
+            return
+
+        self.__assigned[codeId] = 0
+        del self.__owners[codeId]
+        for letter in code.getFirstPart() + code.getSecondPart():
+            self.__letterUsage[LETTER_INDEX[letter]] -= 1
+        self.__cursor = 0
+
+    def allocate(self, avoidSharedLetters=False, owner=None, reserve=True) -> SelCalCode:
+        # Finds an unused code, with avoidSharedLetters preferring the letters used least by assigned codes
+        if avoidSharedLetters:
+            codeId = self.__leastSharedFreeCode()
+        else:
+            codeId = self.__firstFreeCode()
+
+        if codeId is None:
+            raise ValueError('All SelCal codes are assigned.')
+
+        code = codeOfId(codeId)
+        if reserve:
+            self.add(code, owner)
+        return code
+
+    def __firstFreeCode(self) -> int:
+        assigned = self.__assigned
+        while self.__cursor < len(VALID_CODE_IDS):
+            codeId = VALID_CODE_IDS[self.__cursor]
+            if not assigned[codeId]:
+                return codeId
+            self.__cursor += 1
+        return None
+
+    def __leastSharedFreeCode(self) -> int:
+        # Best-first walk over 4-letter sets in order of their summed letter usage
+        usage = self.__letterUsage
+        order = sorted(range(LETTER_COUNT), key=lambda letter: usage[letter])
+
+        def score(positions: tuple) -> int:
+            return sum(usage[order[position]] for position in positions)
+
+        start = (0, 1, 2, 3)
+        heap = [(score(start), start)]
+        visited = {start}
+
+        while heap:
+            _, positions = heapq.heappop(heap)
+
+            for codeId in CODE_IDS_BY_LETTERS[tuple(sorted(order[position] for position in positions))]:
+                if not self.__assigned[codeId]:
+                    return codeId
+
+            for i in range(4):
+                limit = positions[i + 1] if i < 3 else LETTER_COUNT
+                if positions[i] + 1 < limit:
+                    successor = positions[:i] + (positions[i] + 1,) + positions[i + 1:]
+                    if successor not in visited:
+                        visited.add(successor)
+                        heapq.heappush(heap, (score(successor), successor))
+
+        return None
+
+
+@dataclass()
+class ValidationResult:
+    text: str
+    value: object
+    error: str
+
+    def isValid(self) -> bool:
+        return self.error is None
+
+
+def validateSelCalCodes(texts: [str], index: SelCalIndex = None, owners: list = None) -> [ValidationResult]:
+    # Checks every code and reports duplicates within the batch and against index; valid codes are added
+    # to index (a fresh one if none is given), owners[i] is stored as the owner of texts[i]
+    index = index if index is not None else SelCalIndex()
+    results = []
+
+    for i, text in enumerate(texts):
+        try:
+            code = SelCalCode(text)
+        except ValueError as e:
+            results.append(ValidationResult(text=text, value=None, error=str(e)))
+            continue
+
+        owner = owners[i] if owners is not None else i
+        if not index.add(code, owner):
+            previousOwner = index.getOwner(code)
+            assignedTo = '' if previousOwner is None else f' to {previousOwner}'
+            results.append(ValidationResult(
+                text=text,
+                value=code,
+                error=f'SelCal code "{code.getFullCode()}" is already assigned{assignedTo}.'
+            ))
+        else:
+            results.append(ValidationResult(text=text, value=code, error=None))
+
+    return results
+
+
+def validateCallsigns(texts: [str]) -> [ValidationResult]:
+    results = []
+    for text in texts:
+        try:
+            results.append(ValidationResult(text=text, value=Callsign(text), error=None))
+        except ValueError as e:
+            results.append(ValidationResult(text=text, value=None, error=str(e)))
+    return results
@@ -0,0 +1,131 @@
+import json
+import os
+import time
+
+
+class InstanceError(Exception):
+    pass
+
+
+def _lockFile(file):
+    file.seek(0)
+    if os.name == 'nt':
+        import msvcrt
+        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _unlockFile(file):
+    file.seek(0)
+    if os.name == 'nt':
+        import msvcrt
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class InstanceLock:
+    # Held by the process that has a flat panel loaded, for as long as it runs. The operating system releases
+    # the lock when that process ends, however it ends, so a crashed panel never blocks the next one.
+    # Once the holder's control API listens, its port is published next to the lock.
+
+    def __init__(self, path: str = '.tmp/instance.lock'):
+        self.__path = path
+        self.__infoPath = f'{os.path.splitext(path)[0]}.json'
+        self.__file = None
+
+    def acquire(self) -> bool:
+        # Returns False if another process holds the lock
+        os.makedirs(os.path.dirname(self.__path) or '.', exist_ok=True)
+        file = open(self.__path, 'a+b')
+        try:
+            _lockFile(file)
+        except OSError:
+            file.close()
+            return False
+
+        self.__file = file
+        # Left behind by a holder that crashed
+        self.withdraw()
+        return True
+
+    def release(self):
+        if self.__file is None:
+            return
+
+        self.withdraw()
+        _unlockFile(self.__file)
+        self.__file.close()
+        self.__file = None
+
+    def publish(self, port: int, token: str = None):
+        # port is None for a panel running without control API. The token authorizes control API requests,
+        # so the file is only readable by the user running the panel.
+        temporaryPath = f'{self.__infoPath}.{os.getpid()}.tmp'
+        descriptor = os.open(temporaryPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        file = os.fdopen(descriptor, 'w')
+        json.dump({'pid': os.getpid(), 'port': port, 'token': token}, file)
+        file.close()
+        os.replace(temporaryPath, self.__infoPath)
+
+    def withdraw(self):
+        try:
+            os.remove(self.__infoPath)
+        except FileNotFoundError:
+            pass
+
+    def readInfo(self) -> dict:
+        try:
+            file = open(self.__infoPath)
+            info = json.load(file)
+            file.close()
+        except (OSError, ValueError):
+            return None
+        return info
+
+
+def requestInstance(info: dict, method: str, path: str, body: dict = None, timeout: float = 5.0) -> dict:
+    # http.client is only imported by invocations that talk to a loaded panel
+    import http.client
+
+    connection = http.client.HTTPConnection('127.0.0.1', info['port'], timeout=timeout)
+    headers = {'Content-Type': 'application/json', 'X-Flat-Panel-Token': info.get('token') or ''}
+    try:
+        connection.request(method, path, json.dumps(body or {}), headers)
+        response = connection.getresponse()
+        payload = json.loads(response.read() or b'{}')
+    except ConnectionRefusedError:
+        raise
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        raise InstanceError(f'The loaded flat panel did not answer: {e}')
+    finally:
+        connection.close()
+
+    if response.status != 200:
+        raise InstanceError(payload.get('error', f'The loaded flat panel answered with status {response.status}'))
+    return payload
+
+
+def handOff(lock: InstanceLock, path: str, body: dict, timeout: float = 10.0) -> dict:
+    # Sends a POST to the panel holding lock and returns its answer. A panel that is still activating or already
+    # shutting down is waited for. Returns None if it ended meanwhile, the caller then holds lock itself.
+    deadline = time.monotonic() + timeout
+    while True:
+        info = lock.readInfo()
+        if info is not None:
+            if not info.get('port'):
+                raise InstanceError(f'A flat panel is loaded by process {info.get("pid")} without control API, '
+                                    f'end it with Ctrl-C first')
+            try:
+                return requestInstance(info, 'POST', path, body)
+            except ConnectionRefusedError:
+                pass
+
+        if lock.acquire():
+            return None
+        if time.monotonic() > deadline:
+            raise InstanceError('A flat panel is loaded by another process that does not answer, end it with Ctrl-C first')
+        time.sleep(0.05)
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from fleet import validateFleet
+from flightpatch import SelCalCode
+from selcal import SelCalIndex, validateSelCalCodes
+
+
+def writeRows(text: str, extension: str = '.jsonl') -> str:
+    descriptor, path = tempfile.mkstemp(suffix=extension)
+    file = os.fdopen(descriptor, 'w')
+    file.write(text)
+    file.close()
+    return path
+
+
+class ValidateFleetTest(unittest.TestCase):
+
+    def test_rows_that_are_not_objects_are_problems_of_their_line(self):
+        path = writeRows('{"registration": "D-AINA", "callsign": "DLH1", "selcal": "ABCD"}\n'
+                         '[1, 2]\n'
+                         '42\n'
+                         '{"registration": "D-AINB", "callsign": "DLH2", "selcal": "ABCE"}\n')
+        self.addCleanup(os.remove, path)
+
+        index, errors = validateFleet(path)
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(errors, [(2, 'Expected a JSON object, got list'), (3, 'Expected a JSON object, got int')])
+
+    def test_duplicate_selcal_names_the_first_owner(self):
+        path = writeRows('registration,callsign,selcal\nD-AINA,DLH1,ABCD\nD-AINB,DLH2,ABCD\n', '.csv')
+        self.addCleanup(os.remove, path)
+
+        _, errors = validateFleet(path)
+
+        self.assertEqual(errors, [(3, 'SelCal code "AB-CD" is already assigned to D-AINA.')])
+
+
+class SelCalIndexTest(unittest.TestCase):
+
+    def test_add_reports_clash_with_a_code_without_owner(self):
+        index = SelCalIndex()
+        code = index.allocate(reserve=True)
+
+        self.assertFalse(index.add(code, 'D-AINA'))
+        self.assertIsNone(index.getOwner(code))
+
+    def test_duplicate_of_a_reserved_code_is_reported(self):
+        index = SelCalIndex()
+        index.add(SelCalCode('ABCD'))
+
+        results = validateSelCalCodes(['ABCD'], index, ['D-AINA'])
+
+        self.assertEqual(results[0].error, 'SelCal code "AB-CD" is already assigned.')
+
+
+if __name__ == '__main__':
+    unittest.main()
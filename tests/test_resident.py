@@ -0,0 +1,159 @@
+import contextlib
+import io
+import unittest
+
+from datasources import DATA_SOURCES, DataSource, LiveFields, registerDataSource
+from flightpatch import Description
+from resident import RefreshScheduler
+from schema import ConfigError
+
+
+class FakeSource(DataSource):
+    # Returns the values in turn, one per read, and raises once values run out if failing is set
+
+    def __init__(self, values: [str] = None, interval: float = 1.0, failing: bool = False):
+        super().__init__(interval)
+        self.values = list(values or ['FAKE 1', 'FAKE 2', 'FAKE 3'])
+        self.failing = failing
+        self.reads = 0
+
+    def read(self) -> str:
+        if self.failing and self.reads >= len(self.values):
+            self.reads += 1
+            raise OSError('simulator not running')
+        value = self.values[self.reads % len(self.values)]
+        self.reads += 1
+        return value
+
+
+class _Handle:
+
+    def __init__(self, when: float, callback, arguments: tuple):
+        self.when = when
+        self.callback = callback
+        self.arguments = arguments
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class ManualLoop:
+    # The parts of an asyncio event loop the scheduler uses, on a clock that only advance() moves
+
+    def __init__(self):
+        self.now = 0.0
+        self.handles = []
+
+    def time(self) -> float:
+        return self.now
+
+    def call_later(self, delay: float, callback, *arguments) -> _Handle:
+        handle = _Handle(self.now + delay, callback, arguments)
+        self.handles.append(handle)
+        return handle
+
+    def advance(self, seconds: float):
+        end = self.now + seconds
+        while True:
+            due = [handle for handle in self.handles if not handle.cancelled and handle.when <= end]
+            if not due:
+                break
+            handle = min(due, key=lambda handle: handle.when)
+            self.handles.remove(handle)
+            self.now = handle.when
+            handle.callback(*handle.arguments)
+        self.now = end
+
+    def pending(self) -> int:
+        return len([handle for handle in self.handles if not handle.cancelled])
+
+
+def liveFields(*sources: DataSource) -> LiveFields:
+    names = []
+    for i, source in enumerate(sources):
+        names.append(f'test{i}')
+        registerDataSource(names[-1], lambda source=source: source)
+    return LiveFields([Description(text='{value}', style=None, source=name) for name in names])
+
+
+class RefreshSchedulerTest(unittest.TestCase):
+
+    def tearDown(self):
+        for name in [name for name in DATA_SOURCES if name.startswith('test')]:
+            del DATA_SOURCES[name]
+
+    def test_changes_are_coalesced_into_one_refresh_per_interval(self):
+        loop = ManualLoop()
+        fields = liveFields(FakeSource(values=[str(i) for i in range(100)], interval=0.1))
+        refreshes = []
+        scheduler = RefreshScheduler(loop, fields, lambda: refreshes.append(loop.time()), minInterval=1.0)
+
+        scheduler.start()
+        loop.advance(3.05)
+
+        # Thirty changed values, rendered at most once per second
+        self.assertEqual(len(refreshes), 3)
+        self.assertEqual([round(time, 6) for time in refreshes], [1.0, 2.0, 3.0])
+
+    def test_unchanged_values_do_not_refresh(self):
+        loop = ManualLoop()
+        source = FakeSource(values=['12:00Z'], interval=0.5)
+        scheduler = RefreshScheduler(loop, liveFields(source), lambda: self.fail('refreshed'), minInterval=1.0)
+
+        scheduler.start()
+        loop.advance(5.0)
+
+        self.assertEqual(scheduler.refreshes, 0)
+        self.assertGreater(source.reads, 5)
+
+    def test_first_change_after_a_quiet_period_refreshes_immediately(self):
+        loop = ManualLoop()
+        fields = liveFields(FakeSource(values=['A'] * 10 + ['B'], interval=1.0))
+        refreshes = []
+        scheduler = RefreshScheduler(loop, fields, lambda: refreshes.append(loop.time()), minInterval=2.0)
+
+        scheduler.start()
+        loop.advance(10.5)
+
+        self.assertEqual(refreshes, [10.0])
+        self.assertEqual(fields.values, {0: 'B'})
+
+    def test_failing_source_is_reported_and_polled_again(self):
+        loop = ManualLoop()
+        source = FakeSource(values=['A'], interval=1.0, failing=True)
+        scheduler = RefreshScheduler(loop, liveFields(source), lambda: None, minInterval=1.0)
+
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            scheduler.start()
+            loop.advance(3.5)
+
+        self.assertEqual(stderr.getvalue().count('Data source test0 failed: simulator not running'), 3)
+        self.assertEqual(source.reads, 4)
+
+    def test_stop_cancels_polls_and_pending_refresh(self):
+        loop = ManualLoop()
+        fields = liveFields(FakeSource(interval=0.1), FakeSource(interval=0.3))
+        scheduler = RefreshScheduler(loop, fields, lambda: self.fail('refreshed'), minInterval=1.0)
+
+        scheduler.start()
+        loop.advance(0.5)
+        scheduler.stop()
+        loop.advance(5.0)
+
+        self.assertEqual(loop.pending(), 0)
+        self.assertEqual(scheduler.refreshes, 0)
+
+
+class LiveFieldsTest(unittest.TestCase):
+
+    def test_unknown_source_is_a_config_error(self):
+        with self.assertRaises(ConfigError) as context:
+            LiveFields([Description(text='{value}', style=None, source='fake')])
+
+        self.assertIn('$.flightPatch.descriptions[0].source', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
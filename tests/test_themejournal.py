@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from themejournal import ThemeJournal
+from windowstheme import Theme, ThemeColor
+
+
+def theme(wallpaper: str) -> Theme:
+    color = ThemeColor(r=0, g=120, b=215)
+    return Theme(
+        dwmAccentColor=color,
+        dwmAccentColorInactive=color,
+        dwmColorPrevalence=False,
+        explorerAccentColorMenu=color,
+        wallpaper=wallpaper
+    )
+
+
+class ThemeJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'theme_journal.log')
+        self.journal = ThemeJournal(self.path)
+
+    def recordSnapshots(self, count: int):
+        for i in range(count):
+            self.journal.recordOriginal(theme(f'C:\\original_{i}.png'))
+            if i < count - 1:
+                self.journal.markRestored()
+
+    def readHead(self) -> bytes:
+        file = open(f'{self.path}.head', 'rb')
+        data = file.read()
+        file.close()
+        return data
+
+    def writeHead(self, data: bytes):
+        file = open(f'{self.path}.head', 'wb')
+        file.write(data)
+        file.close()
+
+    def test_original_survives_a_crash_before_the_compacted_head_was_written(self):
+        self.recordSnapshots(4)
+        staleHead = self.readHead()
+
+        self.assertEqual(self.journal.compact(keep=2), 2)
+        # As if the process died after replacing the journal, before replacing its head
+        self.writeHead(staleHead)
+
+        original = ThemeJournal(self.path).getOriginal()
+        self.assertEqual(original.theme.wallpaper, 'C:\\original_3.png')
+        self.assertTrue(ThemeJournal(self.path).isActive())
+
+    def test_recording_after_a_stale_head_appends_to_the_compacted_journal(self):
+        self.recordSnapshots(4)
+        staleHead = self.readHead()
+        self.journal.compact(keep=1)
+        self.writeHead(staleHead)
+
+        journal = ThemeJournal(self.path)
+        journal.markRestored()
+        snapshot = journal.recordOriginal(theme('C:\\later.png'))
+
+        self.assertEqual(snapshot.id, 5)
+        self.assertEqual([snapshot.id for snapshot in journal.getSnapshots()], [4, 5])
+        self.assertEqual(journal.getOriginal().theme.wallpaper, 'C:\\later.png')
+
+    def test_missing_head_is_rebuilt_from_the_journal(self):
+        self.recordSnapshots(2)
+        os.remove(f'{self.path}.head')
+
+        journal = ThemeJournal(self.path)
+
+        self.assertEqual(journal.getOriginal().theme.wallpaper, 'C:\\original_1.png')
+        self.assertFalse(journal.isActive())
+
+
+if __name__ == '__main__':
+    unittest.main()
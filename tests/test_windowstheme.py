@@ -0,0 +1,139 @@
+import unittest
+
+from windowstheme import InMemoryThemeBackend, Theme, ThemeColor, WindowsThemeInterface
+
+DWM_SUBKEY = 'SOFTWARE\\Microsoft\\Windows\\DWM'
+EXPLORER_SUBKEY = 'SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\Explorer\\Accent'
+
+RED = ThemeColor(r=200, g=0, b=0)
+BLUE = ThemeColor(r=0, g=120, b=215)
+
+
+def registryValues(accentColor: ThemeColor, colorPrevalence: bool) -> dict:
+    return {
+        DWM_SUBKEY: {
+            'AccentColor': accentColor.toRegDword(),
+            'AccentColorInactive': accentColor.toRegDword(),
+            'ColorPrevalence': int(colorPrevalence)
+        },
+        EXPLORER_SUBKEY: {
+            'AccentColorMenu': accentColor.toRegDword()
+        }
+    }
+
+
+def theme(accentColor: ThemeColor, colorPrevalence: bool, wallpaper: str, **kwargs) -> Theme:
+    return Theme(
+        dwmAccentColor=accentColor,
+        dwmAccentColorInactive=accentColor,
+        dwmColorPrevalence=colorPrevalence,
+        explorerAccentColorMenu=accentColor,
+        wallpaper=wallpaper,
+        **kwargs
+    )
+
+
+class ThemeChangesTest(unittest.TestCase):
+
+    def test_unchanged_theme_has_no_changes(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\panel.png')
+        interface = WindowsThemeInterface(backend=backend)
+
+        self.assertEqual(interface.themeChanges(theme(RED, True, 'C:\\panel.png')), {})
+
+    def test_only_differing_values_are_changed(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\panel.png')
+        interface = WindowsThemeInterface(backend=backend)
+
+        changes = interface.themeChanges(theme(RED, False, 'C:\\panel.png'))
+
+        self.assertEqual(changes, {DWM_SUBKEY: {'ColorPrevalence': 0}})
+
+    def test_missing_values_compare_as_windows_defaults(self):
+        # A fresh profile has none of the values, Windows shows its default blue accent then
+        backend = InMemoryThemeBackend({}, 'C:\\panel.png')
+        interface = WindowsThemeInterface(backend=backend)
+        defaultBlue = ThemeColor.fromRegDword(0xffd77800)
+
+        self.assertEqual(interface.themeChanges(theme(defaultBlue, False, 'C:\\panel.png')), {})
+        self.assertEqual(interface.currentTheme(), theme(defaultBlue, False, 'C:\\panel.png', wallpaperPosition='Fill'))
+
+
+class LoadThemeTest(unittest.TestCase):
+
+    def test_writes_changed_values_and_switches_wallpaper(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\original.png')
+        interface = WindowsThemeInterface(backend=backend)
+
+        interface.loadTheme(theme(BLUE, True, 'C:\\panel.png'))
+
+        self.assertEqual(backend.values, registryValues(BLUE, True))
+        # Both accent colors of DWM and the explorer's, the unchanged prevalence is not written
+        self.assertEqual(backend.valueWrites, 3)
+        self.assertEqual(backend.wallpaper, 'C:\\panel.png')
+        self.assertEqual(backend.wallpaperCalls, 1)
+
+    def test_unchanged_theme_writes_nothing(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\panel.png')
+        interface = WindowsThemeInterface(backend=backend)
+
+        interface.loadTheme(theme(RED, True, 'C:\\panel.png'))
+
+        self.assertEqual(backend.valueWrites, 0)
+        self.assertEqual(backend.wallpaperCalls, 0)
+
+    def test_refresh_wallpaper_reapplies_the_same_path(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\panel.png')
+        interface = WindowsThemeInterface(backend=backend)
+
+        interface.loadTheme(theme(RED, True, 'C:\\panel.png'), refreshWallpaper=True)
+
+        self.assertEqual(backend.valueWrites, 0)
+        self.assertEqual(backend.wallpaperCalls, 1)
+
+    def test_sets_wallpaper_position(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\panel.png')
+        interface = WindowsThemeInterface(backend=backend)
+
+        interface.loadTheme(theme(RED, True, 'C:\\panel.png', wallpaperPosition='Span'))
+
+        self.assertEqual(backend.wallpaperPosition, 'Span')
+
+    def test_monitor_wallpapers_replace_only_assigned_monitors(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\original.png', monitors=3)
+        interface = WindowsThemeInterface(backend=backend)
+        panel = theme(RED, True, 'C:\\panel_0.png', monitorWallpapers=['C:\\panel_0.png', None, 'C:\\panel_2.png'])
+
+        interface.loadTheme(panel)
+        interface.loadTheme(panel)
+
+        self.assertEqual(backend.monitorWallpapers, ['C:\\panel_0.png', 'C:\\original.png', 'C:\\panel_2.png'])
+        # The second load found every monitor showing its wallpaper already
+        self.assertEqual(backend.wallpaperCalls, 1)
+
+
+class CurrentThemeTest(unittest.TestCase):
+
+    def test_same_wallpaper_on_every_monitor_is_recorded_once(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\original.png', monitors=2)
+        interface = WindowsThemeInterface(backend=backend)
+
+        self.assertIsNone(interface.currentTheme().monitorWallpapers)
+
+    def test_restoring_recorded_theme_restores_every_monitor(self):
+        backend = InMemoryThemeBackend(registryValues(RED, True), 'C:\\original.png', monitors=2)
+        backend.setMonitorWallpapers([None, 'C:\\second.png'])
+        interface = WindowsThemeInterface(backend=backend)
+
+        original = interface.currentTheme()
+        interface.loadTheme(theme(BLUE, False, 'C:\\panel.png', wallpaperPosition='Span'))
+        interface.loadTheme(original, refreshWallpaper=True)
+
+        self.assertEqual(original.monitorWallpapers, ['C:\\original.png', 'C:\\second.png'])
+        self.assertEqual(backend.monitorWallpapers, ['C:\\original.png', 'C:\\second.png'])
+        self.assertEqual(backend.wallpaperPosition, 'Fill')
+        self.assertEqual(backend.values, registryValues(RED, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+import json
+import os
+import time
+import zlib
+from dataclasses import dataclass
+
+from windowstheme import Theme
+
+
+@dataclass()
+class ThemeSnapshot:
+    id: int
+    time: float
+    theme: Theme
+
+
+def _fsyncDirectory(directory: str):
+    # Makes a rename durable on POSIX, directories cannot be opened like this on Windows
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def writeFileAtomically(path: str, data: bytes):
+    temporaryPath = f'{path}.{os.getpid()}.tmp'
+    file = open(temporaryPath, 'wb')
+    file.write(data)
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+    os.replace(temporaryPath, path)
+    _fsyncDirectory(os.path.dirname(path))
+
+
+def _encodeRecord(snapshot: ThemeSnapshot) -> bytes:
+    # One line per snapshot, prefixed with a checksum so a torn last line is recognized and ignored
+    payload = json.dumps({
+        'id': snapshot.id,
+        'time': snapshot.time,
+        'theme': json.loads(snapshot.theme.toJson(indent=None))
+    }, separators=(',', ':')).encode()
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def _decodeRecord(line: bytes) -> ThemeSnapshot:
+    # Returns None for lines that were not written completely
+    if not line.endswith(b'\n') or len(line) < 10:
+        return None
+
+    checksum, payload = line[:8], line[9:-1]
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+        jsonObject = json.loads(payload)
+        return ThemeSnapshot(id=jsonObject['id'], time=jsonObject['time'], theme=Theme.fromJsonObject(jsonObject['theme']))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class ThemeJournal:
+    # Append-only log of the themes found before a panel was loaded. The head file records the offset and id of
+    # the snapshot to restore and whether a panel theme is active, and is only ever replaced atomically after the
+    # journal itself was synced. A crash therefore leaves either the old or the new head. After compact() the old
+    # head may describe the old journal, a head not matching the journal is rebuilt from it.
+
+    def __init__(self, path: str = '.tmp/theme_journal.log'):
+        self.__path = path
+        self.__headPath = f'{path}.head'
+
+    def __readHead(self) -> dict:
+        try:
+            file = open(self.__headPath)
+            head = json.load(file)
+            file.close()
+            head = {
+                'size': int(head['size']),
+                'original': head['original'],
+                'originalId': head.get('originalId'),
+                'nextId': int(head['nextId']),
+                'active': bool(head['active'])
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return self.__recoverHead()
+
+        if not self.__headMatches(head):
+            return self.__recoverHead(head)
+        return head
+
+    def __writeHead(self, head: dict):
+        writeFileAtomically(self.__headPath, json.dumps(head).encode())
+
+    def __headMatches(self, head: dict) -> bool:
+        # The journal may be longer than the head says after an interrupted append, never shorter
+        try:
+            size = os.path.getsize(self.__path)
+        except FileNotFoundError:
+            size = 0
+        if head['size'] > size:
+            return False
+        if head['original'] is None:
+            return True
+
+        snapshot = self.__readAt(head['original'])
+        # Heads written before the id was recorded only need to point at a complete record
+        return snapshot is not None and head['originalId'] in (None, snapshot.id)
+
+    def __recoverHead(self, staleHead: dict = None) -> dict:
+        # The head file is missing, unreadable or describes another version of the journal. It is rebuilt from
+        # the complete records, a stale head still tells which snapshot to restore and whether a panel is active.
+        head = {'size': 0, 'original': None, 'originalId': None, 'nextId': 1, 'active': False}
+        for offset, line, snapshot in self.__scan():
+            head['size'] = offset + len(line)
+            head['nextId'] = snapshot.id + 1
+            if staleHead is None or staleHead['originalId'] is None or snapshot.id <= staleHead['originalId']:
+                head['original'] = offset
+                head['originalId'] = snapshot.id
+
+        if staleHead is not None:
+            head['nextId'] = max(head['nextId'], staleHead['nextId'])
+            head['active'] = staleHead['active'] and head['original'] is not None
+        return head
+
+    def __scan(self):
+        # Yields (offset, line, snapshot) for each complete record, stopping at the first broken one
+        try:
+            file = open(self.__path, 'rb')
+        except FileNotFoundError:
+            return
+
+        try:
+            offset = 0
+            for line in file:
+                snapshot = _decodeRecord(line)
+                if snapshot is None:
+                    return
+                yield (offset, line, snapshot)
+                offset += len(line)
+        finally:
+            file.close()
+
+    def __readAt(self, offset: int) -> ThemeSnapshot:
+        try:
+            file = open(self.__path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            file.seek(offset)
+            return _decodeRecord(file.readline())
+        finally:
+            file.close()
+
+    def isActive(self) -> bool:
+        return self.__readHead()['active']
+
+    def recordOriginal(self, theme: Theme) -> ThemeSnapshot:
+        # Called before a panel theme is applied. While a panel is active the recorded original is kept,
+        # so loading twice without restoring in between never records the panel theme.
+        head = self.__readHead()
+        if head['active'] and head['original'] is not None:
+            return self.__readAt(head['original'])
+
+        os.makedirs(os.path.dirname(self.__path) or '.', exist_ok=True)
+        snapshot = ThemeSnapshot(id=head['nextId'], time=time.time(), theme=theme)
+
+        # Anything behind the last complete record is the remainder of an interrupted append
+        file = open(self.__path, 'ab')
+        file.truncate(head['size'])
+        file.write(_encodeRecord(snapshot))
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+
+        self.__writeHead({
+            'size': os.path.getsize(self.__path),
+            'original': head['size'],
+            'originalId': snapshot.id,
+            'nextId': snapshot.id + 1,
+            'active': True
+        })
+        return snapshot
+
+    def markActive(self):
+        head = self.__readHead()
+        if not head['active']:
+            head['active'] = True
+            self.__writeHead(head)
+
+    def markRestored(self):
+        head = self.__readHead()
+        if head['active']:
+            head['active'] = False
+            self.__writeHead(head)
+
+    def getOriginal(self) -> ThemeSnapshot:
+        # Constant time, the head holds the offset of the snapshot to restore
+        head = self.__readHead()
+        if head['original'] is None:
+            return None
+        return self.__readAt(head['original'])
+
+    def getSnapshots(self) -> [ThemeSnapshot]:
+        return [snapshot for _, _, snapshot in self.__scan()]
+
+    def getSnapshot(self, snapshotId: int) -> ThemeSnapshot:
+        for _, _, snapshot in self.__scan():
+            if snapshot.id == snapshotId:
+                return snapshot
+        return None
+
+    def compact(self, keep: int = 10) -> int:
+        # Rewrites the journal with only the newest snapshots, returns the number of dropped snapshots
+        head = self.__readHead()
+        records = list(self.__scan())
+        kept = records[-keep:] if keep > 0 else []
+        if len(kept) == len(records):
+            return 0
+
+        data = b''.join(line for _, line, _ in kept)
+        writeFileAtomically(self.__path, data)
+
+        self.__writeHead({
+            'size': len(data),
+            'original': len(data) - len(kept[-1][1]) if kept else None,
+            'originalId': kept[-1][2].id if kept else None,
+            'nextId': head['nextId'],
+            'active': head['active'] and bool(kept)
+        })
+        return len(records) - len(kept)
@@ -0,0 +1,249 @@
+import io
+import os
+import struct
+import zlib
+
+from PIL import Image
+
+from encoders import OutputFormat, chooseOutputFormatForSize, fileExtension
+from composer import FlightPatchComposer, patchExtent
+from flightpatch import FlightPatch
+from layout import PatchItem
+
+
+# Backgrounds with more pixels than this are composited strip by strip instead of being decoded at once
+TILED_PIXEL_THRESHOLD = 7680 * 2160
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def _pngChunk(chunkType: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunkType + data + struct.pack('>I', zlib.crc32(chunkType + data) & 0xffffffff)
+
+
+class PngStripReader:
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__auxiliaryChunks = []
+
+        file = open(path, 'rb')
+        try:
+            if file.read(8) != PNG_SIGNATURE:
+                raise ValueError(f'"{path}" is not a PNG file.')
+
+            while True:
+                length, chunkType = struct.unpack('>I4s', file.read(8))
+                if chunkType == b'IDAT':
+                    self.__firstIdatOffset = file.tell() - 8
+                    break
+
+                data = file.read(length)
+                file.read(4)
+
+                if chunkType == b'IHDR':
+                    self.__header = data
+                    self.width, self.height, bitDepth, self.__colorType, _, _, interlace = struct.unpack('>IIBBBBB', data)
+                    if bitDepth != 8 or interlace != 0 or self.__colorType not in PNG_CHANNELS:
+                        raise ValueError(f'"{path}" is not a non-interlaced 8 bit PNG and cannot be read in strips.')
+                elif chunkType in (b'PLTE', b'tRNS'):
+                    self.__auxiliaryChunks.append(_pngChunk(chunkType, data))
+                elif chunkType == b'IEND':
+                    raise ValueError(f'"{path}" contains no image data.')
+        finally:
+            file.close()
+
+        self.__stride = self.width * PNG_CHANNELS[self.__colorType]
+
+    def __filteredRows(self):
+        # Inflates the IDAT stream incrementally and yields one filtered scanline (with its filter byte) at a time
+        rowLength = self.__stride + 1
+        decompressor = zlib.decompressobj()
+        pending = b''
+
+        file = open(self.__path, 'rb')
+        file.seek(self.__firstIdatOffset)
+        try:
+            while True:
+                length, chunkType = struct.unpack('>I4s', file.read(8))
+                if chunkType != b'IDAT':
+                    break
+
+                data = file.read(length)
+                file.read(4)
+
+                # Inflate a bounded amount at a time, a single IDAT chunk can expand to the whole image
+                while data:
+                    pending += decompressor.decompress(data, 16 * rowLength)
+                    data = decompressor.unconsumed_tail
+
+                    rows = len(pending) // rowLength
+                    for i in range(rows):
+                        yield pending[i * rowLength:(i + 1) * rowLength]
+                    pending = pending[rows * rowLength:]
+        finally:
+            file.close()
+
+        pending += decompressor.flush()
+        for i in range(len(pending) // rowLength):
+            yield pending[i * rowLength:(i + 1) * rowLength]
+
+    def __decodeStrip(self, previousRow: bytes, rows: [bytes]) -> Image.Image:
+        # PIL does the unfiltering: the strip is wrapped into a tiny PNG whose first row is the
+        # already unfiltered scanline above it, so Up/Average/Paeth filters resolve correctly
+        header = bytearray(self.__header)
+        header[4:8] = struct.pack('>I', len(rows) + (1 if previousRow is not None else 0))
+
+        raw = b''.join(rows)
+        if previousRow is not None:
+            raw = b'\x00' + previousRow + raw
+
+        data = (PNG_SIGNATURE
+                + _pngChunk(b'IHDR', bytes(header))
+                + b''.join(self.__auxiliaryChunks)
+                + _pngChunk(b'IDAT', zlib.compress(raw, 0))
+                + _pngChunk(b'IEND', b''))
+
+        image = Image.open(io.BytesIO(data))
+        image.load()
+
+        if previousRow is not None:
+            image = image.crop((0, 1, image.width, image.height))
+        return image
+
+    def strips(self, stripHeight: int = 64):
+        # Yields (y, image) for consecutive strips covering the whole image
+        previousRow = None
+        rows = []
+        y = 0
+
+        for row in self.__filteredRows():
+            rows.append(row)
+            if len(rows) == stripHeight:
+                strip = self.__decodeStrip(previousRow, rows)
+                previousRow = strip.crop((0, strip.height - 1, strip.width, strip.height)).tobytes()
+                yield (y, strip)
+                y += len(rows)
+                rows = []
+
+        if rows:
+            yield (y, self.__decodeStrip(previousRow, rows))
+
+
+class StreamingPngWriter:
+
+    def __init__(self, path: str, width: int, height: int, mode: str, compressLevel: int = 1):
+        colorTypes = {'L': 0, 'RGB': 2, 'RGBA': 6}
+        if mode not in colorTypes:
+            raise ValueError(f'Mode "{mode}" cannot be written as a streaming PNG.')
+
+        self.__file = open(path, 'wb')
+        self.__compressor = zlib.compressobj(compressLevel)
+        self.__buffer = b''
+
+        self.__file.write(PNG_SIGNATURE)
+        self.__file.write(_pngChunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, colorTypes[mode], 0, 0, 0)))
+
+    def __flush(self, minimumSize: int):
+        if len(self.__buffer) >= minimumSize:
+            self.__file.write(_pngChunk(b'IDAT', self.__buffer))
+            self.__buffer = b''
+
+    def writeStrip(self, image: Image.Image):
+        stride = len(image.mode) * image.width
+        pixels = image.tobytes()
+        raw = b''.join(b'\x00' + pixels[i:i + stride] for i in range(0, len(pixels), stride))
+
+        self.__buffer += self.__compressor.compress(raw)
+        self.__flush(256 * 1024)
+
+    def close(self):
+        self.__buffer += self.__compressor.flush()
+        self.__flush(1)
+        self.__file.write(_pngChunk(b'IEND', b''))
+        self.__file.close()
+
+
+class StreamingBmpWriter:
+
+    def __init__(self, path: str, width: int, height: int, mode: str = 'RGB'):
+        self.__padding = b'\x00' * ((4 - (width * 3) % 4) % 4)
+        imageSize = (width * 3 + len(self.__padding)) * height
+
+        self.__file = open(path, 'wb')
+        self.__file.write(struct.pack('<2sIHHI', b'BM', 54 + imageSize, 0, 0, 54))
+        # A negative height marks a top-down bitmap, so rows can be written in decoding order
+        self.__file.write(struct.pack('<IiiHHIIiiII', 40, width, -height, 1, 24, 0, imageSize, 2835, 2835, 0, 0))
+
+    def writeStrip(self, image: Image.Image):
+        stride = image.width * 3
+        pixels = image.convert('RGB').tobytes('raw', 'BGR')
+        if self.__padding:
+            pixels = b''.join(pixels[i:i + stride] + self.__padding for i in range(0, len(pixels), stride))
+        self.__file.write(pixels)
+
+    def close(self):
+        self.__file.close()
+
+
+def canComposeTiled(backgroundImagePath: str, outputFormat: OutputFormat) -> bool:
+    if outputFormat == OutputFormat.WebpLossless:
+        return False
+
+    try:
+        reader = PngStripReader(backgroundImagePath)
+    except (OSError, ValueError, struct.error):
+        return False
+
+    return reader.width * reader.height >= TILED_PIXEL_THRESHOLD
+
+
+class TiledPatchCompositor:
+
+    def __init__(self, backgroundImagePath: str, stripHeight: int = 64):
+        self.__backgroundImagePath = backgroundImagePath
+        self.__stripHeight = stripHeight
+
+    def composeToFile(self, patch: FlightPatch, path: str, outputFormat: OutputFormat = OutputFormat.Auto,
+                      registration=True, selCalCode=True, callsign=True, descriptions=True) -> str:
+        reader = PngStripReader(self.__backgroundImagePath)
+
+        # The strip reader only reads the PNG header up front and decodes the background strip by strip,
+        # the composer is only used for the layout and never opens the background
+        composer = FlightPatchComposer(self.__backgroundImagePath)
+        items = composer.layoutItems(patch, registration, selCalCode, callsign, descriptions)
+        patchTop, patchBottom = self._patchRows(patch, items)
+
+        if outputFormat == OutputFormat.Auto:
+            outputFormat = chooseOutputFormatForSize(reader.width, reader.height)
+        path = os.path.splitext(path)[0] + fileExtension(outputFormat)
+
+        writer = None
+        for y, strip in reader.strips(self.__stripHeight):
+            if strip.mode not in ('RGB', 'RGBA'):
+                strip = strip.convert('RGBA' if 'A' in strip.getbands() or 'transparency' in strip.info else 'RGB')
+
+            if writer is None:
+                writer = self._createWriter(path, reader.width, reader.height, strip.mode, outputFormat)
+
+            if y < patchBottom and patchTop < y + strip.height:
+                composer.drawItems(strip, items, (0, y), patch)
+
+            writer.writeStrip(strip)
+
+        writer.close()
+        return path
+
+    def _patchRows(self, patch: FlightPatch, items: [PatchItem]) -> (int, int):
+        _, top, _, bottom = patchExtent(patch, items)
+        return (top, bottom)
+
+    def _createWriter(self, path: str, width: int, height: int, mode: str, outputFormat: OutputFormat):
+        if outputFormat == OutputFormat.Bmp:
+            return StreamingBmpWriter(path, width, height, mode)
+        if outputFormat == OutputFormat.Png:
+            return StreamingPngWriter(path, width, height, mode, compressLevel=6)
+        if outputFormat == OutputFormat.FastPng:
+            return StreamingPngWriter(path, width, height, mode, compressLevel=1)
+        raise ValueError(f'Output format "{outputFormat.name}" cannot be written in strips.')
@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass()
+class Span:
+    name: str
+    depth: int
+    threadId: int
+    start: float
+    wallSeconds: float
+    cpuSeconds: float
+    # The process high-water mark when the span ended and how much the span raised it. The mark never drops,
+    # so memory a span allocates below an earlier peak shows up as no growth.
+    processPeakBytes: int
+    peakGrowthBytes: int
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan:
+
+    def __init__(self, tracer, name: str):
+        self.__tracer = tracer
+        self.__name = name
+
+    def __enter__(self):
+        self.__depth = self.__tracer._enter()
+        self.__peakStart = self.__tracer.peakResidentBytes()
+        self.__start = time.perf_counter()
+        self.__cpuStart = time.thread_time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        wallSeconds = time.perf_counter() - self.__start
+        cpuSeconds = time.thread_time() - self.__cpuStart
+        processPeakBytes = self.__tracer.peakResidentBytes()
+        self.__tracer._exit(Span(
+            name=self.__name,
+            depth=self.__depth,
+            threadId=threading.get_ident(),
+            start=self.__start,
+            wallSeconds=wallSeconds,
+            cpuSeconds=cpuSeconds,
+            processPeakBytes=processPeakBytes,
+            peakGrowthBytes=processPeakBytes - self.__peakStart
+        ))
+        return False
+
+
+class Tracer:
+
+    def __init__(self):
+        from memoryusage import peakResidentBytes
+
+        self.peakResidentBytes = peakResidentBytes
+        self.spans = []
+        self.__origin = time.perf_counter()
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def span(self, name: str) -> _ActiveSpan:
+        return _ActiveSpan(self, name)
+
+    def _enter(self) -> int:
+        depth = getattr(self.__local, 'depth', 0)
+        self.__local.depth = depth + 1
+        return depth
+
+    def _exit(self, span: Span):
+        self.__local.depth = span.depth
+        with self.__lock:
+            self.spans.append(span)
+
+    def summary(self) -> [str]:
+        # Spans with the same name are added up, listed in the order they were first started
+        totals = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            total = totals.setdefault(span.name, {'depth': span.depth, 'count': 0, 'wall': 0.0, 'cpu': 0.0,
+                                                  'growth': 0, 'peak': 0})
+            total['count'] += 1
+            total['wall'] += span.wallSeconds
+            total['cpu'] += span.cpuSeconds
+            total['growth'] += span.peakGrowthBytes
+            total['peak'] = max(total['peak'], span.processPeakBytes)
+
+        lines = [f'{"Stage":<32}{"Count":>7}{"Wall [ms]":>12}{"CPU [ms]":>11}{"Peak growth [MiB]":>19}'
+                 f'{"Process peak [MiB]":>20}']
+        for name, total in totals.items():
+            label = '  ' * total['depth'] + name
+            lines.append(f'{label:<32}{total["count"]:>7}{total["wall"] * 1000:>12.1f}'
+                         f'{total["cpu"] * 1000:>11.1f}{total["growth"] / 2 ** 20:>19.1f}'
+                         f'{total["peak"] / 2 ** 20:>20.1f}')
+        return lines
+
+    def writeChromeTrace(self, path: str):
+        # Trace event format, opens in chrome://tracing and Perfetto
+        events = [{
+            'name': span.name,
+            'ph': 'X',
+            'pid': os.getpid(),
+            'tid': span.threadId,
+            'ts': (span.start - self.__origin) * 1e6,
+            'dur': span.wallSeconds * 1e6,
+            'args': {
+                'cpuMs': span.cpuSeconds * 1000,
+                'peakGrowthMiB': span.peakGrowthBytes / 2 ** 20,
+                'processPeakMiB': span.processPeakBytes / 2 ** 20
+            }
+        } for span in self.spans]
+
+        file = open(path, 'w')
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        file.close()
+
+
+_tracer = None
+
+
+def enableTracing() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def span(name: str):
+    # Without enableTracing() this returns a shared context manager that does nothing
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name)
@@ -1,8 +1,13 @@
-import ctypes
 import json
-import winreg
+import os
 from dataclasses import dataclass, asdict
 
+from schema import Record, Value, ListOf, Nullable
+from tracing import span
+
+# Names of Windows' DESKTOP_WALLPAPER_POSITION values, in the order of their numbers
+WALLPAPER_POSITIONS = ['Center', 'Tile', 'Stretch', 'Fit', 'Fill', 'Span']
+
 
 @dataclass()
 class ThemeColor:
@@ -22,11 +27,7 @@ class ThemeColor:
         return ThemeColor(r=r, g=g, b=b)
 
     def fromJsonObject(jsonObject: dict):
-        return ThemeColor(
-            r=jsonObject['r'],
-            g=jsonObject['g'],
-            b=jsonObject['b']
-        )
+        return THEME_COLOR_SCHEMA.loadRoot(jsonObject)
 
 
 @dataclass
@@ -37,17 +38,21 @@ class Theme:
     explorerAccentColorMenu: ThemeColor
     wallpaper: str
 
+    # None keeps the position Windows currently uses, one of WALLPAPER_POSITIONS otherwise
+    wallpaperPosition: str = None
+
+    # Wallpapers by monitor number, replacing wallpaper on the monitors that have one
+    monitorWallpapers: [str] = None
+
+    def __post_init__(self):
+        if self.wallpaperPosition is not None and self.wallpaperPosition not in WALLPAPER_POSITIONS:
+            raise ValueError(f'Wallpaper position "{self.wallpaperPosition}" is expected to be one of {", ".join(WALLPAPER_POSITIONS)}.')
+
     def toJson(self, indent=4) -> str:
         return json.dumps(asdict(self), indent=indent)
 
     def fromJsonObject(jsonObject: dict):
-        return Theme(
-            dwmAccentColor=ThemeColor.fromJsonObject(jsonObject['dwmAccentColor']),
-            dwmAccentColorInactive=ThemeColor.fromJsonObject(jsonObject['dwmAccentColorInactive']),
-            explorerAccentColorMenu=ThemeColor.fromJsonObject(jsonObject['explorerAccentColorMenu']),
-            dwmColorPrevalence=jsonObject['dwmColorPrevalence'],
-            wallpaper=jsonObject['wallpaper']
-        )
+        return THEME_SCHEMA.loadRoot(jsonObject)
 
     def fromFile(path: str):
         file = open(path)
@@ -62,10 +67,260 @@ class Theme:
         file.close()
 
 
+class ThemeBackend:
+    # Registry and wallpaper access used by WindowsThemeInterface. Each call to readValues/writeValues
+    # stands for one opened registry subkey.
+
+    def readValues(self, subkey: str, valueNames: [str]) -> dict:
+        # Values that do not exist are left out, the same as all of them for a subkey that does not exist
+        raise NotImplementedError()
+
+    def writeValues(self, subkey: str, values: dict):
+        # Creates the subkey if needed
+        raise NotImplementedError()
+
+    def getWallpaper(self) -> (int, str):
+        raise NotImplementedError()
+
+    def setWallpaper(self, absolutePath: str) -> int:
+        raise NotImplementedError()
+
+    def getWallpaperPosition(self) -> str:
+        raise NotImplementedError()
+
+    def setWallpaperPosition(self, position: str):
+        raise NotImplementedError()
+
+    def getMonitorWallpapers(self) -> [str]:
+        raise NotImplementedError()
+
+    def setMonitorWallpapers(self, absolutePaths: [str]):
+        # absolutePaths[i] goes to monitor i, monitors without a path or None keep their wallpaper
+        raise NotImplementedError()
+
+
+class _DesktopWallpaper:
+    # The shell's IDesktopWallpaper COM interface through ctypes, the only API setting wallpapers per monitor
+
+    CLSID = '{C2CF3110-460E-4FC1-B9D0-8A1C0C9CC4BD}'
+    IID = '{B92B56A9-8B55-4E14-9A89-0199BBB6F93B}'
+    CLSCTX_ALL = 0x17
+
+    # Method slots in the interface's vtable, after IUnknown's QueryInterface, AddRef and Release
+    SET_WALLPAPER = 3
+    GET_WALLPAPER = 4
+    GET_MONITOR_DEVICE_PATH_AT = 5
+    GET_MONITOR_DEVICE_PATH_COUNT = 6
+    SET_POSITION = 10
+    GET_POSITION = 11
+
+    def __init__(self):
+        import ctypes
+
+        class Guid(ctypes.Structure):
+            _fields_ = [('data1', ctypes.c_ulong), ('data2', ctypes.c_ushort), ('data3', ctypes.c_ushort), ('data4', ctypes.c_ubyte * 8)]
+
+        self.__ctypes = ctypes
+        self.__ole32 = ctypes.oledll.ole32
+
+        try:
+            self.__ole32.CoInitialize(None)
+        except OSError:
+            # COM is already initialized on this thread in another apartment model, which works as well
+            pass
+
+        clsid = Guid()
+        iid = Guid()
+        self.__ole32.CLSIDFromString(self.CLSID, ctypes.byref(clsid))
+        self.__ole32.IIDFromString(self.IID, ctypes.byref(iid))
+
+        self.__pointer = ctypes.c_void_p()
+        self.__ole32.CoCreateInstance(ctypes.byref(clsid), None, self.CLSCTX_ALL, ctypes.byref(iid), ctypes.byref(self.__pointer))
+
+    def __call(self, slot: int, argumentTypes: list, *arguments):
+        # A failing HRESULT is raised as OSError by ctypes
+        ctypes = self.__ctypes
+        vtable = ctypes.cast(self.__pointer, ctypes.POINTER(ctypes.POINTER(ctypes.c_void_p))).contents
+        method = ctypes.WINFUNCTYPE(ctypes.HRESULT, ctypes.c_void_p, *argumentTypes)(vtable[slot])
+        method(self.__pointer, *arguments)
+
+    def __takeString(self, pointer) -> str:
+        value = self.__ctypes.wstring_at(pointer.value)
+        self.__ctypes.windll.ole32.CoTaskMemFree(pointer)
+        return value
+
+    def monitorIds(self) -> [str]:
+        ctypes = self.__ctypes
+        count = ctypes.c_uint()
+        self.__call(self.GET_MONITOR_DEVICE_PATH_COUNT, [ctypes.POINTER(ctypes.c_uint)], ctypes.byref(count))
+
+        monitorIds = []
+        for i in range(count.value):
+            pointer = ctypes.c_void_p()
+            self.__call(self.GET_MONITOR_DEVICE_PATH_AT, [ctypes.c_uint, ctypes.POINTER(ctypes.c_void_p)], i, ctypes.byref(pointer))
+            monitorIds.append(self.__takeString(pointer))
+        return monitorIds
+
+    def getWallpaper(self, monitorId: str) -> str:
+        ctypes = self.__ctypes
+        pointer = ctypes.c_void_p()
+        self.__call(self.GET_WALLPAPER, [ctypes.c_wchar_p, ctypes.POINTER(ctypes.c_void_p)], monitorId, ctypes.byref(pointer))
+        return self.__takeString(pointer)
+
+    def setWallpaper(self, monitorId: str, absolutePath: str):
+        ctypes = self.__ctypes
+        self.__call(self.SET_WALLPAPER, [ctypes.c_wchar_p, ctypes.c_wchar_p], monitorId, absolutePath)
+
+    def getPosition(self) -> int:
+        ctypes = self.__ctypes
+        position = ctypes.c_int()
+        self.__call(self.GET_POSITION, [ctypes.POINTER(ctypes.c_int)], ctypes.byref(position))
+        return position.value
+
+    def setPosition(self, position: int):
+        self.__call(self.SET_POSITION, [self.__ctypes.c_int], position)
+
+
+class WindowsRegistryBackend(ThemeBackend):
+
+    def __init__(self, rootHkey=None):
+        import winreg
+
+        self.__winreg = winreg
+        self.__registryHkey = rootHkey if rootHkey is not None else winreg.HKEY_CURRENT_USER
+        self.__desktopWallpaperInterface = None
+
+    def readValues(self, subkey: str, valueNames: [str]) -> dict:
+        try:
+            keyh = self.__winreg.OpenKey(self.__registryHkey, subkey)
+        except FileNotFoundError:
+            return {}
+
+        try:
+            values = {}
+            for valueName in valueNames:
+                try:
+                    values[valueName] = self.__winreg.QueryValueEx(keyh, valueName)[0]
+                except FileNotFoundError:
+                    pass
+            return values
+        finally:
+            keyh.Close()
+
+    def writeValues(self, subkey: str, values: dict):
+        keyh = self.__winreg.CreateKeyEx(self.__registryHkey, subkey, 0, self.__winreg.KEY_SET_VALUE)
+        try:
+            for valueName, value in values.items():
+                self.__winreg.SetValueEx(keyh, valueName, 0, self.__winreg.REG_DWORD, value)
+        finally:
+            keyh.Close()
+
+    def getWallpaper(self) -> (int, str):
+        import ctypes
+
+        SPI_GETDESKWALLPAPER = 0x0073
+        bufferSize = 260
+        buffer = ctypes.create_unicode_buffer(bufferSize)
+
+        success = ctypes.windll.user32.SystemParametersInfoW(
+            SPI_GETDESKWALLPAPER,
+            bufferSize,
+            buffer,
+            0
+        )
+        return success, str(buffer.value)
+
+    def setWallpaper(self, absolutePath: str) -> int:
+        import ctypes
+
+        SPI_SETDESKWALLPAPER = 0x0014
+        success = ctypes.windll.user32.SystemParametersInfoW(
+            SPI_SETDESKWALLPAPER,
+            0,
+            absolutePath,
+            0
+        )
+        return success
+
+    def __desktopWallpaper(self) -> _DesktopWallpaper:
+        # Created on first use, so only commands reading or changing the wallpaper position or per monitor
+        # wallpapers initialize COM. currentTheme() does both, on every setup.
+        if self.__desktopWallpaperInterface is None:
+            self.__desktopWallpaperInterface = _DesktopWallpaper()
+        return self.__desktopWallpaperInterface
+
+    def getWallpaperPosition(self) -> str:
+        try:
+            return WALLPAPER_POSITIONS[self.__desktopWallpaper().getPosition()]
+        except (OSError, IndexError):
+            return None
+
+    def setWallpaperPosition(self, position: str):
+        self.__desktopWallpaper().setPosition(WALLPAPER_POSITIONS.index(position))
+
+    def getMonitorWallpapers(self) -> [str]:
+        desktopWallpaper = self.__desktopWallpaper()
+        return [desktopWallpaper.getWallpaper(monitorId) for monitorId in desktopWallpaper.monitorIds()]
+
+    def setMonitorWallpapers(self, absolutePaths: [str]):
+        desktopWallpaper = self.__desktopWallpaper()
+        for monitorId, absolutePath in zip(desktopWallpaper.monitorIds(), absolutePaths):
+            if absolutePath is not None:
+                desktopWallpaper.setWallpaper(monitorId, absolutePath)
+
+
+class InMemoryThemeBackend(ThemeBackend):
+
+    def __init__(self, values: dict = None, wallpaper: str = '', monitors: int = 1):
+        # values: {subkey: {valueName: int}}
+        self.values = {subkey: dict(subkeyValues) for subkey, subkeyValues in (values or {}).items()}
+        self.wallpaper = wallpaper
+        self.wallpaperPosition = 'Fill'
+        self.monitorWallpapers = [wallpaper] * monitors
+
+        self.keyOpens = 0
+        self.valueWrites = 0
+        self.wallpaperCalls = 0
+
+    def readValues(self, subkey: str, valueNames: [str]) -> dict:
+        self.keyOpens += 1
+        subkeyValues = self.values.get(subkey, {})
+        return {valueName: subkeyValues[valueName] for valueName in valueNames if valueName in subkeyValues}
+
+    def writeValues(self, subkey: str, values: dict):
+        self.keyOpens += 1
+        self.valueWrites += len(values)
+        self.values.setdefault(subkey, {}).update(values)
+
+    def getWallpaper(self) -> (int, str):
+        return 1, self.wallpaper
+
+    def setWallpaper(self, absolutePath: str) -> int:
+        self.wallpaperCalls += 1
+        self.wallpaper = absolutePath
+        self.monitorWallpapers = [absolutePath] * len(self.monitorWallpapers)
+        return 1
+
+    def getWallpaperPosition(self) -> str:
+        return self.wallpaperPosition
+
+    def setWallpaperPosition(self, position: str):
+        self.wallpaperPosition = position
+
+    def getMonitorWallpapers(self) -> [str]:
+        return list(self.monitorWallpapers)
+
+    def setMonitorWallpapers(self, absolutePaths: [str]):
+        self.wallpaperCalls += 1
+        for i, absolutePath in enumerate(absolutePaths[:len(self.monitorWallpapers)]):
+            if absolutePath is not None:
+                self.monitorWallpapers[i] = absolutePath
+
+
 class WindowsThemeInterface:
 
-    def __init__(self, rootHkey=winreg.HKEY_CURRENT_USER):
-        self.__registryHkey = rootHkey
+    def __init__(self, rootHkey=None, backend: ThemeBackend = None):
+        self.__backend = backend if backend is not None else WindowsRegistryBackend(rootHkey)
         self.__DwmRegistrySubkey = 'SOFTWARE\Microsoft\Windows\DWM'
         self.__WindowsExplorerAccentRegistrySubkey = 'SOFTWARE\Microsoft\Windows\CurrentVersion\Explorer\Accent'
 
@@ -75,36 +330,120 @@ class WindowsThemeInterface:
 
         self.__explorerAccentColorMenuValue = 'AccentColorMenu'
 
-    def __getRegistryIntValue(self, hSubKey: str, valueName: str) -> (int, int):
-        keyh = winreg.OpenKey(self.__registryHkey, hSubKey)
-        value, type = winreg.QueryValueEx(keyh, valueName)
-        keyh.Close()
-        return (value, type)
+        # What Windows uses for values that were never written, the default blue accent without colored title bars
+        self.__registryDefaults = {
+            self.__dwmAccentColorValue: 0xffd77800,
+            self.__dwmAccentColorInactiveValue: 0xffd77800,
+            self.__dwmColorPrevalenceValue: 0,
+            self.__explorerAccentColorMenuValue: 0xffd77800
+        }
 
-    def __setRegistryIntValue(self, hSubKey: str, valueName: str, value: int):
-        keyh = winreg.OpenKey(self.__registryHkey, hSubKey, access=winreg.KEY_SET_VALUE)
-        winreg.SetValueEx(keyh, valueName, 0, winreg.REG_DWORD, value)
-        keyh.Close()
+    def __readValues(self, hSubKey: str, valueNames: [str]) -> dict:
+        values = self.__backend.readValues(hSubKey, valueNames)
+        return {valueName: values.get(valueName, self.__registryDefaults[valueName]) for valueName in valueNames}
+
+    def __getRegistryIntValue(self, hSubKey: str, valueName: str) -> int:
+        return self.__readValues(hSubKey, [valueName])[valueName]
 
-    def loadTheme(self, theme: Theme):
-        self.setDwmAccentColor(theme.dwmAccentColor)
-        self.setDwmAccentColorInactive(theme.dwmAccentColorInactive)
-        self.setDwmColorPrevalence(theme.dwmColorPrevalence)
-        self.setExplorerAccentColor(theme.explorerAccentColorMenu)
-        self.setWallpaper(theme.wallpaper)
+    def __setRegistryIntValue(self, hSubKey: str, valueName: str, value: int):
+        self.__backend.writeValues(hSubKey, {valueName: value})
+
+    def __themeRegistryValues(self, theme: Theme) -> dict:
+        return {
+            self.__DwmRegistrySubkey: {
+                self.__dwmAccentColorValue: theme.dwmAccentColor.toRegDword(),
+                self.__dwmAccentColorInactiveValue: theme.dwmAccentColorInactive.toRegDword(),
+                self.__dwmColorPrevalenceValue: int(theme.dwmColorPrevalence)
+            },
+            self.__WindowsExplorerAccentRegistrySubkey: {
+                self.__explorerAccentColorMenuValue: theme.explorerAccentColorMenu.toRegDword()
+            }
+        }
+
+    def __currentRegistryValues(self) -> dict:
+        # One key open per subkey for all of its values
+        valueNames = {
+            self.__DwmRegistrySubkey: [
+                self.__dwmAccentColorValue,
+                self.__dwmAccentColorInactiveValue,
+                self.__dwmColorPrevalenceValue
+            ],
+            self.__WindowsExplorerAccentRegistrySubkey: [
+                self.__explorerAccentColorMenuValue
+            ]
+        }
+        return {subkey: self.__readValues(subkey, names) for subkey, names in valueNames.items()}
+
+    def themeChanges(self, theme: Theme) -> dict:
+        # Registry values that differ from the target theme, grouped by subkey
+        current = self.__currentRegistryValues()
+        changes = {}
+
+        for subkey, values in self.__themeRegistryValues(theme).items():
+            changed = {valueName: value for valueName, value in values.items() if current[subkey][valueName] != value}
+            if changed:
+                changes[subkey] = changed
+
+        return changes
+
+    def loadTheme(self, theme: Theme, refreshWallpaper=False):
+        # refreshWallpaper re-applies the wallpaper even if its path is unchanged, e.g. after re-rendering it
+        with span('registry writes'):
+            for subkey, values in self.themeChanges(theme).items():
+                self.__backend.writeValues(subkey, values)
+
+        if theme.wallpaperPosition is not None and theme.wallpaperPosition != self.getWallpaperPosition():
+            with span('wallpaper position'):
+                self.setWallpaperPosition(theme.wallpaperPosition)
+
+        if theme.monitorWallpapers:
+            if refreshWallpaper or self.__monitorWallpapersChanged(theme.monitorWallpapers):
+                with span('wallpaper switch'):
+                    self.setMonitorWallpapers(theme.monitorWallpapers)
+            return
+
+        _, currentWallpaper = self.getWallpaper()
+        if refreshWallpaper or os.path.normcase(currentWallpaper) != os.path.normcase(theme.wallpaper):
+            with span('wallpaper switch'):
+                self.setWallpaper(theme.wallpaper)
+
+    def __monitorWallpapersChanged(self, monitorWallpapers: [str]) -> bool:
+        current = self.getMonitorWallpapers()
+        for i, absolutePath in enumerate(monitorWallpapers):
+            if absolutePath is not None and (i >= len(current) or os.path.normcase(current[i]) != os.path.normcase(absolutePath)):
+                return True
+        return False
 
     def currentTheme(self) -> Theme:
+        current = self.__currentRegistryValues()
+        dwmValues = current[self.__DwmRegistrySubkey]
+        explorerValues = current[self.__WindowsExplorerAccentRegistrySubkey]
+        wallpaper = self.getWallpaper()[1]
+
         return Theme(
-            dwmAccentColor=self.getDwmAccentColor(),
-            dwmAccentColorInactive=self.getDwmAccentColorInactive(),
-            dwmColorPrevalence=self.getDwmColorPrevalence(),
-            explorerAccentColorMenu=self.getExplorerAccentColor(),
-            wallpaper=self.getWallpaper()[1]
+            dwmAccentColor=ThemeColor.fromRegDword(dwmValues[self.__dwmAccentColorValue]),
+            dwmAccentColorInactive=ThemeColor.fromRegDword(dwmValues[self.__dwmAccentColorInactiveValue]),
+            dwmColorPrevalence=bool(dwmValues[self.__dwmColorPrevalenceValue]),
+            explorerAccentColorMenu=ThemeColor.fromRegDword(explorerValues[self.__explorerAccentColorMenuValue]),
+            wallpaper=wallpaper,
+            wallpaperPosition=self.getWallpaperPosition(),
+            monitorWallpapers=self.__currentMonitorWallpapers(wallpaper)
         )
 
+    def __currentMonitorWallpapers(self, wallpaper: str) -> [str]:
+        # None while every monitor shows wallpaper, restoring that one is enough then
+        try:
+            monitorWallpapers = self.getMonitorWallpapers()
+        except OSError:
+            return None
+
+        if all(os.path.normcase(path) == os.path.normcase(wallpaper) for path in monitorWallpapers):
+            return None
+        return monitorWallpapers
+
     # Accent Color
     def getDwmAccentColor(self) -> ThemeColor:
-        result, _ = self.__getRegistryIntValue(self.__DwmRegistrySubkey, self.__dwmAccentColorValue)
+        result = self.__getRegistryIntValue(self.__DwmRegistrySubkey, self.__dwmAccentColorValue)
         return ThemeColor.fromRegDword(result)
 
     def setDwmAccentColor(self, value: ThemeColor):
@@ -113,7 +452,7 @@ class WindowsThemeInterface:
 
     # Accent Color Inactive
     def getDwmAccentColorInactive(self) -> ThemeColor:
-        result, _ = self.__getRegistryIntValue(self.__DwmRegistrySubkey, self.__dwmAccentColorInactiveValue)
+        result = self.__getRegistryIntValue(self.__DwmRegistrySubkey, self.__dwmAccentColorInactiveValue)
         return ThemeColor.fromRegDword(result)
 
     def setDwmAccentColorInactive(self, value: ThemeColor):
@@ -122,7 +461,7 @@ class WindowsThemeInterface:
 
     # Color Prevalence
     def getDwmColorPrevalence(self) -> bool:
-        result, _ = self.__getRegistryIntValue(self.__DwmRegistrySubkey, self.__dwmColorPrevalenceValue)
+        result = self.__getRegistryIntValue(self.__DwmRegistrySubkey, self.__dwmColorPrevalenceValue)
         return bool(result)
 
     def setDwmColorPrevalence(self, value: bool):
@@ -130,7 +469,7 @@ class WindowsThemeInterface:
 
     # Accent Color Menu
     def getExplorerAccentColor(self) -> ThemeColor:
-        result, _ = self.__getRegistryIntValue(self.__WindowsExplorerAccentRegistrySubkey, self.__explorerAccentColorMenuValue)
+        result = self.__getRegistryIntValue(self.__WindowsExplorerAccentRegistrySubkey, self.__explorerAccentColorMenuValue)
         return ThemeColor.fromRegDword(result)
 
     def setExplorerAccentColor(self, value: ThemeColor):
@@ -139,24 +478,37 @@ class WindowsThemeInterface:
 
     # Wallpaper
     def getWallpaper(self) -> (int, str):
-        SPI_GETDESKWALLPAPER = 0x0073
-        bufferSize = 200
-        buffer = ctypes.create_unicode_buffer(bufferSize)
-
-        success = ctypes.windll.user32.SystemParametersInfoW(
-            SPI_GETDESKWALLPAPER,
-            bufferSize,
-            buffer,
-            0
-        )
-        return success, str(buffer.value)
+        return self.__backend.getWallpaper()
 
     def setWallpaper(self, absolutePath: str) -> int:
-        SPI_SETDESKWALLPAPER = 0x0014
-        success = ctypes.windll.user32.SystemParametersInfoW(
-            SPI_SETDESKWALLPAPER,
-            0,
-            absolutePath,
-            0
-        )
-        return success
+        return self.__backend.setWallpaper(absolutePath)
+
+    def getWallpaperPosition(self) -> str:
+        return self.__backend.getWallpaperPosition()
+
+    def setWallpaperPosition(self, position: str):
+        self.__backend.setWallpaperPosition(position)
+
+    def getMonitorWallpapers(self) -> [str]:
+        return self.__backend.getMonitorWallpapers()
+
+    def setMonitorWallpapers(self, absolutePaths: [str]):
+        self.__backend.setMonitorWallpapers(absolutePaths)
+
+
+THEME_COLOR_SCHEMA = Record(ThemeColor, {
+    'r': Value(int),
+    'g': Value(int),
+    'b': Value(int)
+})
+
+THEME_SCHEMA = Record(Theme, {
+    'dwmAccentColor': THEME_COLOR_SCHEMA,
+    'dwmAccentColorInactive': THEME_COLOR_SCHEMA,
+    'dwmColorPrevalence': Value(bool),
+    'explorerAccentColorMenu': THEME_COLOR_SCHEMA,
+    'wallpaper': Value(str)
+}, optional={
+    'wallpaperPosition': (Value(str, type(None)), None),
+    'monitorWallpapers': (Nullable(ListOf(Value(str, type(None)))), None)
+})